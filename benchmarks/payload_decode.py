@@ -0,0 +1,152 @@
+"""
+Times the request path of the skeletons on signed payloads of growing size, built
+from example_payload.json, against the previous path which parsed the payload,
+then verified it with stripe.Webhook.construct_event and parsed it again.
+
+    python benchmarks/payload_decode.py --sizes 7 100 1000
+"""
+
+import argparse
+import copy
+import importlib
+import json
+import sys
+import time
+import timeit
+import types
+from pathlib import Path
+
+import stripe
+from rich import print
+from rich.table import Table
+
+ROOT = Path(__file__).resolve().parent.parent
+SKELETONS = ROOT / "codehook" / "skeletons"
+SECRET = "whsec_benchmark"
+
+
+def make_payload(size_kb: int) -> str:
+    """
+    Grows the subscription in example_payload.json with items until the payload
+    reaches SIZE_KB kilobytes.
+    """
+    event = json.loads((SKELETONS / "stripe" / "example_payload.json").read_text())
+    items = event["data"]["object"]["items"]["data"]
+    item = items[0]
+    while len(json.dumps(event)) < size_kb * 1024:
+        items.append(copy.deepcopy(item))
+    return json.dumps(event)
+
+
+def sign(payload: str, secret=SECRET) -> str:
+    timestamp = int(time.time())
+    signature = stripe.WebhookSignature._compute_signature(
+        f"{timestamp}.{payload}", secret
+    )
+    return f"t={timestamp},v1={signature}"
+
+
+def load_skeleton(skeleton: str, json_backend: str):
+    """
+    Imports the lambda_handler_rest module of a skeleton, with a handler that does
+    nothing, no deduplication and the JSON backend of choice.
+    """
+    for module in ["handler", "lambda_handler_rest", "request_log", "stripe_signature"]:
+        sys.modules.pop(module, None)
+    handler = types.ModuleType("handler")
+    handler.handler_logic = lambda body: (200, "ok")
+    sys.modules["handler"] = handler
+    sys.path[:0] = [str(SKELETONS / skeleton), str(SKELETONS / "common")]
+    try:
+        module = importlib.import_module("lambda_handler_rest")
+    finally:
+        del sys.path[:2]
+    module.endpoint_secret = SECRET
+    module.request_log.sample_rate = 0
+    # The same request is sent over and over, so deduplication would answer it from
+    # its cache without constructing the event after the first call
+    module.idempotency = types.SimpleNamespace(
+        lookup=lambda event: None, remember=lambda event, response: None
+    )
+    # Silence the rejected requests
+    module.print = lambda *args: None
+    if json_backend == "json":
+        module.loads = json.loads
+    return module
+
+
+def previous_path(payload: str, header: str):
+    """
+    The request path before verifying on the raw payload: parse, verify, parse again
+    """
+    json.loads(payload)
+    return stripe.Webhook.construct_event(payload, header, SECRET)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[7, 100, 1000], help="Sizes in KB"
+    )
+    parser.add_argument("--number", type=int, default=20, help="Calls per timing")
+    args = parser.parse_args()
+
+    backends = ["json"]
+    try:
+        import orjson  # noqa: F401
+
+        backends.append("orjson")
+    except ImportError:
+        print("orjson is not installed, skipping it")
+
+    table = Table(title="Request path, microseconds per call")
+    table.add_column("Path", style="blue")
+    table.add_column("Payload", justify="right")
+    table.add_column("Signed", justify="right")
+    table.add_column("Forged", justify="right")
+
+    payloads = {size: make_payload(size) for size in args.sizes}
+
+    def time_call(func) -> str:
+        seconds = min(timeit.repeat(func, number=args.number, repeat=3))
+        return f"{seconds / args.number * 1e6:.0f}"
+
+    for size, payload in payloads.items():
+        header, forged = sign(payload), sign(payload, "whsec_other")
+
+        def rejected(payload=payload, forged=forged):
+            try:
+                previous_path(payload, forged)
+            except stripe.error.SignatureVerificationError:
+                pass
+
+        table.add_row(
+            "previous (stripe)",
+            f"{size} KB",
+            time_call(
+                lambda payload=payload, header=header: previous_path(payload, header)
+            ),
+            time_call(rejected),
+        )
+
+    for skeleton in ["stripe", "stripe_lean"]:
+        for backend in backends:
+            module = load_skeleton(skeleton, backend)
+            for size, payload in payloads.items():
+                timings = []
+                for header in [sign(payload), sign(payload, "whsec_other")]:
+                    request = {"headers": {"stripe-signature": header}, "body": payload}
+                    timings.append(
+                        time_call(
+                            lambda module=module, request=request: module.lambda_handler(
+                                request, None
+                            )
+                        )
+                    )
+                table.add_row(f"{skeleton} ({backend})", f"{size} KB", *timings)
+
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Compares the cold start of the skeletons: how long it takes to import the Lambda
+entry point in a fresh interpreter, and how big the code and dependencies are.
+
+    python benchmarks/skeleton_coldstart.py --runs 20
+
+The dependencies are installed with pip, so this needs network access.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+
+from rich import print
+from rich.table import Table
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from codehook.aws import Lambda  # noqa: E402
+from codehook.cache import format_size  # noqa: E402
+
+SKELETONS = ["stripe", "stripe_lean"]
+IMPORT = (
+    "import time; started = time.perf_counter(); import lambda_handler_rest; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def zipped_size(path: Path) -> int:
+    with tempfile.TemporaryFile() as file:
+        with zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as zipped:
+            for source_file in sorted(path.rglob("*")):
+                zipped.write(source_file, arcname=source_file.relative_to(path))
+        return file.tell()
+
+
+def build(skeleton: str, handler: Path, path: Path):
+    """
+    Lays out a skeleton like Lambda does: the code in one directory, and the
+    dependencies from the layer in another.
+    """
+    code, dependencies = path / "code", path / "dependencies"
+    for files in ["common", skeleton]:
+        shutil.copytree(
+            ROOT / "codehook" / "skeletons" / files,
+            code,
+            ignore=shutil.ignore_patterns("__pycache__"),
+            dirs_exist_ok=True,
+        )
+    shutil.copy(handler, code / "handler.py")
+    dependencies.mkdir()
+    requirements = code / "requirements.txt"
+    if Lambda.has_requirements(requirements):
+        subprocess.run(
+            [sys.executable, "-m", "pip", "install", "--quiet"]
+            + ["--target", str(dependencies), "-r", str(requirements)],
+            check=True,
+        )
+    return code, dependencies
+
+
+def measure_init(code: Path, dependencies: Path, runs: int) -> list[float]:
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([str(code), str(dependencies)]),
+        # /var/task is read only, so Lambda can't cache the bytecode of the code
+        "PYTHONDONTWRITEBYTECODE": "1",
+        "ENDPOINT_SECRET": "whsec_benchmark",
+    }
+    durations = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT],
+            cwd=code,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        durations.append(float(result.stdout.strip().splitlines()[-1]))
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=10, help="Cold starts per skeleton")
+    parser.add_argument(
+        "--handler", type=Path, default=ROOT / "tests" / "echo.py", help="Handler file"
+    )
+    args = parser.parse_args()
+
+    table = Table(title=f"Skeleton cold start ({args.runs} runs)")
+    table.add_column("Skeleton", style="blue")
+    table.add_column("Init p50", justify="right")
+    table.add_column("Init min", justify="right")
+    table.add_column("Code", justify="right")
+    table.add_column("Dependencies", justify="right")
+    for skeleton in SKELETONS:
+        with tempfile.TemporaryDirectory() as path:
+            code, dependencies = build(skeleton, args.handler, Path(path))
+            durations = measure_init(code, dependencies, args.runs)
+            table.add_row(
+                skeleton,
+                f"{statistics.median(durations) * 1000:.1f} ms",
+                f"{min(durations) * 1000:.1f} ms",
+                format_size(zipped_size(code)),
+                format_size(zipped_size(dependencies)),
+            )
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
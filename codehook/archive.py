@@ -0,0 +1,160 @@
+"""
+Builds the zip archives of deployment packages and layers.
+
+Entries are written in sorted order with fixed timestamps and permissions, so the same
+files always give a byte-identical archive, and the hash of a package only changes
+when its files do. Files are streamed into a temporary file as they are compressed,
+rather than held in memory next to the archive.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+
+from .cache import IGNORED_NAMES, IGNORED_SUFFIXES
+
+# The earliest date a zip entry can have
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+FILE_MODE = 0o644
+EXECUTABLE_MODE = 0o755
+DEFAULT_COMPRESSION_LEVEL = 6
+
+
+def compression_level(level: int = None) -> int:
+    """
+    :param level: The zlib compression level from 0, to store files, to 9.
+    :return: The level, or $CODEHOOK_COMPRESSION_LEVEL, or the default of 6.
+    """
+    if level is None:
+        level = int(os.getenv("CODEHOOK_COMPRESSION_LEVEL", DEFAULT_COMPRESSION_LEVEL))
+    if not 0 <= level <= 9:
+        raise ValueError(f"Compression level {level} is not between 0 and 9")
+    return level
+
+
+def tree_entries(root, prefix: str = "") -> dict[str, Path]:
+    """
+    Lists the files under a directory, at any depth, leaving out the ones produced by
+    running the code locally, e.g. __pycache__.
+
+    :param root: The directory to list.
+    :param prefix: The directory of the files in the archive, e.g. python/ for layers.
+    :return: The path of each file by its name in the archive.
+    """
+    root = Path(root)
+    entries = {}
+    for directory, directories, files in os.walk(root):
+        directories[:] = [name for name in directories if name not in IGNORED_NAMES]
+        for name in files:
+            path = Path(directory) / name
+            if name in IGNORED_NAMES or path.suffix in IGNORED_SUFFIXES:
+                continue
+            entries[prefix + path.relative_to(root).as_posix()] = path
+    return entries
+
+
+def entry_info(name: str, mode: int, level: int) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, ZIP_DATE)
+    info.external_attr = (0o100000 | mode) << 16
+    info.create_system = 3  # Unix, so the permissions are read back
+    info.compress_type = zipfile.ZIP_DEFLATED if level else zipfile.ZIP_STORED
+    # ZipFile.open doesn't take a level, it reads the private one of the entry
+    info._compresslevel = level
+    return info
+
+
+def write_entry(zipped: zipfile.ZipFile, name: str, content, level: int):
+    """
+    Writes a file to an archive with a fixed timestamp and permissions.
+
+    :param zipped: The archive, open for writing or appending.
+    :param name: The name of the file in the archive.
+    :param content: The path of the file to stream, or its content as bytes.
+    :param level: The compression level.
+    """
+    if isinstance(content, bytes):
+        zipped.writestr(entry_info(name, FILE_MODE, level), content)
+        return
+    stat = os.stat(content)
+    mode = EXECUTABLE_MODE if stat.st_mode & 0o111 else FILE_MODE
+    info = entry_info(name, mode, level)
+    # Lets ZipFile pick ZIP64 up front for files that need it
+    info.file_size = stat.st_size
+    with open(content, "rb") as source, zipped.open(info, "w") as destination:
+        shutil.copyfileobj(source, destination, 1024 * 1024)
+
+
+def build_archive(entries: dict, level: int = None) -> bytes:
+    """
+    Builds a deterministic zip archive.
+
+    :param entries: The content of each file by its name in the archive, either the
+                    path of a file or bytes.
+    :param level: The compression level, see compression_level.
+    :return: The archive.
+    """
+    level = compression_level(level)
+    with tempfile.TemporaryFile() as file:
+        with zipfile.ZipFile(file, "w") as zipped:
+            for name in sorted(entries):
+                write_entry(zipped, name, entries[name], level)
+        file.seek(0)
+        return file.read()
+
+
+def build_tree_archive(*roots, level: int = None) -> bytes:
+    """
+    Builds a deterministic zip archive of the files in one or more directories. Files
+    of the first directories win over files with the same name in the next ones.
+
+    :param roots: The directories, or (directory, prefix) pairs to put their files
+                  under a directory in the archive.
+    :param level: The compression level, see compression_level.
+    :return: The archive.
+    """
+    entries = {}
+    for root in roots:
+        root, prefix = root if isinstance(root, tuple) else (root, "")
+        for name, path in tree_entries(root, prefix).items():
+            entries.setdefault(name, path)
+    return build_archive(entries, level)
+
+
+def append_archive(base: bytes, entries: dict, level: int = None) -> bytes:
+    """
+    Adds files to a copy of an archive. Entries of the archive with the same name as
+    a new file are replaced, which rewrites the archive; otherwise the files are just
+    appended after the existing entries, which are copied as they are.
+
+    :param base: The archive to start from.
+    :param entries: The content of each file to add by its name in the archive,
+                    either the path of a file or bytes.
+    :param level: The compression level of the added files, see compression_level.
+    :return: The new archive.
+    """
+    level = compression_level(level)
+    with tempfile.TemporaryFile() as file:
+        with zipfile.ZipFile(io.BytesIO(base)) as source:
+            replaced = set(entries).intersection(source.namelist())
+            if replaced:
+                with zipfile.ZipFile(file, "w") as zipped:
+                    for name in sorted({*source.namelist(), *entries}):
+                        if name in entries:
+                            write_entry(zipped, name, entries[name], level)
+                            continue
+                        info = source.getinfo(name)
+                        mode = (info.external_attr >> 16) & 0o777 or FILE_MODE
+                        zipped.writestr(
+                            entry_info(name, mode, level), source.read(info)
+                        )
+        if not replaced:
+            file.write(base)
+            file.seek(0)
+            with zipfile.ZipFile(file, "a") as zipped:
+                for name in sorted(entries):
+                    write_entry(zipped, name, entries[name], level)
+        file.seek(0)
+        return file.read()
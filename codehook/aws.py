@@ -1,55 +1,206 @@
-import io
+import hashlib
 import json
 import os
 import pathlib
+import tempfile
+import threading
 import time
-import zipfile
-from pathlib import Path
 
 import boto3
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 from rich import print
 
-from .model import Cloud
+from . import archive, tracing
+from .bundle import Bundle, build_package
+from .cache import BuildCache, code_sha256
+from .model import LOG_SETTINGS, Cloud
+from .slim import SlimPolicy
+from .throttle import Throttle
+from .wheelhouse import Wheelhouse
+
+LAMBDA_RUNTIME = "python3.11"
+# x86_64 or arm64, which the dependencies are built for too
+LAMBDA_ARCHITECTURE = os.getenv("CODEHOOK_ARCHITECTURE", "x86_64")
 
 
 class Lambda:
-    def __init__(self, lambda_client, iam_resource):
+    def __init__(self, lambda_client, iam_resource, tagging_client):
         self.tags = {"codehook": "true"}
         self.lambda_client = lambda_client
         self.iam_resource = iam_resource
+        # Given rather than created, so that it is throttled and traced like the others
+        self.tagging_client = tagging_client
 
     @staticmethod
-    def create_deployment_package(source_path):
+    def create_deployment_package(
+        source_path,
+        cache=None,
+        runtime=LAMBDA_RUNTIME,
+        install_dependencies=True,
+        architecture=LAMBDA_ARCHITECTURE,
+        compression_level=None,
+    ):
         """
-        Creates a Lambda deployment package in .zip format in an in-memory buffer. This
-        buffer can be passed directly to Lambda when creating the function.
-
-        :param source_path: The path for the files that contains the Lambda handler
-                            function.
+        Creates a Lambda deployment package in .zip format. The package can be passed
+        directly to Lambda when creating the function, and is the same for the same
+        files, byte for byte.
+
+        The skeleton, and the dependencies when they are bundled, are zipped once into
+        a base archive that is kept in the build cache, if one is given. The package is
+        that archive with the handler and the other files of the function added.
+
+        :param source_path: The directory with the files of the function, or a Bundle
+                            of the skeleton and the handler.
+        :param cache: The BuildCache to reuse base archives from, if any.
+        :param runtime: The Lambda runtime the package is built for.
+        :param install_dependencies: Whether to bundle the dependencies in
+                                     requirements.txt. Set it to False when they are
+                                     provided by a layer instead.
+        :param architecture: The Lambda architecture the package is built for.
+        :param compression_level: The zlib compression level of the package, from 0
+                                  to 9. Defaults to $CODEHOOK_COMPRESSION_LEVEL or 6.
         :return: The deployment package.
         """
-        directory = pathlib.Path(source_path)
-
-        # Install dependencies in the package directory
-        command = (
-            f"pip install --target {source_path} -r {source_path}/requirements.txt"
+        return build_package(
+            Bundle.of(source_path),
+            cache,
+            runtime,
+            f"dependencies-{architecture}" if install_dependencies else "",
+            level=compression_level,
+            dependencies=(
+                Wheelhouse(runtime, architecture).install
+                if install_dependencies
+                else None
+            ),
+            slim=SlimPolicy.from_env(),
         )
-        print(f"Installing dependencies with {command}")
-        os.system(command)
 
-        buffer = io.BytesIO()
-        with zipfile.ZipFile(buffer, "w") as zipped:
-            for source_file in directory.iterdir():
-                zipped.write(source_file, arcname=source_file.name)
-        buffer.seek(0)
+    @staticmethod
+    def create_layer_package(
+        requirements_path,
+        runtime=LAMBDA_RUNTIME,
+        architecture=LAMBDA_ARCHITECTURE,
+        compression_level=None,
+    ):
+        """
+        Creates a Lambda layer package in .zip format with the dependencies listed in
+        a requirements file. Lambda extracts layers to /opt, and /opt/python is on the
+        path of Python runtimes, so the dependencies are installed under python/.
+
+        :param requirements_path: The path of the requirements.txt file.
+        :param runtime: The Lambda runtime the layer is built for.
+        :param architecture: The Lambda architecture the layer is built for.
+        :param compression_level: The zlib compression level of the layer, from 0
+                                  to 9. Defaults to $CODEHOOK_COMPRESSION_LEVEL or 6.
+        :return: The layer package.
+        """
+        with tempfile.TemporaryDirectory() as layer_path:
+            target = pathlib.Path(layer_path) / "python"
+            Wheelhouse(runtime, architecture).install(requirements_path, target)
+
+            entries = archive.tree_entries(target, "python/")
+            slim = SlimPolicy.from_env()
+            if slim is not None:
+                with tracing.span("slim", "build"):
+                    entries = slim.apply(entries, runtime, root="/opt")
+            with tracing.span("zip", "build"):
+                return archive.build_archive(entries, level=compression_level)
+
+    @staticmethod
+    def has_requirements(requirements_path) -> bool:
+        """
+        :param requirements_path: The path of the requirements.txt file.
+        :return: Whether the file lists any requirement, besides blank lines and
+                 comments.
+        """
+        lines = pathlib.Path(requirements_path).read_text().splitlines()
+        return any(line.strip() and not line.strip().startswith("#") for line in lines)
+
+    @staticmethod
+    def get_layer_name(
+        requirements_path, runtime=LAMBDA_RUNTIME, architecture=LAMBDA_ARCHITECTURE
+    ):
+        """
+        Names the dependencies layer after a hash of the requirements, the runtime, the
+        architecture and the slimming policy, so every function with the same
+        requirements shares the same layer.
+
+        :param requirements_path: The path of the requirements.txt file.
+        :param runtime: The Lambda runtime the layer is built for.
+        :param architecture: The Lambda architecture the layer is built for.
+        :return: The name of the layer.
+        """
+        slim = SlimPolicy.from_env()
+        digest = hashlib.sha256(f"{runtime}\0{architecture}\0".encode())
+        digest.update(slim.fingerprint().encode() if slim else b"")
+        digest.update(pathlib.Path(requirements_path).read_bytes())
+        return f"codehook-dependencies-{digest.hexdigest()[:16]}"
+
+    @staticmethod
+    def build_dependencies_layer(requirements_path, cache=None, runtime=LAMBDA_RUNTIME):
+        """
+        Builds the package of the layer that provides the dependencies in a
+        requirements file, or reuses it from the cache.
 
-        # Clean up the package directory
-        os.system(f"rm -rf {source_path}/*/")
-        os.system(f"rm {source_path}/typing_extensions.py")
+        :param requirements_path: The path of the requirements.txt file.
+        :param cache: The BuildCache to reuse layer packages from, if any.
+        :param runtime: The Lambda runtime the layer is built for.
+        :return: The layer package.
+        """
+        layer_name = Lambda.get_layer_name(requirements_path, runtime)
+        layer_package = cache.get(layer_name) if cache is not None else None
+        if layer_package is None:
+            layer_package = Lambda.create_layer_package(
+                requirements_path, runtime, LAMBDA_ARCHITECTURE
+            )
+            if cache is not None:
+                cache.put(layer_name, layer_package)
+        return layer_package
+
+    def get_dependencies_layer(
+        self, requirements_path, cache=None, runtime=LAMBDA_RUNTIME
+    ):
+        """
+        Gets the layer that provides the dependencies in a requirements file, publishing
+        it first if no codehook function has done so yet. Layers are shared between
+        functions, so they are not removed when a function is deleted.
+
+        :param requirements_path: The path of the requirements.txt file.
+        :param cache: The BuildCache to reuse layer packages from, if any.
+        :param runtime: The Lambda runtime the layer is built for.
+        :return: The Amazon Resource Name (ARN) of the layer version.
+        """
+        layer_name = self.get_layer_name(requirements_path, runtime)
+        try:
+            response = self.lambda_client.list_layer_versions(
+                LayerName=layer_name, CompatibleRuntime=runtime
+            )
+            if response["LayerVersions"]:
+                # Versions are listed newest first
+                layer_version_arn = response["LayerVersions"][0]["LayerVersionArn"]
+                print(f"Reusing dependencies layer {layer_version_arn}")
+                return layer_version_arn
+        except ClientError:
+            print(f"Couldn't list the versions of layer {layer_name}.")
+            raise
 
-        return buffer.read()
+        layer_package = self.build_dependencies_layer(requirements_path, cache, runtime)
+        try:
+            response = self.lambda_client.publish_layer_version(
+                LayerName=layer_name,
+                Description=str(self.tags),
+                Content={"ZipFile": layer_package},
+                CompatibleRuntimes=[runtime],
+                CompatibleArchitectures=[LAMBDA_ARCHITECTURE],
+            )
+            layer_version_arn = response["LayerVersionArn"]
+            print(f"Published dependencies layer {layer_version_arn}")
+        except ClientError:
+            print(f"Couldn't publish layer {layer_name}.")
+            raise
+        else:
+            return layer_version_arn
 
     def get_iam_role(self, iam_role_name):
         """
@@ -159,6 +310,8 @@ class Lambda:
         iam_role,
         deployment_package,
         environment,
+        layers=None,
+        timeout=None,
     ):
         """
         Deploys a Lambda function.
@@ -169,24 +322,33 @@ class Lambda:
         :param iam_role: The IAM role to use for the function.
         :param deployment_package: The deployment package that contains the function
                                    code in .zip format.
+        :param environment: The environment variables of the function.
+        :param layers: The ARNs of the layer versions to add to the function.
+        :param timeout: The maximum run time of the function in seconds, if not the
+                        default of Lambda.
         :return: The Amazon Resource Name (ARN) of the newly created function.
         """
+        settings = {"Timeout": timeout} if timeout else {}
         try:
-            # Functions do not list its tags, so the description identifies it as a codehook function
+            # The tags are how list_functions finds codehook functions
             response = self.lambda_client.create_function(
                 FunctionName=function_name,
                 Description=str(self.tags),
-                Runtime="python3.11",
+                Runtime=LAMBDA_RUNTIME,
+                Architectures=[LAMBDA_ARCHITECTURE],
                 Role=iam_role.arn,
                 Handler=handler_name,
                 Code={"ZipFile": deployment_package},
                 Publish=True,
                 Tags=self.tags,
                 Environment=environment,
+                Layers=layers or [],
+                **settings,
             )
             function_arn = response["FunctionArn"]
             waiter = self.lambda_client.get_waiter("function_active_v2")
-            waiter.wait(FunctionName=function_name)
+            with tracing.span("function_active_v2", "wait"):
+                waiter.wait(FunctionName=function_name)
             print(
                 f"Created function {function_name} with ARN: {response['FunctionArn']}."
             )
@@ -196,22 +358,99 @@ class Lambda:
         else:
             return function_arn
 
+    def create_event_source_mapping(
+        self, function_name, event_source_arn, batch_size=10, attempts=10
+    ):
+        """
+        Makes Lambda poll a queue and invoke a function with batches of its messages.
+
+        Lambda checks that the role of the function can read the queue, and IAM
+        changes take a few seconds to propagate, so the mapping is retried for a while
+        when it is rejected for lack of permissions.
+
+        :param function_name: The name of the function to invoke.
+        :param event_source_arn: The ARN of the Amazon SQS queue to poll.
+        :param batch_size: The maximum number of messages per invocation.
+        :param attempts: How many times the mapping is attempted.
+        :return: The UUID of the event source mapping.
+        """
+        for attempt in range(attempts):
+            try:
+                response = self.lambda_client.create_event_source_mapping(
+                    FunctionName=function_name,
+                    EventSourceArn=event_source_arn,
+                    BatchSize=batch_size,
+                    # Only the messages the function reports as failed are retried
+                    FunctionResponseTypes=["ReportBatchItemFailures"],
+                )
+                print(
+                    f"Mapped queue {event_source_arn} to function {function_name} "
+                    f"with UUID {response['UUID']}."
+                )
+                return response["UUID"]
+            except ClientError as err:
+                propagating = (
+                    err.response["Error"]["Code"] == "InvalidParameterValueException"
+                    and "role" in err.response["Error"]["Message"]
+                )
+                if not propagating or attempt == attempts - 1:
+                    print(f"Couldn't map queue {event_source_arn} to {function_name}.")
+                    raise
+                print("Waiting for the permissions of the role to propagate...")
+                with tracing.span("role propagation", "wait"):
+                    time.sleep(3)
+
+    def delete_event_source_mappings(self, function_name):
+        """
+        Stops Lambda from polling the queues that invoke a function.
+
+        :param function_name: The name of the function.
+        """
+        try:
+            paginator = self.lambda_client.get_paginator("list_event_source_mappings")
+            for page in paginator.paginate(FunctionName=function_name):
+                for mapping in page["EventSourceMappings"]:
+                    self.lambda_client.delete_event_source_mapping(UUID=mapping["UUID"])
+                    print(f"Deleted event source mapping {mapping['UUID']}.")
+        except ClientError:
+            print(f"Couldn't delete the event source mappings of {function_name}.")
+            raise
+
     def delete_function(self, function_name):
         """
-        Deletes a Lambda function.
+        Deletes a Lambda function, and the event source mappings that invoke it.
 
         :param function_name: The name of the function to delete.
         """
+        self.delete_event_source_mappings(function_name)
         try:
             self.lambda_client.delete_function(FunctionName=function_name)
         except ClientError:
             print(f"Couldn't delete function {function_name}.")
             raise
 
+    def get_function_configuration(self, function_name):
+        """
+        Gets the configuration of a Lambda function, including the hash of its code.
+
+        :param function_name: The name of the function.
+        :return: The configuration of the function, or None if it does not exist.
+        """
+        try:
+            return self.lambda_client.get_function_configuration(
+                FunctionName=function_name
+            )
+        except ClientError as err:
+            if err.response["Error"]["Code"] == "ResourceNotFoundException":
+                print(f"Function {function_name} does not exist.")
+                return None
+            print(f"Couldn't get function {function_name}.")
+            raise
+
     def update_function_code(self, function_name, deployment_package):
         """
         Updates the code for a Lambda function by submitting a .zip archive that contains
-        the code for the function.
+        the code for the function, and waits for the update to finish.
 
         :param function_name: The name of the function to update.
         :param deployment_package: The function code to update, packaged as bytes in
@@ -222,6 +461,9 @@ class Lambda:
             response = self.lambda_client.update_function_code(
                 FunctionName=function_name, ZipFile=deployment_package
             )
+            waiter = self.lambda_client.get_waiter("function_updated_v2")
+            with tracing.span("function_updated_v2", "wait"):
+                waiter.wait(FunctionName=function_name)
         except ClientError as err:
             print(
                 "Couldn't update function %s. Here's why: %s: %s",
@@ -246,7 +488,7 @@ class Lambda:
                 FunctionName=function_name, Environment={"Variables": env_vars}
             )
         except ClientError as err:
-            print.error(
+            print(
                 "Couldn't update function configuration %s. Here's why: %s: %s",
                 function_name,
                 err.response["Error"]["Code"],
@@ -256,31 +498,186 @@ class Lambda:
         else:
             return response
 
+    def reconfigure_function(self, function_name, **configuration):
+        """
+        Changes the configuration of a Lambda function, e.g. its layers or environment,
+        and waits for the update to finish.
+
+        :param function_name: The name of the function to update.
+        :param configuration: The settings to change, as accepted by
+                              UpdateFunctionConfiguration, e.g. Layers=[...].
+        :return: Data about the update, including the status.
+        """
+        try:
+            response = self.lambda_client.update_function_configuration(
+                FunctionName=function_name, **configuration
+            )
+            waiter = self.lambda_client.get_waiter("function_updated_v2")
+            with tracing.span("function_updated_v2", "wait"):
+                waiter.wait(FunctionName=function_name)
+        except ClientError:
+            print(f"Couldn't update the configuration of function {function_name}.")
+            raise
+        else:
+            return response
+
     def list_functions(self):
         """
-        Lists the Lambda functions for the current account.
+        Lists the codehook functions for the current account, by asking the Resource
+        Groups Tagging API for the functions tagged by codehook. Unlike listing every
+        function and filtering them, this costs one call per page of codehook
+        functions, however many other functions the account has.
 
-        :return: A list of all codehook functions on the account
+        :return: A list of all codehook functions on the account, each a dict with
+                 the FunctionName and FunctionArn.
         """
         try:
             functions = []
-            paginator = self.lambda_client.get_paginator("list_functions")
-            page_iterator = paginator.paginate()
+            paginator = self.tagging_client.get_paginator("get_resources")
+            page_iterator = paginator.paginate(
+                TagFilters=[
+                    {"Key": key, "Values": [value]} for key, value in self.tags.items()
+                ],
+                ResourceTypeFilters=["lambda:function"],
+            )
             for page in page_iterator:
-                for function in page["Functions"]:
-                    # Functions do not list its tags, so the description identifies it as a codehook function
-                    if function["Description"] == str(self.tags):
-                        functions.append(function)
+                for resource in page["ResourceTagMappingList"]:
+                    arn = resource["ResourceARN"]
+                    functions.append(
+                        {"FunctionName": arn.split(":")[6], "FunctionArn": arn}
+                    )
             return functions
         except ClientError:
-            print("Couldn't list REST APIs.")
+            print("Couldn't list Lambda functions.")
+            raise
+
+
+class SQS:
+    def __init__(self, sqs_client):
+        self.tags = {"codehook": "true"}
+        self.sqs_client = sqs_client
+
+    def create_queue(self, queue_name, attributes=None):
+        """
+        Creates an Amazon SQS queue, or gets it if it already exists with the same
+        attributes.
+
+        :param queue_name: The name of the queue.
+        :param attributes: The attributes of the queue, e.g. VisibilityTimeout.
+        :return: The URL and the Amazon Resource Name (ARN) of the queue.
+        """
+        try:
+            queue_url = self.sqs_client.create_queue(
+                QueueName=queue_name, Attributes=attributes or {}, tags=self.tags
+            )["QueueUrl"]
+            queue_arn = self.sqs_client.get_queue_attributes(
+                QueueUrl=queue_url, AttributeNames=["QueueArn"]
+            )["Attributes"]["QueueArn"]
+            print(f"Created queue {queue_name} with URL {queue_url}.")
+        except ClientError:
+            print(f"Couldn't create queue {queue_name}.")
+            raise
+        else:
+            return queue_url, queue_arn
+
+    def delete_queue(self, queue_url):
+        """
+        Deletes an Amazon SQS queue and the messages in it. Queues that no longer
+        exist are ignored.
+
+        :param queue_url: The URL of the queue.
+        """
+        try:
+            self.sqs_client.delete_queue(QueueUrl=queue_url)
+            print(f"Deleted queue {queue_url}.")
+        except ClientError as err:
+            if err.response["Error"]["Code"] in (
+                "AWS.SimpleQueueService.NonExistentQueue",
+                "QueueDoesNotExist",
+            ):
+                print(f"Queue {queue_url} does not exist.")
+                return
+            print(f"Couldn't delete queue {queue_url}.")
             raise
 
+    def list_queues(self, prefix):
+        """
+        :param prefix: The prefix of the names of the queues.
+        :return: The URLs of the queues whose names start with the prefix.
+        """
+        try:
+            queue_urls = []
+            paginator = self.sqs_client.get_paginator("list_queues")
+            for page in paginator.paginate(QueueNamePrefix=prefix):
+                queue_urls.extend(page.get("QueueUrls", []))
+            return queue_urls
+        except ClientError:
+            print("Couldn't list the queues.")
+            raise
+
+
+class DynamoDB:
+    def __init__(self, dynamodb_client):
+        self.tags = {"codehook": "true"}
+        self.dynamodb_client = dynamodb_client
+
+    def create_ttl_table(self, table_name, key, ttl_attribute):
+        """
+        Creates a DynamoDB table with a string partition key, billed per request,
+        whose items are deleted once the time in their TTL attribute passes. The
+        table is used as is if it already exists.
+
+        :param table_name: The name of the table.
+        :param key: The name of the partition key.
+        :param ttl_attribute: The attribute with the expiry time of the items, in
+                              seconds since the epoch.
+        :return: The Amazon Resource Name (ARN) of the table.
+        """
+        try:
+            table = self.dynamodb_client.describe_table(TableName=table_name)["Table"]
+            print(f"Reusing table {table_name}.")
+            return table["TableArn"]
+        except ClientError as err:
+            if err.response["Error"]["Code"] != "ResourceNotFoundException":
+                print(f"Couldn't get table {table_name}.")
+                raise
+
+        try:
+            table = self.dynamodb_client.create_table(
+                TableName=table_name,
+                AttributeDefinitions=[{"AttributeName": key, "AttributeType": "S"}],
+                KeySchema=[{"AttributeName": key, "KeyType": "HASH"}],
+                BillingMode="PAY_PER_REQUEST",
+                Tags=[{"Key": k, "Value": v} for k, v in self.tags.items()],
+            )["TableDescription"]
+            waiter = self.dynamodb_client.get_waiter("table_exists")
+            with tracing.span("table_exists", "wait"):
+                waiter.wait(TableName=table_name)
+            self.dynamodb_client.update_time_to_live(
+                TableName=table_name,
+                TimeToLiveSpecification={
+                    "Enabled": True,
+                    "AttributeName": ttl_attribute,
+                },
+            )
+            print(f"Created table {table_name} with ARN {table['TableArn']}.")
+        except ClientError as err:
+            if err.response["Error"]["Code"] == "ResourceInUseException":
+                # Another deployment created it in the meantime
+                return self.dynamodb_client.describe_table(TableName=table_name)[
+                    "Table"
+                ]["TableArn"]
+            print(f"Couldn't create table {table_name}.")
+            raise
+        else:
+            return table["TableArn"]
+
 
 class APIGateway:
-    def __init__(self, apigateway_client):
+    def __init__(self, apigateway_client, throttle: Throttle = None):
         self.tags = {"codehook": "true"}
         self.apigateway_client = apigateway_client
+        self.throttle = throttle or Throttle()
 
     def create_rest_api(
         self,
@@ -304,6 +701,10 @@ class APIGateway:
         5. Adds a resource policy to the AWS Lambda function that grants permission
         to let Amazon API Gateway call the AWS Lambda function.
 
+        Steps 1-3 don't need the AWS Lambda function and are done by
+        create_rest_api_resources, so they can run while the function is being
+        created. Steps 4-5 are done by integrate_rest_api.
+
         :param apigateway_client: The Boto3 Amazon API Gateway client object.
         :param api_name: The name of the REST API.
         :param api_base_path: The base path part of the REST API URL.
@@ -316,6 +717,27 @@ class APIGateway:
         :return: The ID of the REST API. This ID is required by most Amazon API Gateway
                 methods.
         """
+        api_id, base_id = self.create_rest_api_resources(api_name, api_base_path)
+        self.integrate_rest_api(
+            api_id,
+            base_id,
+            api_base_path,
+            api_stage,
+            account_id,
+            lambda_client,
+            lambda_function_arn,
+        )
+        return api_id
+
+    def create_rest_api_resources(self, api_name, api_base_path):
+        """
+        Creates a REST API in Amazon API Gateway with a base path resource and a method
+        that accepts all HTTP verbs, but no integration yet.
+
+        :param api_name: The name of the REST API.
+        :param api_base_path: The base path part of the REST API URL.
+        :return: The ID of the REST API and the ID of the base path resource.
+        """
         try:
             response = self.apigateway_client.create_rest_api(
                 name=api_name, tags=self.tags
@@ -360,6 +782,32 @@ class APIGateway:
             print("Couldn't create a method for the base resource.")
             raise
 
+        return api_id, base_id
+
+    def integrate_rest_api(
+        self,
+        api_id,
+        base_id,
+        api_base_path,
+        api_stage,
+        account_id,
+        lambda_client,
+        lambda_function_arn,
+    ):
+        """
+        Integrates a REST API created by create_rest_api_resources with an AWS Lambda
+        function, deploys it, and lets Amazon API Gateway invoke the function.
+
+        :param api_id: The ID of the REST API.
+        :param base_id: The ID of the base path resource.
+        :param api_base_path: The base path part of the REST API URL.
+        :param api_stage: The deployment stage of the REST API.
+        :param account_id: The ID of the owning AWS account.
+        :param lambda_client: The Boto3 AWS Lambda client object.
+        :param lambda_function_arn: The Amazon Resource Name (ARN) of the AWS Lambda
+                                    function that is called by Amazon API Gateway to
+                                    handle REST requests.
+        """
         lambda_uri = (
             f"arn:aws:apigateway:{self.apigateway_client.meta.region_name}:"
             f"lambda:path/2015-03-31/functions/{lambda_function_arn}/invocations"
@@ -418,8 +866,6 @@ class APIGateway:
             )
             raise
 
-        return api_id
-
     def construct_api_url(self, api_id, api_stage, api_base_path):
         """
         Constructs the URL of the REST API.
@@ -440,40 +886,40 @@ class APIGateway:
     def delete_rest_api(self, api_id):
         """
         Deletes a REST API and all of its resources from Amazon API Gateway.
-        NOTE: AWS only supports 1 request every 30 seconds per account
-        TODO: Handle too many requests gracefully
+        NOTE: AWS only supports 1 request every 30 seconds per account, so deletions
+        are scheduled by the shared throttle and retried with backoff if rejected.
 
         :param apigateway_client: The Boto3 Amazon API Gateway client.
         :param api_id: The ID of the REST API.
         """
         try:
-            self.apigateway_client.delete_rest_api(restApiId=api_id)
-            print(f"Deleted REST API {api_id}.")
-        except self.apigateway_client.exceptions.TooManyRequestsException:
-            print(
-                f"Too many requests to delete REST API {api_id}. Trying after 30 seconds..."
+            self.throttle.retry(
+                lambda: self.apigateway_client.delete_rest_api(restApiId=api_id),
+                "api-gateway",
+                "DeleteRestApi",
             )
-            time.sleep(30)
-            self.delete_rest_api(api_id)
+            print(f"Deleted REST API {api_id}.")
         except ClientError:
             print(f"Couldn't delete REST API {api_id}.")
             raise
 
     def get_rest_apis(self):
         """
-        Gets the ID of a REST API from its name by searching the list of REST APIs
-        for the current account. Because names need not be unique, this returns only
-        the first API with the specified name.
+        Lists the codehook REST APIs for the current account, i.e. the ones that have
+        the codehook tags. REST APIs are listed with their tags, and an account has at
+        most a few hundred of them per region, so this takes one or two calls.
 
-        :param api_name: The name of the API to look up.
-        :return: A list with all rest apis
+        :return: A list with all codehook rest apis
         """
         try:
             rest_apis = []
             paginator = self.apigateway_client.get_paginator("get_rest_apis")
-            page_iterator = paginator.paginate()
+            page_iterator = paginator.paginate(PaginationConfig={"PageSize": 500})
             for page in page_iterator:
-                rest_apis.extend(page["items"])
+                for rest_api in page["items"]:
+                    tags = rest_api.get("tags", {})
+                    if all(tags.get(key) == value for key, value in self.tags.items()):
+                        rest_apis.append(rest_api)
             return rest_apis
 
         except ClientError:
@@ -482,101 +928,387 @@ class APIGateway:
 
 
 class AWS(Cloud):
-    def __init__(self):
+    API_BASE_PATH = "codehook"
+    API_STAGE = "prod"
+    # The lambda skeleton contains a file called lambda_handler_rest.py
+    # which contains a function called lambda_handler. This is the
+    # function that will be called when the lambda function is invoked.
+    LAMBDA_HANDLER_NAME = "lambda_handler_rest.lambda_handler"
+    # In the asynchronous mode, lambda_handler enqueues the events it verified and
+    # worker_handler, in a function of its own, handles them in batches
+    WORKER_HANDLER_NAME = "lambda_handler_rest.worker_handler"
+    WORKER_SUFFIX = "-worker"
+    # The worker may take longer than the 3 seconds Stripe waits for a response.
+    # SQS hides the messages being handled for 6 times that, as AWS recommends.
+    WORKER_TIMEOUT = 60
+    QUEUE_PREFIX = "codehook-"
+    DEAD_LETTER_SUFFIX = "-dlq"
+    # Events that fail that many times are moved to the dead letter queue
+    MAX_RECEIVE_COUNT = 5
+    QUEUE_POLICY_NAME = "codehook-queues"
+    # One table deduplicates the events of every function, with keys prefixed by
+    # the name of the deployment, see skeletons/common/idempotency.py
+    IDEMPOTENCY_TABLE = "codehook-idempotency"
+    IDEMPOTENCY_POLICY_NAME = "codehook-idempotency"
+
+    def __init__(self, build_cache: BuildCache = None, throttle: Throttle = None):
         super().__init__()
         self.tags = {"codehook": "true"}
+        self.build_cache = build_cache or BuildCache()
+        self.throttle = throttle or Throttle()
 
         load_dotenv()
         self.iam_role_name = os.getenv("IAM_ROLE_NAME")
         self.stripe_api_key = os.getenv("STRIPE_API_KEY")
+        # How the functions log their requests, see skeletons/common/request_log.py
+        self.log_settings = {
+            variable: os.getenv(f"CODEHOOK_{variable}", default)
+            for variable, default in LOG_SETTINGS.items()
+        }
 
-        self.lambda_client = boto3.client("lambda")
-        self.apigateway_client = boto3.client("apigateway")
+        self.lambda_client = self.throttle.register_client(boto3.client("lambda"))
+        self.apigateway_client = self.throttle.register_client(
+            boto3.client("apigateway")
+        )
+        self.tagging_client = self.throttle.register_client(
+            boto3.client("resourcegroupstaggingapi")
+        )
+        self.sqs_client = self.throttle.register_client(boto3.client("sqs"))
+        self.dynamodb_client = self.throttle.register_client(boto3.client("dynamodb"))
         self.iam_resource = boto3.resource("iam")
+        self.throttle.register_client(self.iam_resource.meta.client)
 
-        self.api_wrapper = APIGateway(self.apigateway_client)
-        self.lambda_wrapper = Lambda(self.lambda_client, self.iam_resource)
-
-    def create_function(self, name: str, path: str):
-        # Step 2.1: Create IAM Role
-        print("Checking for IAM role for Lambda")
-        iam_role, should_wait = self.lambda_wrapper.create_iam_role_for_lambda(
-            self.iam_role_name
+        self.api_wrapper = APIGateway(self.apigateway_client, self.throttle)
+        self.lambda_wrapper = Lambda(
+            self.lambda_client, self.iam_resource, self.tagging_client
         )
-        if should_wait:
-            print("Giving AWS time to create resources...")
-            time.sleep(5)
-        print(f"IAM role: {iam_role.name}")
+        self.sqs_wrapper = SQS(self.sqs_client)
+        self.dynamodb_wrapper = DynamoDB(self.dynamodb_client)
+
+        # Boto3 resources are not thread safe, and the role and account don't
+        # change between deployments, so they are looked up once under a lock
+        self._lock = threading.Lock()
+        self._layer_lock = threading.Lock()
+        self._idempotency_lock = threading.Lock()
+        self._idempotency_table_arn = None
+        self._iam_role = None
+        self._account_id = None
+
+    def get_role(self):
+        # Step 2.1: Create IAM Role
+        with self._lock:
+            if self._iam_role is None:
+                print("Checking for IAM role for Lambda")
+                iam_role, should_wait = self.lambda_wrapper.create_iam_role_for_lambda(
+                    self.iam_role_name
+                )
+                if should_wait:
+                    print("Giving AWS time to create resources...")
+                    with tracing.span("role propagation", "wait"):
+                        time.sleep(5)
+                print(f"IAM role: {iam_role.name}")
+                self._iam_role = iam_role
+        return self._iam_role
+
+    def get_account_id(self):
+        with self._lock:
+            if self._account_id is None:
+                sts_client = self.throttle.register_client(boto3.client("sts"))
+                self._account_id = sts_client.get_caller_identity()["Account"]
+        return self._account_id
+
+    def get_environment(self, queue_url: str = None, namespace: str = None):
+        """
+        :param queue_url: The URL of the queue the function sends the events to, if
+                          it acknowledges them before they are handled.
+        :param namespace: The name of the deployment, which scopes the IDs of the
+                          events in the idempotency table.
+        :return: The environment variables of the functions, as accepted by Lambda.
+        """
+        variables = {
+            "API_KEY": self.stripe_api_key,
+            **self.log_settings,
+            "IDEMPOTENCY_TABLE": self.IDEMPOTENCY_TABLE,
+        }
+        if namespace:
+            variables["IDEMPOTENCY_NAMESPACE"] = namespace
+        if queue_url:
+            variables["QUEUE_URL"] = queue_url
+        return {"Variables": variables}
+
+    def create_layer(self, path: str):
+        # Step 2.2: Get the shared layer with the dependencies of the skeleton
+        # Concurrent deployments with the same requirements must share one layer
+        requirements_path = Bundle.of(path).requirements_path
+        if requirements_path is None or not Lambda.has_requirements(requirements_path):
+            print("No dependencies, the function doesn't need a layer")
+            return None
+        print("Checking for the dependencies layer")
+        with self._layer_lock:
+            return self.lambda_wrapper.get_dependencies_layer(
+                requirements_path, self.build_cache
+            )
 
-        # Step 2.2: Create deployment package from the temporary directory
+    def create_package(self, path: str):
+        # Step 2.3: Create deployment package from the temporary directory
+        # The dependencies come from the layer, so the package only has the code
         print("Creating deployment package")
-        deployment_package = self.lambda_wrapper.create_deployment_package(path)
+        deployment_package = self.lambda_wrapper.create_deployment_package(
+            path, self.build_cache, install_dependencies=False
+        )
         print("Deployment package ready to be deployed")
+        return deployment_package
 
-        # Step 2.3: Create lambda function from the deployment package
-        # The lambda skeleton contains a file called lambda_handler_rest.py
-        # which contains a function called lambda_handler. This is the
-        # function that will be called when the lambda function is invoked.
-        lambda_handler_name = "lambda_handler_rest.lambda_handler"
-        env_vars = {"Variables": {"API_KEY": self.stripe_api_key}}
-        print(f"Creating AWS Lambda function {name} from " f"{lambda_handler_name}")
+    def create_function(
+        self,
+        name: str,
+        path: str,
+        role=None,
+        layer: str = None,
+        package: bytes = None,
+        queue: str = None,
+    ):
+        role = role or self.get_role()
+        layer = layer or self.create_layer(path)
+        package = package or self.create_package(path)
+
+        # Step 2.4: Create lambda function from the deployment package
+        env_vars = self.get_environment(queue, name)
+        print(
+            f"Creating AWS Lambda function {name} from " f"{self.LAMBDA_HANDLER_NAME}"
+        )
         lambda_function_arn = self.lambda_wrapper.create_function(
             name,
-            lambda_handler_name,
-            iam_role,
-            deployment_package,
+            self.LAMBDA_HANDLER_NAME,
+            role,
+            package,
             env_vars,
+            [layer] if layer else [],
         )
         print(f"Lambda function created: {lambda_function_arn}")
         return lambda_function_arn
 
-    def update_function(self, id: str, file: Path):
-        pass
+    def update_function(self, id: str, path: str, package: bytes = None):
+        """
+        Pushes new code to an existing function, leaving its API untouched. The upload
+        is skipped when the package matches the deployed code.
+
+        :param id: The name or ARN of the function.
+        :param path: The path with the skeleton and handler files.
+        :param package: The deployment package, if it was already built.
+        :return: True if the function was updated, False if it was up to date, or
+                 None if it does not exist.
+        """
+        configuration = self.lambda_wrapper.get_function_configuration(id)
+        if configuration is None:
+            return None
+
+        updated = False
+        changes = {}
+        layer = self.create_layer(path)
+        layers = [layer] if layer else []
+        deployed_layers = [layer["Arn"] for layer in configuration.get("Layers", [])]
+        if deployed_layers != layers:
+            print(f"Updating the dependencies layers of {id} to {layers}")
+            changes["Layers"] = layers
+        deployed_environment = configuration.get("Environment", {}).get("Variables", {})
+        # Functions deployed before events were deduplicated get the store too
+        if deployed_environment.get("IDEMPOTENCY_TABLE") != self.IDEMPOTENCY_TABLE:
+            self.create_idempotency_store()
+        # Functions keep the queue and the namespace they were deployed with
+        environment = self.get_environment(
+            deployed_environment.get("QUEUE_URL"),
+            deployed_environment.get("IDEMPOTENCY_NAMESPACE")
+            or configuration["FunctionName"],
+        )
+        if deployed_environment != environment["Variables"]:
+            print(f"Updating the environment of {id}")
+            changes["Environment"] = environment
+        if changes:
+            self.lambda_wrapper.reconfigure_function(id, **changes)
+            updated = True
+
+        package = package or self.create_package(path)
+        code_hash = code_sha256(package)
+        if code_hash == configuration["CodeSha256"]:
+            print(f"The code of {id} is up to date ({code_hash})")
+        else:
+            print(f"Uploading new code to {id} ({code_hash})")
+            self.lambda_wrapper.update_function_code(id, package)
+            updated = True
+
+        return updated
 
     def delete_function(self, id: str):
         self.lambda_wrapper.delete_function(id)
 
     def list_functions(self):
         lambdas = self.lambda_wrapper.list_functions()
-        lambda_ids = [lambda_function["FunctionName"] for lambda_function in lambdas]
-        if lambda_ids:
-            print(lambda_ids)
-        else:
-            print("[bold red]No lambda functions[/bold red]")
+        return [lambda_function["FunctionName"] for lambda_function in lambdas]
 
-        return lambda_ids
-
-    def create_api(self, name: str, function_id: str):
-        # Step 2.4: Create an API to front the lambda function
+    def prepare_api(self, name: str):
+        # Step 2.5: Create an API to front the lambda function
         print(f"Creating the {name} API for the lambda function")
-        account_id = boto3.client("sts").get_caller_identity()["Account"]
-        api_base_path = "codehook"
-        api_stage = "prod"
-        api_id = self.api_wrapper.create_rest_api(
-            name,
-            api_base_path,
-            api_stage,
-            account_id,
+        api_id, base_id = self.api_wrapper.create_rest_api_resources(
+            name, self.API_BASE_PATH
+        )
+        print(f"API created with ID {api_id}")
+        return api_id, base_id
+
+    def integrate_api(self, api, function_id: str):
+        api_id, base_id = api
+        self.api_wrapper.integrate_rest_api(
+            api_id,
+            base_id,
+            self.API_BASE_PATH,
+            self.API_STAGE,
+            self.get_account_id(),
             self.lambda_wrapper.lambda_client,
             function_id,
         )
-        print(f"API created with ID {api_id}")
-        # Step 2.5: Assign the API a public URL
+        # Step 2.6: Assign the API a public URL
         print("Wrapping the API around a public URL")
-        api_url = self.api_wrapper.construct_api_url(api_id, api_stage, api_base_path)
+        api_url = self.api_wrapper.construct_api_url(
+            api_id, self.API_STAGE, self.API_BASE_PATH
+        )
         print(f"REST API fully created, URL is :\n\t{api_url}")
 
         return api_id, api_url
 
+    def create_api(self, name: str, function_id: str):
+        return self.integrate_api(self.prepare_api(name), function_id)
+
     def delete_api(self, id: str):
         self.api_wrapper.delete_rest_api(id)
 
     def list_apis(self):
         endpoints = self.api_wrapper.get_rest_apis()
-        endpoint_ids = [endpoint["id"] for endpoint in endpoints]
-        if endpoint_ids:
-            print(endpoint_ids)
-        else:
-            print("[bold red]No codehook endpoints[/bold red]")
+        return [endpoint["id"] for endpoint in endpoints]
 
-        return endpoint_ids
+    def get_queue_name(self, name: str):
+        return f"{self.QUEUE_PREFIX}{name}"
+
+    def get_worker_name(self, name: str):
+        return f"{name}{self.WORKER_SUFFIX}"
+
+    def allow_queues(self, role):
+        """
+        Lets the functions of a role send to, and be invoked from, the codehook
+        queues. The policy is inline and covers every codehook queue, so putting it
+        again for another deployment changes nothing.
+        """
+        region = self.sqs_client.meta.region_name
+        queues_arn = f"arn:aws:sqs:{region}:*:{self.QUEUE_PREFIX}*"
+        policy = {
+            "Version": "2012-10-17",
+            "Statement": [
+                {
+                    "Effect": "Allow",
+                    "Action": [
+                        "sqs:SendMessage",
+                        "sqs:ReceiveMessage",
+                        "sqs:DeleteMessage",
+                        "sqs:GetQueueAttributes",
+                    ],
+                    "Resource": queues_arn,
+                }
+            ],
+        }
+        with self._lock:
+            role.Policy(self.QUEUE_POLICY_NAME).put(PolicyDocument=json.dumps(policy))
+        print(f"Allowed role {role.name} to use the queues {queues_arn}")
+
+    def create_queue(self, name: str, role=None):
+        # Step 2.4.1: Create the queue between the function and its worker
+        role = role or self.get_role()
+        queue_name = self.get_queue_name(name)
+        print(f"Creating the {queue_name} queue and its dead letter queue")
+        _, dead_letter_arn = self.sqs_wrapper.create_queue(
+            f"{queue_name}{self.DEAD_LETTER_SUFFIX}",
+            # The longest SQS keeps messages, 14 days, to give time to replay them
+            {"MessageRetentionPeriod": str(14 * 24 * 3600)},
+        )
+        redrive_policy = {
+            "deadLetterTargetArn": dead_letter_arn,
+            "maxReceiveCount": str(self.MAX_RECEIVE_COUNT),
+        }
+        queue_url, _ = self.sqs_wrapper.create_queue(
+            queue_name,
+            {
+                "VisibilityTimeout": str(6 * self.WORKER_TIMEOUT),
+                "RedrivePolicy": json.dumps(redrive_policy),
+            },
+        )
+        self.allow_queues(role)
+        return queue_url
+
+    def create_worker(
+        self,
+        name: str,
+        path: str,
+        queue: str,
+        role=None,
+        layer: str = None,
+        package: bytes = None,
+    ):
+        role = role or self.get_role()
+        layer = layer or self.create_layer(path)
+        package = package or self.create_package(path)
+
+        # Step 2.4.2: Create the function that handles the events of the queue
+        worker_name = self.get_worker_name(name)
+        print(
+            f"Creating AWS Lambda function {worker_name} from {self.WORKER_HANDLER_NAME}"
+        )
+        worker_arn = self.lambda_wrapper.create_function(
+            worker_name,
+            self.WORKER_HANDLER_NAME,
+            role,
+            package,
+            # The worker shares the namespace of the function that enqueues
+            self.get_environment(namespace=name),
+            [layer] if layer else [],
+            timeout=self.WORKER_TIMEOUT,
+        )
+        queue_arn = self.sqs_client.get_queue_attributes(
+            QueueUrl=queue, AttributeNames=["QueueArn"]
+        )["Attributes"]["QueueArn"]
+        self.lambda_wrapper.create_event_source_mapping(worker_name, queue_arn)
+        print(f"Worker function created: {worker_arn}")
+        return worker_arn
+
+    def delete_queue(self, id: str):
+        # The dead letter queue goes with its queue
+        self.sqs_wrapper.delete_queue(id)
+        self.sqs_wrapper.delete_queue(f"{id}{self.DEAD_LETTER_SUFFIX}")
+
+    def list_queues(self):
+        queue_urls = self.sqs_wrapper.list_queues(self.QUEUE_PREFIX)
+        return [url for url in queue_urls if not url.endswith(self.DEAD_LETTER_SUFFIX)]
+
+    def create_idempotency_store(self, role=None):
+        # Step 2.7: Get the table that deduplicates the events, and let the functions
+        # use it. Like layers, it is shared, so it is not removed with a function.
+        role = role or self.get_role()
+        with self._idempotency_lock:
+            if self._idempotency_table_arn is None:
+                print(f"Checking for the {self.IDEMPOTENCY_TABLE} table")
+                self._idempotency_table_arn = self.dynamodb_wrapper.create_ttl_table(
+                    self.IDEMPOTENCY_TABLE, "id", "expires_at"
+                )
+                policy = {
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Action": ["dynamodb:GetItem", "dynamodb:PutItem"],
+                            "Resource": self._idempotency_table_arn,
+                        }
+                    ],
+                }
+                with self._lock:
+                    role.Policy(self.IDEMPOTENCY_POLICY_NAME).put(
+                        PolicyDocument=json.dumps(policy)
+                    )
+                print(f"Allowed role {role.name} to use {self.IDEMPOTENCY_TABLE}")
+        return self.IDEMPOTENCY_TABLE
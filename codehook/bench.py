@@ -0,0 +1,240 @@
+"""
+Load tests a webhook endpoint with validly signed Stripe events.
+
+The events are copies of the example payload of the Stripe skeleton, each with an ID
+of its own so that deduplication doesn't answer them from its cache, and they are
+signed when they are sent, so that they are within the tolerance of the endpoint.
+They are sent at a fixed rate by a pool of connections, and each latency is
+measured from the time its request was due rather than the time it was sent, so
+that an endpoint falling behind shows up in the latencies instead of slowing the
+benchmark down.
+"""
+
+import asyncio
+import json
+import ssl
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from .skeletons.stripe_lean.stripe_signature import compute_signature
+
+EXAMPLE_PAYLOAD = (
+    Path(__file__).parent / "skeletons" / "stripe" / "example_payload.json"
+)
+DEFAULT_SECRET = "whsec_codehook_bench"
+
+
+def synthesize_payloads(count: int, seed: Path = EXAMPLE_PAYLOAD) -> list[bytes]:
+    """
+    :param count: The number of events.
+    :param seed: The JSON file of the event to copy.
+    :return: The payloads of COUNT copies of the event, with unique IDs.
+    """
+    event = json.loads(Path(seed).read_text())
+    run = uuid.uuid4().hex[:8]
+    created = int(time.time())
+    payloads = []
+    for index in range(count):
+        event["id"] = f"evt_bench_{run}_{index:07d}"
+        event["created"] = created
+        payloads.append(json.dumps(event).encode("utf-8"))
+    return payloads
+
+
+def sign(payload: bytes, secret: str, timestamp: int = None) -> str:
+    """
+    :return: The Stripe-Signature header of the payload.
+    """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    return f"t={timestamp},v1={compute_signature(timestamp, payload, secret)}"
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    :param values: The values, sorted.
+    :param p: The percentile, between 0 and 100.
+    :return: The nearest-rank percentile of the values, or 0 if there are none.
+    """
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+class Connection:
+    """
+    A keep-alive HTTP/1.1 connection that posts to one URL. It only reads the
+    responses as far as the benchmark needs: the status code, and the body to keep
+    the connection in sync.
+    """
+
+    def __init__(self, url: str, timeout: float):
+        parts = urlsplit(url)
+        self.secure = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.secure else 80)
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.netloc = parts.netloc
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        context = ssl.create_default_context() if self.secure else None
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=context
+        )
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def post(self, body: bytes, headers: dict) -> int:
+        """
+        :return: The status code of the response.
+        """
+        try:
+            return await asyncio.wait_for(self._post(body, headers), self.timeout)
+        except BaseException:
+            # The connection is in an unknown state, the next request opens another
+            self.close()
+            raise
+
+    async def _post(self, body: bytes, headers: dict) -> int:
+        if self.writer is None:
+            await self.open()
+        lines = [
+            f"POST {self.path} HTTP/1.1",
+            f"Host: {self.netloc}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+        ]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("The server closed the connection")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif "content-length" in response_headers:
+            await self.reader.readexactly(int(response_headers["content-length"]))
+        else:
+            await self.reader.read()
+            self.close()
+            return status
+
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status
+
+
+async def run(
+    url: str,
+    requests: int = 1000,
+    rate: float = 0,
+    concurrency: int = 10,
+    secret: str = DEFAULT_SECRET,
+    timeout: float = 10,
+    seed: Path = EXAMPLE_PAYLOAD,
+) -> dict:
+    """
+    Sends signed events to an endpoint and measures its responses.
+
+    :param url: The URL of the endpoint.
+    :param requests: The number of events to send.
+    :param rate: The number of events to send per second, or 0 to send them as fast
+                 as the connections allow.
+    :param concurrency: The number of connections, i.e. of requests in flight.
+    :param secret: The endpoint secret to sign the events with.
+    :param timeout: How long to wait for a response, in seconds.
+    :param seed: The JSON file of the event to send copies of.
+    :return: The report, see report().
+    """
+    payloads = synthesize_payloads(requests, seed)
+    latencies = []
+    errors = Counter()
+    next_index = 0
+    started = time.perf_counter()
+
+    async def worker():
+        nonlocal next_index
+        connection = Connection(url, timeout)
+        try:
+            while next_index < len(payloads):
+                index = next_index
+                next_index += 1
+                # Requests are due on a fixed schedule, whether or not earlier
+                # responses came back
+                due = started + index / rate if rate else time.perf_counter()
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                payload = payloads[index]
+                try:
+                    status = await connection.post(
+                        payload, {"Stripe-Signature": sign(payload, secret)}
+                    )
+                except (
+                    OSError,
+                    asyncio.TimeoutError,
+                    asyncio.IncompleteReadError,
+                    ValueError,
+                ) as error:
+                    errors[type(error).__name__] += 1
+                    continue
+                if status >= 400:
+                    errors[f"HTTP {status}"] += 1
+                else:
+                    latencies.append(time.perf_counter() - due)
+        finally:
+            connection.close()
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    return report(url, requests, time.perf_counter() - started, latencies, errors)
+
+
+def report(
+    url: str, requests: int, duration: float, latencies: list, errors: Counter
+) -> dict:
+    """
+    :param latencies: The latencies of the successful requests, in seconds.
+    :param errors: The number of failed requests by status code or exception.
+    :return: The throughput, the latencies in milliseconds, and the errors.
+    """
+    latencies = sorted(latency * 1000 for latency in latencies)
+    return {
+        "url": url,
+        "requests": requests,
+        "succeeded": len(latencies),
+        "failed": sum(errors.values()),
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 1) if duration else 0.0,
+        "latency_ms": {
+            "min": round(latencies[0], 2) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+        },
+        "errors": dict(errors.most_common()),
+    }
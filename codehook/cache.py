@@ -0,0 +1,195 @@
+import base64
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+CODEHOOK_HOME = Path(os.getenv("CODEHOOK_HOME", Path.home() / ".codehook"))
+DEFAULT_CACHE_MAX_SIZE = 512 * 1024 * 1024  # 512 MB
+
+# Files that are produced by running the code locally and never affect a build
+IGNORED_NAMES = {"__pycache__", ".DS_Store"}
+IGNORED_SUFFIXES = {".pyc", ".pyo"}
+
+
+class BuildCache:
+    """
+    A local, content-addressed store of Lambda deployment packages.
+
+    Every package is stored under a key derived from all the inputs of a build: the
+    handler source, the skeleton files, the requirements and the target runtime.
+    Builds with the same inputs reuse the stored package instead of reinstalling the
+    dependencies and zipping the files again. When the cache grows over its maximum
+    size, the least recently used packages are evicted first.
+    """
+
+    def __init__(self, path: Path = None, max_size: int = None):
+        """
+        Initializes a new instance of the BuildCache class.
+
+        Args:
+            path (Path, optional): The directory holding the cached packages.
+                Defaults to $CODEHOOK_CACHE_DIR or ~/.codehook/cache.
+            max_size (int, optional): The maximum size of the cache in bytes.
+                Defaults to $CODEHOOK_CACHE_MAX_SIZE or 512 MB.
+        """
+        self.path = Path(
+            path or os.getenv("CODEHOOK_CACHE_DIR", CODEHOOK_HOME / "cache")
+        )
+        self.max_size = int(
+            max_size or os.getenv("CODEHOOK_CACHE_MAX_SIZE", DEFAULT_CACHE_MAX_SIZE)
+        )
+
+    @staticmethod
+    def compute_key(source_path, runtime: str, *options: str) -> str:
+        """
+        Computes the cache key of a build from the files in SOURCE_PATH and the runtime.
+
+        :param source_path: The directory with the skeleton, handler and requirements.
+        :param runtime: The Lambda runtime the package targets, e.g. python3.11.
+        :param options: Any other build options that change the package contents.
+        :return: The hex digest identifying the build.
+        """
+        directory = Path(source_path)
+        files = {
+            path.relative_to(directory).as_posix(): path
+            for path in directory.rglob("*")
+            if path.is_file()
+            and path.suffix not in IGNORED_SUFFIXES
+            and not IGNORED_NAMES.intersection(path.relative_to(directory).parts)
+        }
+        return BuildCache.compute_files_key(files, runtime, *options)
+
+    @staticmethod
+    def compute_files_key(files: dict, runtime: str, *options: str) -> str:
+        """
+        Computes the cache key of a build from a set of files and the runtime.
+
+        :param files: The path of each file by its name in the package.
+        :param runtime: The Lambda runtime the package targets, e.g. python3.11.
+        :param options: Any other build options that change the package contents.
+        :return: The hex digest identifying the build.
+        """
+        digest = hashlib.sha256()
+        for parameter in [runtime, *options]:
+            digest.update(parameter.encode() + b"\0")
+        for name in sorted(files):
+            # Hash the name too, so renaming a file changes the key
+            digest.update(b"\0" + name.encode() + b"\0")
+            digest.update(hashlib.sha256(Path(files[name]).read_bytes()).digest())
+        return digest.hexdigest()
+
+    def _artifact(self, key: str) -> Path:
+        return self.path / f"{key}.zip"
+
+    def get(self, key: str):
+        """
+        Retrieves a cached deployment package.
+
+        :param key: The cache key of the build.
+        :return: The deployment package, or None if it is not cached.
+        """
+        artifact = self._artifact(key)
+        try:
+            package = artifact.read_bytes()
+        except FileNotFoundError:
+            return None
+        # Bump the modification time, which is used as the recency for eviction
+        os.utime(artifact)
+        return package
+
+    def put(self, key: str, package: bytes):
+        """
+        Stores a deployment package and evicts old packages if the cache is too big.
+
+        :param key: The cache key of the build.
+        :param package: The deployment package in .zip format.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        artifact = self._artifact(key)
+        # Write to a temporary file first so that readers never see a partial package
+        with tempfile.NamedTemporaryFile(
+            dir=self.path, suffix=".partial", delete=False
+        ) as partial:
+            partial.write(package)
+        os.replace(partial.name, artifact)
+        self.prune()
+
+    def entries(self):
+        """
+        Lists the cached deployment packages, most recently used first.
+
+        :return: A list of (key, size in bytes, last used timestamp) tuples.
+        """
+        if not self.path.is_dir():
+            return []
+        entries = []
+        for artifact in self.path.glob("*.zip"):
+            stat = artifact.stat()
+            entries.append((artifact.stem, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2], reverse=True)
+
+    def size(self) -> int:
+        """
+        :return: The total size of the cached packages in bytes.
+        """
+        return sum(size for _, size, _ in self.entries())
+
+    def prune(self, max_size: int = None):
+        """
+        Evicts the least recently used packages until the cache fits in MAX_SIZE.
+
+        :param max_size: The size to shrink the cache to, in bytes. Defaults to the
+                         maximum size of the cache.
+        :return: The keys of the evicted packages.
+        """
+        max_size = self.max_size if max_size is None else max_size
+        total = 0
+        evicted = []
+        for key, size, _ in self.entries():
+            total += size
+            if total > max_size:
+                self._artifact(key).unlink(missing_ok=True)
+                evicted.append(key)
+        return evicted
+
+    def clear(self):
+        """
+        Removes every package from the cache.
+
+        :return: The keys of the removed packages.
+        """
+        return self.prune(max_size=0)
+
+
+def code_sha256(package: bytes) -> str:
+    """
+    Hashes a deployment package the way Lambda does for the CodeSha256 of a function,
+    so a package can be compared with the deployed code.
+
+    :param package: The deployment package in .zip format.
+    :return: The base64 encoded SHA-256 digest of the package.
+    """
+    return base64.b64encode(hashlib.sha256(package).digest()).decode()
+
+
+def format_size(size: int) -> str:
+    """
+    Formats a size in bytes for humans, e.g. 1.5 MB.
+    """
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} {unit}"
+        size /= 1024
+
+
+def format_age(timestamp: float) -> str:
+    """
+    Formats how long ago TIMESTAMP was, e.g. 3h ago.
+    """
+    seconds = int(time.time() - timestamp)
+    for unit, length in [("d", 86400), ("h", 3600), ("m", 60)]:
+        if seconds >= length:
+            return f"{seconds // length}{unit} ago"
+    return f"{seconds}s ago"
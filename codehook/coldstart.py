@@ -0,0 +1,255 @@
+"""
+Profiles the cold start of a function: its deployment package, and the layer with its
+dependencies, are unpacked the way Lambda unpacks them, and the handler module is
+imported by a fresh interpreter with -X importtime, which reports how long each module
+took to import. The interpreter is isolated from the site-packages of codehook, so a
+dependency missing from the package fails like it would on Lambda, and only the
+packages that the Lambda runtime provides are added to its path.
+"""
+
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import zipfile
+from importlib.util import find_spec
+from pathlib import Path
+
+# The module that Lambda imports on a cold start, see AWS.LAMBDA_HANDLER_NAME
+HANDLER_MODULE = "lambda_handler_rest"
+# The packages that the Python runtimes of Lambda provide, in /var/runtime
+RUNTIME_PACKAGES = ["boto3", "botocore", "s3transfer", "jmespath", "dateutil", "six"]
+# Like the variables of a deployed function, with placeholder secrets
+LAMBDA_ENVIRONMENT = {
+    "API_KEY": "sk_test_codehook_coldstart",
+    "ENDPOINT_SECRET": "whsec_codehook_coldstart",
+    "IDEMPOTENCY_TABLE": "codehook-idempotency",
+    "AWS_LAMBDA_FUNCTION_NAME": "codehook-coldstart",
+    "AWS_DEFAULT_REGION": "us-east-1",
+}
+# Printed before the handler module is imported, to tell its imports from the ones
+# of the interpreter itself
+MARKER = "codehook: importing the handler"
+
+SCRIPT = """
+import json, sys, time
+sys.path[:0] = {path!r}
+print({marker!r}, file=sys.stderr, flush=True)
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"init": time.perf_counter() - start}}))
+"""
+
+
+class ColdStartError(RuntimeError):
+    """
+    Raised when the handler module fails to import.
+    """
+
+
+class ImportNode:
+    """
+    A module imported on a cold start, and the modules it imported in turn.
+    """
+
+    def __init__(self, name: str, self_time: float, cumulative: float):
+        """
+        Initializes a new instance of the ImportNode class.
+
+        Args:
+            name (str): The name of the module.
+            self_time (float): The time spent importing the module itself, in seconds.
+            cumulative (float): The time spent importing the module and the modules it
+                imported, in seconds.
+        """
+        self.name = name
+        self.self_time = self_time
+        self.cumulative = cumulative
+        self.children = []
+
+    def ranked(self) -> list["ImportNode"]:
+        """
+        :return: The modules this module imported, slowest first.
+        """
+        return sorted(self.children, key=lambda node: node.cumulative, reverse=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "module": self.name,
+            "self_ms": round(self.self_time * 1000, 3),
+            "cumulative_ms": round(self.cumulative * 1000, 3),
+            "imports": [child.to_dict() for child in self.ranked()],
+        }
+
+
+class ColdStart:
+    """
+    The profile of a cold start.
+    """
+
+    def __init__(self, init: float, modules: list[ImportNode]):
+        """
+        Initializes a new instance of the ColdStart class.
+
+        Args:
+            init (float): The time it took to import the handler module, in seconds.
+            modules (list[ImportNode]): The modules imported by the handler module,
+                and the handler module itself.
+        """
+        self.init = init
+        self.modules = modules
+
+    def ranked(self) -> list[ImportNode]:
+        """
+        :return: The modules imported at the top level, slowest first.
+        """
+        return sorted(self.modules, key=lambda node: node.cumulative, reverse=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "init_ms": round(self.init * 1000, 3),
+            "imports": [node.to_dict() for node in self.ranked()],
+        }
+
+
+def parse_importtime(stderr: str) -> list[ImportNode]:
+    """
+    Parses the output of -X importtime into a tree. Each line is written once its
+    module is imported, after the modules it imported, and is indented by two spaces
+    per level of nesting:
+
+        import time:       120 |        120 |     _json
+        import time:       873 |        993 |   json.decoder
+        import time:       650 |       1643 | json
+
+    :param stderr: The output, from the MARKER on if it is there.
+    :return: The modules imported at the top level, in the order they were imported.
+    """
+    lines = stderr.splitlines()
+    if MARKER in lines:
+        lines = lines[lines.index(MARKER) + 1 :]
+    pending = []
+    for line in lines:
+        fields = line.removeprefix("import time:").split("|")
+        if not line.startswith("import time:") or len(fields) != 3:
+            continue
+        try:
+            self_time, cumulative = int(fields[0]), int(fields[1])
+        except ValueError:
+            # The header of the columns
+            continue
+        name = fields[2][1:]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        node = ImportNode(name.strip(), self_time / 1e6, cumulative / 1e6)
+        # The modules imported by this one are the ones just before it, nested deeper
+        while pending and pending[-1][0] > depth:
+            node.children.insert(0, pending.pop()[1])
+        pending.append((depth, node))
+    return [node for _, node in pending]
+
+
+def extract(package: bytes, path: Path):
+    """
+    Unpacks a package like Lambda does, keeping the permissions of its files.
+    """
+    with zipfile.ZipFile(io.BytesIO(package)) as zipped:
+        for info in zipped.infolist():
+            zipped.extract(info, path)
+            mode = info.external_attr >> 16
+            if mode and not info.is_dir():
+                os.chmod(Path(path) / info.filename, mode & 0o777)
+
+
+def link_runtime_packages(path: Path):
+    """
+    Links the packages that the Lambda runtime provides, from the installation of
+    codehook, into a directory. The ones that are not installed are left out.
+    """
+    Path(path).mkdir(parents=True, exist_ok=True)
+    for name in RUNTIME_PACKAGES:
+        spec = find_spec(name)
+        if spec is None:
+            continue
+        if spec.submodule_search_locations:
+            source = Path(list(spec.submodule_search_locations)[0])
+        else:
+            source = Path(spec.origin)
+        (Path(path) / source.name).symlink_to(source)
+
+
+def run(
+    package: bytes,
+    layer: bytes = None,
+    environment: dict = None,
+    timeout: float = 60,
+) -> ColdStart:
+    """
+    Profiles one cold start of a function, in a new interpreter.
+
+    :param package: The deployment package of the function.
+    :param layer: The layer with its dependencies, if any.
+    :param environment: The environment variables of the function, on top of
+                        LAMBDA_ENVIRONMENT.
+    :param timeout: How long to wait for the handler module to import, in seconds.
+    :return: The profile.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        task, opt, runtime = (
+            Path(root, "task"),
+            Path(root, "opt"),
+            Path(root, "runtime"),
+        )
+        extract(package, task)
+        if layer is not None:
+            extract(layer, opt)
+        link_runtime_packages(runtime)
+        # The order of the path of the Lambda runtimes
+        path = [str(task), str(opt / "python"), str(runtime)]
+        script = SCRIPT.format(path=path, marker=MARKER, module=HANDLER_MODULE)
+        env = {
+            "PATH": os.environ.get("PATH", ""),
+            **LAMBDA_ENVIRONMENT,
+            **(environment or {}),
+            "LAMBDA_TASK_ROOT": str(task),
+        }
+        # -I leaves out the environment, the user site and the working directory, and
+        # -S the site-packages, so the package only finds what it brings
+        result = subprocess.run(
+            [sys.executable, "-I", "-S", "-X", "importtime", "-c", script],
+            cwd=task,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+    if result.returncode != 0:
+        errors = [
+            line
+            for line in result.stderr.splitlines()
+            if not line.startswith("import time:") and line != MARKER
+        ]
+        raise ColdStartError("\n".join(errors[-20:]))
+    init = json.loads(result.stdout.splitlines()[-1])["init"]
+    return ColdStart(init, parse_importtime(result.stderr))
+
+
+def profile(
+    package: bytes, layer: bytes = None, environment: dict = None, runs: int = 3
+) -> ColdStart:
+    """
+    Profiles several cold starts of a function, as the first one may pay for reading
+    the files from disk.
+
+    :param package: The deployment package of the function.
+    :param layer: The layer with its dependencies, if any.
+    :param environment: The environment variables of the function.
+    :param runs: The number of cold starts.
+    :return: The profile of the cold start with the median init time.
+    """
+    cold_starts = sorted(
+        (run(package, layer, environment) for _ in range(runs)),
+        key=lambda cold_start: cold_start.init,
+    )
+    return cold_starts[(len(cold_starts) - 1) // 2]
@@ -1,16 +1,54 @@
+import ast
+import json
 import os
-import shutil
+import sys
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext, redirect_stdout
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from dotenv import load_dotenv
 from rich import print
-from rich.progress import Progress
+from rich.table import Table
 
-from .aws import AWS
+from . import tracing
+from .bundle import Bundle
+from .cache import CODEHOOK_HOME, BuildCache, code_sha256, format_age, format_size
+from .manifest import load_manifest
 from .model import CloudName, Events, SourceName
-from .sources.stripe import Stripe
-from .openai import LLMProxy
+from .pipeline import Pipeline
+from .state import StateStore, function_name
+from .throttle import Throttle
+
+# The cloud, source and LLM clients pull in heavy SDKs (boto3, stripe, openai), so
+# they are only imported and created when a command first needs them
+if TYPE_CHECKING:
+    from rich.progress import Progress
+
+    from .model import Cloud, Source
+    from .openai import LLMProxy
+
+SKELETONS_PATH = Path(__file__).parent / "skeletons"
+
+
+def imports_module(file: Path, module: str) -> bool:
+    """
+    Tells whether a Python file imports MODULE or one of its submodules, anywhere.
+    """
+    tree = ast.parse(Path(file).read_text())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and not node.level:
+            names = [node.module]
+        else:
+            continue
+        if any(name == module or name.startswith(module + ".") for name in names):
+            return True
+    return False
 
 
 class CodehookCore:
@@ -26,13 +64,66 @@ class CodehookCore:
             cloud (CloudName): The name of the cloud provider.
         """
         load_dotenv()
+        self.cloud_name = cloud
+        # Shared by every client, so concurrent deployments stay under the limits
+        self.throttle = Throttle()
         self.stripe_api_key = os.getenv("STRIPE_API_KEY")
-        self.stripe_wrapper = Stripe(self.stripe_api_key)
+        self.build_cache = BuildCache()
+        if cloud == CloudName.local:
+            from .local import LOCAL_HOME
+
+            # Local deployments are kept apart from the ones in the cloud
+            self.state = StateStore(LOCAL_HOME / "state.db")
+        else:
+            self.state = StateStore()
+
+        # Clients are created on first use, see the properties below
+        self._lock = threading.Lock()
+        self._cloud = None
+        self._stripe_wrapper = None
+        self._llm_proxy = None
+
+    @property
+    def cloud(self) -> "Cloud":
+        """
+        The client of the cloud provider, created on first use.
+        """
+        with self._lock:
+            if self._cloud is None:
+                if self.cloud_name == CloudName.local:
+                    from .local import LocalCloud
+
+                    self._cloud = LocalCloud(self.build_cache, self.throttle)
+                else:
+                    from .aws import AWS
+
+                    self._cloud = AWS(self.build_cache, self.throttle)
+        return self._cloud
+
+    @property
+    def stripe_wrapper(self) -> "Source":
+        """
+        The client of the Stripe source, created on first use.
+        """
+        with self._lock:
+            if self._stripe_wrapper is None:
+                from .sources.stripe import Stripe
+
+                self._stripe_wrapper = Stripe(self.stripe_api_key, self.throttle)
+        return self._stripe_wrapper
+
+    @property
+    def llm_proxy(self) -> "LLMProxy":
+        """
+        The client of the code generation LLM, created on first use.
+        """
+        with self._lock:
+            if self._llm_proxy is None:
+                from .openai import LLMProxy
 
-        self.cloud = AWS()
-        self.llm_proxy = LLMProxy()
+                self._llm_proxy = LLMProxy()
+        return self._llm_proxy
 
-    
     def create(
         self,
         command: str,
@@ -69,6 +160,9 @@ class CodehookCore:
         name: str,
         source: SourceName,
         enabled_events: list[Events],
+        progress: "Progress" = None,
+        lean: bool = False,
+        asynchronous: bool = False,
     ):
         """
         Deploys a serverless lambda function, api endpoint, and webhook endpoint in the source saas platform.
@@ -78,79 +172,477 @@ class CodehookCore:
             name (str): The name of the serverless endpoint.
             source (SourceName): The name of the source.
             enabled_events (list[Events]): The list of enabled events.
+            progress (Progress, optional): A running progress display to report to,
+                for when several deployments share one. Defaults to a new one.
+            lean (bool, optional): Flag indicating whether to use the lean skeleton of
+                the source, which starts faster as it doesn't import the source SDK.
+            asynchronous (bool, optional): Flag indicating whether the function only
+                verifies and enqueues the events, and acknowledges them right away,
+                while a worker function handles them from the queue.
 
         Returns:
             tuple: A tuple containing the name, API ID, API URL, and webhook ID.
+
+        Raises:
+            ValueError: If the function is asynchronous and the cloud has no queues.
         """
+        if asynchronous and self.cloud_name == CloudName.local:
+            raise ValueError("The local cloud has no queues, deploy without --async")
         events = [event.value for event in enabled_events]
         print(
             f"Creating a [blue]{source.value}[/blue] endpoint that listens to [blue]{events}[/blue] events..."
         )
 
-        print(f"Deploying [blue]{file}[/blue] as [blue]{name}[/blue] :rocket:")
-        with (
-            Progress(transient=True) as progress,
-            tempfile.TemporaryDirectory() as lambda_path,
-        ):
-            # Step 1: Move skeleton and supplied handler to temporary directory
-            task = progress.add_task(
-                "[blue]Creating codehook files[/blue] :writer:", total=300
-            )
-            print("Created temporary directory", lambda_path)
-            progress.update(task, advance=100)
+        from rich.progress import Progress
 
-            shutil.copytree(
-                "codehook/skeletons/stripe", lambda_path, dirs_exist_ok=True
-            )
-            print("Copied skeleton files to temporary directory", lambda_path)
-            progress.update(task, advance=100)
+        print(f"Deploying [blue]{file}[/blue] as [blue]{name}[/blue] :rocket:")
+        progress_display = (
+            nullcontext(progress) if progress else Progress(transient=True)
+        )
+        with progress_display as progress:
 
-            shutil.copy(file, lambda_path + "/handler.py")
-            print("Copied custom handler to temporary directory", lambda_path)
-            progress.update(task, advance=100)
+            def create_webhook(api, _):
+                if not self.cloud.public:
+                    print(
+                        f"The source can't reach {api[1]}, not creating a webhook "
+                        "endpoint. Send it events with codehook bench."
+                    )
+                    return None
+                # Link the webhook endpoint to the API URL
+                print("Configuring the webhook endpoint in the source")
+                webhook_id = self.stripe_wrapper.create_webhook(events, api[1])
+                print(f"Webhook endpoint {webhook_id} created")
+                return webhook_id
 
-            # Step 2: Deploy serverless function and API in the cloud
-            task = progress.add_task(
-                "[blue]Deploying serverless endpoint[/blue] :cloud:", total=500
+            # Each step starts as soon as the steps it requires are done. The IAM role
+            # and the API resources don't depend on the code, so they are set up
+            # while the package is built and the function becomes active.
+            pipeline = Pipeline()
+            pipeline.add_step("files", lambda: self.bundle_files(file, source, lean))
+            pipeline.add_step("role", self.cloud.get_role)
+            pipeline.add_step("layer", self.cloud.create_layer, ["files"])
+            pipeline.add_step("package", self.cloud.create_package, ["files"])
+            function_requires = ["files", "role", "layer", "package"]
+            if asynchronous:
+                # Events that arrive before the worker exists wait in the queue
+                pipeline.add_step(
+                    "queue", lambda role: self.cloud.create_queue(name, role), ["role"]
+                )
+                pipeline.add_step(
+                    "worker",
+                    lambda path, role, layer, package, queue: self.cloud.create_worker(
+                        name, path, queue, role, layer, package
+                    ),
+                    function_requires + ["queue"],
+                )
+                function_requires = function_requires + ["queue"]
+            pipeline.add_step(
+                "function",
+                lambda path, role, layer, package, queue=None: (
+                    self.cloud.create_function(name, path, role, layer, package, queue)
+                ),
+                function_requires,
             )
-            function_id = self.cloud.create_function(name, lambda_path)
-            progress.update(task, advance=300)
-
-            api_id, api_url = self.cloud.create_api(name, function_id)
-            progress.update(task, advance=200)
+            pipeline.add_step("api", lambda: self.cloud.prepare_api(name))
+            pipeline.add_step(
+                "integration", self.cloud.integrate_api, ["api", "function"]
+            )
+            # Events are deduplicated from the first one, so the webhook endpoint is
+            # only created once the store is ready
+            pipeline.add_step(
+                "idempotency", self.cloud.create_idempotency_store, ["role"]
+            )
+            pipeline.add_step("webhook", create_webhook, ["integration", "idempotency"])
 
-            # Step 3: Create webhook endpoint in the source
-            # Link the webhook endpoint to the API URL
             task = progress.add_task(
-                "[blue]Setting up endpoint in the source[/blue]", total=100
+                f"[blue]Deploying {name}[/blue] :cloud:",
+                total=len(pipeline.steps),
             )
-            print("Configuring the webhook endpoint in the source")
-            webhook_id = self.stripe_wrapper.create_webhook(events, api_url)
-            progress.update(task, advance=100)
-            print(f"Webhook endpoint {webhook_id} created")
+            with tracing.span(f"deploy {name}", "deploy"):
+                results = pipeline.run(on_step=lambda step: progress.advance(task))
+
+        api_id, api_url = results["integration"]
+        webhook_id = results["webhook"]
+        self.state.record(
+            name,
+            source=source.value,
+            function_arn=results["function"],
+            api_id=api_id,
+            api_url=api_url,
+            webhook_id=webhook_id,
+            code_hash=code_sha256(results["package"]),
+            queue_url=results.get("queue"),
+            worker_arn=results.get("worker"),
+        )
+        self.print_timings(pipeline)
 
         print("[bold green]Deployment complete[/bold green] :rocket:")
         print(f"Function name: [blue]{name}[/blue]")
         print(f"API ID: [blue]{api_id}[/blue]")
         print(f"Webhook URL: [blue]{api_url}[/blue]")
         print(f"Webhook ID: [blue]{webhook_id}[/blue]")
+        if asynchronous:
+            print(f"Queue URL: [blue]{results['queue']}[/blue]")
+            print(f"Worker ARN: [blue]{results['worker']}[/blue]")
 
         return name, api_id, api_url, webhook_id
 
-    def list(self):
+    def bundle_files(self, file: Path, source: SourceName, lean: bool = False):
+        """
+        Lays the supplied handler over the skeleton of the source, without copying
+        any files.
+
+        Args:
+            file (Path): The path to the handler file.
+            source (SourceName): The name of the source.
+            lean (bool, optional): Flag indicating whether to use the lean skeleton.
+                It has no dependencies, unless the handler imports the source SDK.
+
+        Returns:
+            Bundle: The files of the function.
+        """
+        skeleton = f"{source.value}_lean" if lean else source.value
+        files = {"handler.py": file}
+        # The SDK of each source is a package of the same name
+        if lean and imports_module(file, source.value):
+            print(f"The handler imports {source.value}, adding it to the dependencies")
+            files["requirements.txt"] = (
+                SKELETONS_PATH / source.value / "requirements.txt"
+            )
+        # The runtime shared by every skeleton, e.g. the request logging, comes first
+        return Bundle(SKELETONS_PATH / "common", SKELETONS_PATH / skeleton, files=files)
+
+    def copy_files(
+        self, file: Path, source: SourceName, lambda_path: str, lean: bool = False
+    ):
+        """
+        Copies the skeleton of the source and the supplied handler to a directory.
+
+        Args:
+            file (Path): The path to the handler file.
+            source (SourceName): The name of the source.
+            lambda_path (str): The directory to copy the files to.
+            lean (bool, optional): Flag indicating whether to copy the lean skeleton.
+                It has no dependencies, unless the handler imports the source SDK.
+
+        Returns:
+            str: The directory the files were copied to.
+        """
+        self.bundle_files(file, source, lean).write(lambda_path)
+        print("Copied skeleton and handler files to", lambda_path)
+        return lambda_path
+
+    def update(self, file: Path, name: str, source: SourceName, lean: bool = False):
+        """
+        Pushes the handler in FILE to an existing serverless function, keeping its API
+        endpoint and webhook endpoint. Nothing is uploaded if the code is unchanged.
+
+        Args:
+            file (Path): The path to the file to be deployed.
+            name (str): The name of the serverless endpoint.
+            source (SourceName): The name of the source.
+            lean (bool, optional): Flag indicating whether to use the lean skeleton.
+
+        Returns:
+            bool: True if the function was updated, False if it was up to date, or
+                None if there is no function with that name.
+        """
+        print(f"Updating [blue]{name}[/blue] with [blue]{file}[/blue] :rocket:")
+        with tracing.span(f"update {name}", "update"):
+            with tracing.span("files", "step"):
+                bundle = self.bundle_files(file, source, lean)
+            with tracing.span("package", "step"):
+                package = self.cloud.create_package(bundle)
+            with tracing.span("function", "step"):
+                updated = self.cloud.update_function(name, bundle, package)
+            deployment = self.state.get(name) or {"function_arn": name}
+            # The worker of an asynchronous deployment runs the same code
+            if updated is not None and deployment.get("worker_arn"):
+                with tracing.span("worker", "step"):
+                    worker_updated = self.cloud.update_function(
+                        deployment["worker_arn"], bundle, package
+                    )
+                updated = updated or bool(worker_updated)
+
+        if updated is not None:
+            self.state.record(
+                name,
+                source=source.value,
+                function_arn=deployment["function_arn"],
+                code_hash=code_sha256(package),
+            )
+
+        if updated is None:
+            print(
+                f"[bold red]There is no function named {name}.[/bold red] "
+                "Run [bold]codehook deploy[/bold] to create it."
+            )
+        elif updated:
+            print("[bold green]Update complete[/bold green] :rocket:")
+        else:
+            print("[bold green]Already up to date[/bold green]")
+
+        return updated
+
+    def deploy_many(self, manifest: Path, concurrency: int = 4):
+        """
+        Deploys every handler in a manifest, several at a time. Calls to each service
+        are throttled to stay under its limits, however many deployments run at once.
+
+        Args:
+            manifest (Path): The path to the TOML manifest listing the handlers.
+            concurrency (int, optional): The maximum number of deployments at once.
+
+        Returns:
+            list: A dict per handler with its name, status, duration, and either the
+                deployed API URL and webhook ID, or the error.
+        """
+        from rich.progress import Progress
+
+        handlers = load_manifest(manifest)
+        print(
+            f"Deploying [blue]{len(handlers)}[/blue] handlers from [blue]{manifest}[/blue], "
+            f"[blue]{concurrency}[/blue] at a time :rocket:"
+        )
+
+        def deploy_handler(handler):
+            started = time.perf_counter()
+            result = {"name": handler["name"], "file": handler["file"]}
+            try:
+                _, api_id, api_url, webhook_id = self.deploy(
+                    **handler, progress=progress
+                )
+                result.update(
+                    status="deployed",
+                    api_id=api_id,
+                    api_url=api_url,
+                    webhook_id=webhook_id,
+                )
+            except Exception as error:
+                print(
+                    f"[bold red]Couldn't deploy {handler['name']}: {error}[/bold red]"
+                )
+                result.update(status="failed", error=str(error))
+            result["duration"] = time.perf_counter() - started
+            return result
+
+        with (
+            Progress(transient=True) as progress,
+            ThreadPoolExecutor(max_workers=concurrency) as executor,
+        ):
+            # Each deployment traces in its own thread, under the current span
+            futures = [
+                tracing.run_in_context(executor, deploy_handler, handler)
+                for handler in handlers
+            ]
+            results = [future.result() for future in futures]
+
+        table = Table(title="Deployments")
+        table.add_column("Name", style="blue")
+        table.add_column("Status")
+        table.add_column("Duration", justify="right")
+        table.add_column("Webhook URL / Error")
+        for result in results:
+            deployed = result["status"] == "deployed"
+            table.add_row(
+                result["name"],
+                "[green]deployed[/green]" if deployed else "[red]failed[/red]",
+                f"{result['duration']:.2f}s",
+                result["api_url"] if deployed else result["error"],
+            )
+        print(table)
+
+        failed = sum(result["status"] == "failed" for result in results)
+        print(
+            f"[bold green]{len(results) - failed} deployed[/bold green], "
+            f"[bold red]{failed} failed[/bold red]"
+        )
+        return results
+
+    def print_timings(self, pipeline: Pipeline):
+        """
+        Prints how long each step of a pipeline took, marking the critical path.
+
+        Args:
+            pipeline (Pipeline): A pipeline that has run.
+        """
+        critical_path = pipeline.critical_path()
+        table = Table(title="Deployment steps")
+        table.add_column("Step", style="blue")
+        table.add_column("Start", justify="right")
+        table.add_column("Duration", justify="right")
+        table.add_column("Critical path", justify="center")
+        for step in sorted(pipeline.steps.values(), key=lambda step: step.started):
+            table.add_row(
+                step.name,
+                f"{step.started - pipeline.started:.2f}s",
+                f"{step.duration:.2f}s",
+                ":heavy_check_mark:" if step in critical_path else "",
+            )
+        print(table)
+        print(f"Total: {pipeline.finished - pipeline.started:.2f}s")
+
+    @contextmanager
+    def trace(self, name: str, path: Path = None, profile: bool = False):
+        """
+        Traces the commands run inside the context: their steps, the calls they make
+        to the cloud and the source, and their builds and waits.
+
+        Args:
+            name (str): The name of the traced command, for the default trace file.
+            path (Path, optional): The Chrome trace file to write the spans to.
+                Defaults to a file in ~/.codehook/traces when profiling.
+            profile (bool, optional): Flag indicating whether to print a summary of
+                the spans.
+        """
+        if path is None and not profile:
+            yield None
+            return
+        tracer = tracing.Tracer()
+        try:
+            with tracer.activate():
+                yield tracer
+        finally:
+            if profile:
+                self.print_profile(tracer)
+            path = path or CODEHOOK_HOME / "traces" / (
+                f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+            )
+            print(
+                f"Trace written to [blue]{tracer.write(path)}[/blue], "
+                "open it in chrome://tracing or https://ui.perfetto.dev"
+            )
+
+    def print_profile(self, tracer: "tracing.Tracer"):
+        """
+        Prints where the time went in a trace, by span name: the self time of a span
+        leaves out its children, so the spans with the most self time are the ones
+        to speed up.
+
+        Args:
+            tracer (Tracer): A tracer that recorded spans.
+        """
+        table = Table(title="Profile")
+        table.add_column("Span", style="blue")
+        table.add_column("Kind")
+        table.add_column("Calls", justify="right")
+        table.add_column("Total", justify="right")
+        table.add_column("Self", justify="right")
+        table.add_column("Max", justify="right")
+        table.add_column("Retries", justify="right")
+        table.add_column("Throttled", justify="right")
+        for row in tracer.summary():
+            table.add_row(
+                row["name"],
+                row["category"],
+                str(row["calls"]),
+                f"{row['total']:.2f}s",
+                f"{row['self']:.2f}s",
+                f"{row['max']:.2f}s",
+                str(row["retries"]) if row["retries"] else "",
+                f"{row['throttle_wait']:.2f}s" if row["throttle_wait"] >= 0.01 else "",
+            )
+        print(table)
+
+    def list(self, refresh: bool = False, json_output: bool = False):
         """
         Lists all codehook endpoints, lambda functions, and webhook endpoints.
+
+        By default they are read from the local state. With REFRESH, they are listed
+        from the cloud and the source instead, all at once, and the local state is
+        synced with them.
+
+        Args:
+            refresh (bool, optional): Flag indicating whether to list the resources
+                from the cloud and the source, and sync the local state.
+            json_output (bool, optional): Flag indicating whether to print the
+                resources as JSON, without any other output.
+
+        Returns:
+            tuple: A tuple containing the API IDs, function names, webhook IDs, and
+                queue URLs.
         """
-        print("Listing all codehook endpoints...")
-        endpoint_ids = self.cloud.list_apis()
+        if refresh:
+            # Each provider pages through its own listing, so they run side by side,
+            # one worker each, and the listing takes as long as the slowest one.
+            # The pages are not streamed out as they come: the state can only be
+            # reconciled with complete listings, and the output needs them too.
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                apis = executor.submit(self.cloud.list_apis)
+                functions = executor.submit(self.cloud.list_functions)
+                # Sources only have webhook endpoints for the APIs they can reach
+                webhooks = executor.submit(
+                    self.stripe_wrapper.list_webhooks if self.cloud.public else list
+                )
+                queues = executor.submit(self.cloud.list_queues)
+                endpoint_ids = apis.result()
+                lambda_ids = functions.result()
+                webhook_ids = webhooks.result()
+                queue_urls = queues.result()
+            changed = self.state.reconcile(
+                lambda_ids, endpoint_ids, webhook_ids, queue_urls
+            )
+            deployments = self.state.all()
+        else:
+            deployments = self.state.all()
+            endpoint_ids = [item["api_id"] for item in deployments if item["api_id"]]
+            lambda_ids = [item["name"] for item in deployments if item["function_arn"]]
+            lambda_ids += [
+                function_name(item["worker_arn"])
+                for item in deployments
+                if item["worker_arn"]
+            ]
+            webhook_ids = [
+                item["webhook_id"] for item in deployments if item["webhook_id"]
+            ]
+            queue_urls = [
+                item["queue_url"] for item in deployments if item["queue_url"]
+            ]
 
-        print("Listing all lambda functions...")
-        lambda_ids = self.cloud.list_functions()
+        if json_output:
+            output = {
+                "apis": endpoint_ids,
+                "functions": lambda_ids,
+                "webhooks": webhook_ids,
+                "queues": queue_urls,
+                "deployments": deployments,
+            }
+            sys.stdout.write(json.dumps(output, indent=2) + "\n")
+            return endpoint_ids, lambda_ids, webhook_ids, queue_urls
 
+        print("Listing all codehook endpoints...")
+        print(endpoint_ids or "[bold red]No codehook endpoints[/bold red]")
+        print("Listing all lambda functions...")
+        print(lambda_ids or "[bold red]No lambda functions[/bold red]")
         print("Listing all webhook endpoints...")
-        webhook_ids = self.stripe_wrapper.list_webhooks()
+        print(webhook_ids or "[bold red]No webhook endpoints[/bold red]")
+        if queue_urls:
+            print("Listing all queues...")
+            print(queue_urls)
+
+        if deployments:
+            table = Table(title="Deployments")
+            table.add_column("Name", style="blue")
+            table.add_column("Webhook URL")
+            table.add_column("Webhook ID")
+            table.add_column("Updated")
+            for item in deployments:
+                table.add_row(
+                    item["name"],
+                    item["api_url"] or "",
+                    item["webhook_id"] or "",
+                    format_age(item["updated_at"]),
+                )
+            print(table)
+        if refresh:
+            print(f"Synced the local state in {self.state.path}: {changed} changes")
+        else:
+            print(
+                f"From the local state in {self.state.path}. "
+                "Run with [bold]--refresh[/bold] to sync it with the cloud."
+            )
 
-        return endpoint_ids, lambda_ids, webhook_ids
+        return endpoint_ids, lambda_ids, webhook_ids, queue_urls
 
     def delete(
         self,
@@ -158,40 +650,311 @@ class CodehookCore:
         api_id: str = None,
         webhook_id: str = None,
         delete_all: bool = False,
+        name: str = None,
+        refresh: bool = False,
     ):
         """
-        Deletes a lambda function, API endpoint, and webhook endpoint.
+        Deletes a lambda function, API endpoint, and webhook endpoint. Only the
+        resources that are given are deleted. Deleting a deployment, by name or with
+        all the others, also deletes its queue and worker function, if it has any.
 
         Args:
             lambda_function_name (str, optional): The name of the lambda function to delete.
             api_id (str, optional): The ID of the API endpoint to delete.
             webhook_id (str, optional): The ID of the webhook endpoint to delete.
             delete_all (bool, optional): Flag indicating whether to delete all functions and endpoints.
+            name (str, optional): The name of a handler whose function, API endpoint,
+                and webhook endpoint to delete, as recorded in the local state.
+            refresh (bool, optional): Flag indicating whether to find all functions and
+                endpoints in the cloud and the source, instead of the local state.
         """
         if delete_all:
             print("[bold red]Deleting all functions and endpoints[/bold red]")
-            endpoint_ids, lambda_ids, webhook_ids = self.list()
-            for endpoint_id in endpoint_ids:
-                print(f"[bold red]Deleting [/bold red][blue]{api_id}[/blue]")
-                self.cloud.delete_api(endpoint_id)
-                print(f"[blue]{api_id}[/blue][bold green] deleted[/bold green]")
-            for lambda_id in lambda_ids:
-                print(f"[bold red]Deleting [/bold red][blue]{lambda_id}[/blue]")
-                self.cloud.delete_function(lambda_id)
-                print(f"[blue]{lambda_id}[/blue][bold green] deleted[/bold green]")
-            for webhook_id in webhook_ids:
-                print(f"[bold red]Deleting [/bold red][blue]{webhook_id}[/blue]")
-                self.stripe_wrapper.delete_webhook(webhook_id)
-                print(f"[blue]{webhook_id}[/blue][bold green] deleted[/bold green]")
+            if not refresh:
+                print(
+                    "[bold red]Only the deployments recorded in the local state "
+                    "are deleted.[/bold red] Run with [bold]--refresh[/bold] to "
+                    "also delete the ones deployed from elsewhere, e.g. from CI."
+                )
+            endpoint_ids, lambda_ids, webhook_ids, queue_urls = self.list(refresh)
+        elif name:
+            deployment = self.state.get(name)
+            if deployment is None:
+                print(
+                    f"[bold red]No deployment named {name} in the local state.[/bold red] "
+                    "Run [bold]codehook list --refresh[/bold] to sync it with the cloud."
+                )
+                return
+            print(f"[bold red]Deleting the {name} deployment[/bold red]")
+            endpoint_ids = [deployment["api_id"]] if deployment["api_id"] else []
+            lambda_ids = [name] if deployment["function_arn"] else []
+            if deployment["worker_arn"]:
+                lambda_ids.append(function_name(deployment["worker_arn"]))
+            webhook_ids = [deployment["webhook_id"]] if deployment["webhook_id"] else []
+            queue_urls = [deployment["queue_url"]] if deployment["queue_url"] else []
         else:
-            print(f"[bold red]Deleting [/bold red][blue]{api_id}[/blue]")
-            self.cloud.delete_api(api_id)
-            print(f"[blue]{api_id}[/blue][bold green] deleted[/bold green]")
-            print(f"[bold red]Deleting [/bold red][blue]{lambda_id}[/blue]")
-            self.cloud.delete_function(lambda_function_name)
-            print(f"[blue]{lambda_id}[/blue][bold green] deleted[/bold green]")
-            print(f"[bold red]Deleting [/bold red][blue]{webhook_id}[/blue]")
-            self.stripe_wrapper.delete_webhook(webhook_id)
-            print(f"[blue]{webhook_id}[/blue][bold green] deleted[/bold green]")
+            endpoint_ids = [api_id] if api_id else []
+            lambda_ids = [lambda_function_name] if lambda_function_name else []
+            webhook_ids = [webhook_id] if webhook_id else []
+            queue_urls = []
+
+        def delete_resource(delete, column, id):
+            print(f"[bold red]Deleting [/bold red][blue]{id}[/blue]")
+            delete(id)
+            self.state.forget(column, id)
+            print(f"[blue]{id}[/blue][bold green] deleted[/bold green]")
 
+        # API Gateway only allows one REST API deletion every 30 seconds, so the API
+        # deletions drain at that rate through the throttle in a lane of their own,
+        # while the functions, webhook endpoints and queues are deleted concurrently
+        # in the meantime, instead of waiting behind them for a worker.
+        api_deletions = [(self.cloud.delete_api, "api_id", id) for id in endpoint_ids]
+        deletions = (
+            [(self.cloud.delete_function, "function_arn", id) for id in lambda_ids]
+            + [
+                (self.stripe_wrapper.delete_webhook, "webhook_id", id)
+                for id in webhook_ids
+            ]
+            + [(self.cloud.delete_queue, "queue_url", id) for id in queue_urls]
+        )
+        failed = []
+        with (
+            ThreadPoolExecutor(max_workers=max(1, min(len(deletions), 16))) as executor,
+            ThreadPoolExecutor(max_workers=1) as api_executor,
+        ):
+            futures = {
+                executor.submit(delete_resource, delete, column, id): id
+                for delete, column, id in deletions
+            }
+            futures.update(
+                {
+                    api_executor.submit(delete_resource, delete, column, id): id
+                    for delete, column, id in api_deletions
+                }
+            )
+            for future in as_completed(futures):
+                if future.exception() is not None:
+                    failed.append(futures[future])
+                    print(
+                        f"[bold red]Couldn't delete {futures[future]}: "
+                        f"{future.exception()}[/bold red]"
+                    )
+
+        if failed:
+            print(
+                f"[bold red]{len(failed)} resources were not deleted: {failed}[/bold red]"
+            )
         print("[bold red]Deletion complete[/bold red]")
+
+    def bench(
+        self,
+        url: str = None,
+        name: str = None,
+        file: Path = None,
+        source: SourceName = SourceName.stripe,
+        lean: bool = False,
+        requests: int = 1000,
+        rate: float = 0,
+        concurrency: int = 10,
+        secret: str = None,
+        timeout: float = 10,
+    ):
+        """
+        Load tests an endpoint with signed events, and prints the report as JSON.
+
+        The endpoint is a URL, the deployment with NAME, or the handler in FILE
+        served on this machine with the skeleton of the source.
+
+        Args:
+            url (str, optional): The URL of the endpoint.
+            name (str, optional): The name of a deployed handler.
+            file (Path, optional): The path to a handler to serve locally.
+            source (SourceName, optional): The name of the source.
+            lean (bool, optional): Flag indicating whether to serve the handler with
+                the lean skeleton.
+            requests (int, optional): The number of events to send.
+            rate (float, optional): The number of events per second, 0 for no limit.
+            concurrency (int, optional): The number of requests in flight.
+            secret (str, optional): The endpoint secret to sign the events with.
+            timeout (float, optional): How long to wait for a response, in seconds.
+
+        Returns:
+            dict: The report, or None if there is no endpoint to load test.
+        """
+        import asyncio
+
+        from . import bench
+        from .server import serving
+
+        secret = secret or bench.DEFAULT_SECRET
+        options = dict(
+            requests=requests,
+            rate=rate,
+            concurrency=concurrency,
+            secret=secret,
+            timeout=timeout,
+        )
+        if file is not None:
+            with tempfile.TemporaryDirectory() as lambda_path:
+                # Stdout is left to the report
+                with redirect_stdout(sys.stderr):
+                    self.copy_files(file, source, lambda_path, lean)
+                with serving(lambda_path, {"ENDPOINT_SECRET": secret}) as local_url:
+                    result = asyncio.run(bench.run(local_url, **options))
+        else:
+            if url is None and name is not None:
+                url = (self.state.get(name) or {}).get("api_url")
+            if url is None:
+                print(
+                    "[bold red]No endpoint to load test.[/bold red] "
+                    "Give a --url, the --name of a deployment, or a --file to serve locally."
+                )
+                return None
+            result = asyncio.run(bench.run(url, **options))
+
+        sys.stdout.write(json.dumps(result, indent=2) + "\n")
+        return result
+
+    def coldstart(
+        self,
+        file: Path,
+        source: SourceName = SourceName.stripe,
+        lean: bool = False,
+        budget: float = None,
+        runs: int = 3,
+        top: int = 5,
+        threshold: float = 1,
+        json_output: bool = False,
+    ):
+        """
+        Profiles the cold start of a handler: its deployment package is built like
+        for a deployment, with its dependencies in a layer, and the handler module is
+        imported from them by a fresh interpreter, which times every import.
+
+        Prints the init time and the tree of the imports, slowest first.
+
+        Args:
+            file (Path): The path to the handler file.
+            source (SourceName, optional): The name of the source.
+            lean (bool, optional): Flag indicating whether to use the lean skeleton.
+            budget (float, optional): The longest init time allowed, in milliseconds.
+            runs (int, optional): The number of cold starts, the median one is shown.
+            top (int, optional): The number of imports shown under each module.
+            threshold (float, optional): The shortest import shown, in milliseconds.
+            json_output (bool, optional): Flag indicating whether to print the profile
+                as JSON, without any other output.
+
+        Returns:
+            dict: The profile, or None if the handler failed to import or the init
+                time is over the budget.
+        """
+        from . import coldstart
+        from .aws import Lambda
+
+        bundle = self.bundle_files(file, source, lean)
+        # Stdout is left to the report
+        with redirect_stdout(sys.stderr) if json_output else nullcontext():
+            package = Lambda.create_deployment_package(
+                bundle, self.build_cache, install_dependencies=False
+            )
+            layer = None
+            requirements_path = bundle.requirements_path
+            if requirements_path is not None and Lambda.has_requirements(
+                requirements_path
+            ):
+                layer = Lambda.build_dependencies_layer(
+                    requirements_path, self.build_cache
+                )
+        environment = {"API_KEY": self.stripe_api_key} if self.stripe_api_key else {}
+        try:
+            profile = coldstart.profile(package, layer, environment, runs)
+        except coldstart.ColdStartError as error:
+            print(f"[bold red]The handler failed to import:[/bold red]\n{error}")
+            return None
+
+        result = profile.to_dict()
+        init = profile.init * 1000
+        if json_output:
+            sys.stdout.write(json.dumps(result, indent=2) + "\n")
+        else:
+            self.print_imports(profile, top, threshold / 1000)
+            print(f"Init: [bold]{init:.1f} ms[/bold], the median of {runs} cold starts")
+        if budget is not None and init > budget:
+            print(
+                f"[bold red]The init time of {init:.1f} ms is over the budget of "
+                f"{budget:g} ms[/bold red]",
+                file=sys.stderr,
+            )
+            return None
+        return result
+
+    def print_imports(self, profile, top: int = 5, threshold: float = 0.001):
+        """
+        Prints the imports of a cold start as a tree, the slowest first under each
+        module. The others are summed up on one line.
+
+        Args:
+            profile (ColdStart): The profile of the cold start.
+            top (int, optional): The number of imports shown under each module.
+            threshold (float, optional): The shortest import shown, in seconds.
+        """
+        from rich.tree import Tree
+
+        def add(tree, nodes):
+            shown = [node for node in nodes[:top] if node.cumulative >= threshold]
+            for node in shown:
+                add(
+                    tree.add(
+                        f"[blue]{node.name}[/blue] {node.cumulative * 1000:.1f} ms "
+                        f"[dim](self {node.self_time * 1000:.1f} ms)[/dim]"
+                    ),
+                    node.ranked(),
+                )
+            hidden = nodes[len(shown) :]
+            if hidden:
+                total = sum(node.cumulative for node in hidden) * 1000
+                tree.add(f"[dim]{len(hidden)} more, {total:.1f} ms[/dim]")
+
+        tree = Tree(f"Imports of the handler, in {profile.init * 1000:.1f} ms")
+        add(tree, profile.ranked())
+        print(tree)
+
+    def cache(self, prune: bool = False, clear: bool = False, max_size: int = None):
+        """
+        Inspects and prunes the local cache of deployment packages.
+
+        Args:
+            prune (bool, optional): Flag indicating whether to evict the least recently
+                used packages until the cache fits in its maximum size.
+            clear (bool, optional): Flag indicating whether to remove every package.
+            max_size (int, optional): The size to prune the cache to, in bytes.
+
+        Returns:
+            list: The keys of the evicted packages.
+        """
+        evicted = []
+        if clear:
+            evicted = self.build_cache.clear()
+        elif prune:
+            evicted = self.build_cache.prune(max_size)
+        if evicted:
+            print(f"[bold red]Evicted {len(evicted)} cached packages[/bold red]")
+
+        entries = self.build_cache.entries()
+        if not entries:
+            print(f"[bold red]No cached packages in {self.build_cache.path}[/bold red]")
+            return evicted
+
+        table = Table(title=f"Build cache: {self.build_cache.path}")
+        table.add_column("Key", style="blue")
+        table.add_column("Size", justify="right")
+        table.add_column("Last used")
+        for key, size, last_used in entries:
+            table.add_row(key[:12], format_size(size), format_age(last_used))
+        print(table)
+        print(
+            f"Total: {format_size(self.build_cache.size())} "
+            f"of {format_size(self.build_cache.max_size)}"
+        )
+
+        return evicted
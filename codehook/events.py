@@ -0,0 +1,72 @@
+import ast
+from pathlib import Path
+
+from .model import Events
+
+
+def registered_patterns(file: Path) -> list[str]:
+    """
+    Finds the event patterns a handler file registers handlers for, with the @on
+    decorator of the skeletons' dispatch module, without running it.
+
+    :param file: The path of the handler file.
+    :return: The patterns, e.g. ["invoice.paid", "customer.*"], in the order they
+             are registered. Empty if the handler only defines handler_logic.
+    """
+    tree = ast.parse(Path(file).read_text())
+    patterns = []
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for decorator in node.decorator_list:
+            if not isinstance(decorator, ast.Call):
+                continue
+            func = decorator.func
+            name = (
+                func.attr
+                if isinstance(func, ast.Attribute)
+                else getattr(func, "id", None)
+            )
+            if name != "on":
+                continue
+            for arg in decorator.args:
+                if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                    patterns.append(arg.value)
+    return patterns
+
+
+def expand_pattern(pattern: str) -> list[Events]:
+    """
+    Turns a dispatch pattern into the events a webhook endpoint is enabled for.
+    Stripe doesn't accept prefixes, so they are expanded to every known event.
+
+    :param pattern: An event type, a prefix ending with ".*", or "*".
+    :return: The matching events.
+    :raises ValueError: If no known event matches the pattern.
+    """
+    if pattern == "*":
+        return [Events.all]
+    if pattern.endswith(".*"):
+        prefix = pattern[:-1]
+        events = [event for event in Events if event.value.startswith(prefix)]
+        if not events:
+            raise ValueError(f"No event matches {pattern}")
+        return events
+    return [Events(pattern)]
+
+
+def registered_events(file: Path) -> list[Events]:
+    """
+    :param file: The path of the handler file.
+    :return: The events the handler registers handlers for, to enable on its
+             webhook endpoint, or an empty list if it doesn't register any.
+    :raises ValueError: If a pattern matches no known event.
+    """
+    events = []
+    for pattern in registered_patterns(file):
+        for event in expand_pattern(pattern):
+            if event is Events.all:
+                return [Events.all]
+            if event not in events:
+                events.append(event)
+    return events
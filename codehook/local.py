@@ -0,0 +1,458 @@
+"""
+Runs the functions and APIs of codehook on this machine instead of in a cloud, for
+quick deploy loops and load tests without an AWS account.
+
+Functions are directories under ~/.codehook/local/functions, and APIs are JSON files
+under ~/.codehook/local/apis that route to them. A server process, started by the
+first deployment, serves every API at http://127.0.0.1:4777/{api_id}/codehook like
+API Gateway does, and runs each function in a pool of processes of its own. Each
+process imports the handler once and then handles requests, like a warm Lambda
+instance. Redeploying a function replaces its pool, and the server stops once there
+are no APIs left.
+
+    CODEHOOK_LOCAL_DIR          Where the functions and APIs are kept.
+    CODEHOOK_LOCAL_PORT         The port of the server. Default 4777.
+    CODEHOOK_LOCAL_CONCURRENCY  The processes per function. Default the CPU count.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import secrets
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
+
+from dotenv import load_dotenv
+from rich import print
+
+from .bundle import Bundle, build_package
+from .cache import CODEHOOK_HOME, BuildCache, code_sha256
+from .model import LOG_SETTINGS, Cloud
+from .server import FunctionServer, load_function
+from .throttle import Throttle
+
+LOCAL_HOME = Path(os.getenv("CODEHOOK_LOCAL_DIR", CODEHOOK_HOME / "local"))
+DEFAULT_PORT = 4777
+HOST = "127.0.0.1"
+API_BASE_PATH = "codehook"
+# How often the server checks whether any API is left, in seconds
+IDLE_CHECK_INTERVAL = 10
+FUNCTION_FILE = "function.json"
+
+
+def read_json(path: Path):
+    """
+    :return: The content of a JSON file, or None if it doesn't exist.
+    """
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return None
+
+
+def write_json(path: Path, content):
+    # Written aside and moved, so the server never reads a partial file
+    temporary = path.with_name(f".{path.name}.{secrets.token_hex(4)}")
+    temporary.write_text(json.dumps(content))
+    os.replace(temporary, path)
+
+
+class LocalCloud(Cloud):
+    """
+    A cloud on this machine. Functions run with the Python and the packages of this
+    environment, so their requirements are not installed.
+    """
+
+    public = False
+
+    def __init__(
+        self,
+        build_cache: BuildCache = None,
+        throttle: Throttle = None,
+        path: Path = None,
+        port: int = None,
+    ):
+        """
+        Initializes a new instance of the LocalCloud class.
+
+        Args:
+            build_cache (BuildCache, optional): The cache of deployment packages.
+            throttle (Throttle, optional): Unused, as nothing is rate limited locally.
+            path (Path, optional): Where the functions and APIs are kept.
+                Defaults to $CODEHOOK_LOCAL_DIR or ~/.codehook/local.
+            port (int, optional): The port of the server.
+                Defaults to $CODEHOOK_LOCAL_PORT or 4777.
+        """
+        super().__init__()
+        load_dotenv()
+        self.build_cache = build_cache or BuildCache()
+        self.path = Path(path or LOCAL_HOME)
+        self.port = int(port or os.getenv("CODEHOOK_LOCAL_PORT", DEFAULT_PORT))
+        self.functions_path = self.path / "functions"
+        self.apis_path = self.path / "apis"
+        self.functions_path.mkdir(parents=True, exist_ok=True)
+        self.apis_path.mkdir(parents=True, exist_ok=True)
+        self.stripe_api_key = os.getenv("STRIPE_API_KEY")
+        self.log_settings = {
+            variable: os.getenv(f"CODEHOOK_{variable}", default)
+            for variable, default in LOG_SETTINGS.items()
+        }
+        # The server this client started, if any
+        self.server_process = None
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://{HOST}:{self.port}"
+
+    def get_api_url(self, api_id: str) -> str:
+        return f"{self.url}/{api_id}/{API_BASE_PATH}"
+
+    def get_environment(self, namespace: str = None):
+        """
+        :param namespace: The name of the deployment, which scopes the IDs of the
+                          events it deduplicates.
+        :return: The environment variables of the functions.
+        """
+        variables = {"API_KEY": self.stripe_api_key or "", **self.log_settings}
+        # Lets codehook bench sign events that the functions verify
+        if os.getenv("ENDPOINT_SECRET"):
+            variables["ENDPOINT_SECRET"] = os.getenv("ENDPOINT_SECRET")
+        if namespace:
+            variables["IDEMPOTENCY_NAMESPACE"] = namespace
+        return variables
+
+    def is_serving(self) -> bool:
+        try:
+            with socket.create_connection((HOST, self.port), timeout=0.5):
+                return True
+        except OSError:
+            return False
+
+    def start_server(self, timeout: float = 10):
+        """
+        Starts the server in the background, unless it is already running. It keeps
+        running after codehook exits, until the last API is deleted.
+        """
+        with self._lock:
+            if self.is_serving():
+                return
+            print(f"Starting the local server on {self.url}")
+            log = open(self.path / "server.log", "ab")
+            self.server_process = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "codehook.local",
+                    "--path",
+                    str(self.path),
+                    "--port",
+                    str(self.port),
+                ],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                start_new_session=True,
+            )
+            log.close()
+            deadline = time.monotonic() + timeout
+            while not self.is_serving():
+                if time.monotonic() > deadline:
+                    raise RuntimeError(
+                        f"The local server didn't start, see {self.path / 'server.log'}"
+                    )
+                time.sleep(0.05)
+
+    def get_role(self):
+        # Local functions run as the current user
+        return None
+
+    def create_layer(self, path: str):
+        if Bundle.of(path).requirements_path is not None:
+            print("The dependencies come from this Python environment")
+        return None
+
+    def create_package(self, path: str):
+        runtime = "local-python{}.{}".format(*sys.version_info[:2])
+        # Packages are only unpacked on this machine, so they are not compressed
+        return build_package(Bundle.of(path), self.build_cache, runtime, level=0)
+
+    def install(self, name: str, package: bytes, environment: dict):
+        """
+        Replaces the code of a function with a package. The server picks up the new
+        code on the next request, as function.json changes.
+        """
+        directory = self.functions_path / name
+        staging = self.functions_path / f".{name}.{secrets.token_hex(4)}"
+        with zipfile.ZipFile(io.BytesIO(package)) as zipped:
+            zipped.extractall(staging)
+        # The old code goes away with the server's pool, which already imported it
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+        write_json(
+            directory / FUNCTION_FILE,
+            {
+                "name": name,
+                "code_hash": code_sha256(package),
+                "environment": environment,
+            },
+        )
+
+    def create_function(
+        self,
+        name: str,
+        path: str,
+        role=None,
+        layer: str = None,
+        package: bytes = None,
+        queue: str = None,
+    ):
+        if queue is not None:
+            raise ValueError("The local cloud has no queues")
+        package = package or self.create_package(path)
+        print(f"Creating local function {name}")
+        self.install(name, package, self.get_environment(name))
+        print(f"Local function created: {self.functions_path / name}")
+        return name
+
+    def update_function(self, id: str, path: str, package: bytes = None):
+        configuration = read_json(self.functions_path / id / FUNCTION_FILE)
+        if configuration is None:
+            return None
+        package = package or self.create_package(path)
+        environment = self.get_environment(
+            configuration["environment"].get("IDEMPOTENCY_NAMESPACE") or id
+        )
+        code_hash = code_sha256(package)
+        if (
+            code_hash == configuration["code_hash"]
+            and environment == configuration["environment"]
+        ):
+            print(f"The code of {id} is up to date ({code_hash})")
+            return False
+        print(f"Installing new code in {id} ({code_hash})")
+        self.install(id, package, environment)
+        return True
+
+    def delete_function(self, id: str):
+        directory = self.functions_path / id
+        if not (directory / FUNCTION_FILE).exists():
+            raise FileNotFoundError(f"No local function named {id}")
+        shutil.rmtree(directory)
+
+    def list_functions(self):
+        return sorted(
+            directory.name
+            for directory in self.functions_path.iterdir()
+            if (directory / FUNCTION_FILE).exists()
+        )
+
+    def prepare_api(self, name: str):
+        api_id = secrets.token_hex(5)
+        print(f"Creating the {name} API for the local function")
+        write_json(self.apis_path / f"{api_id}.json", {"name": name, "function": None})
+        return api_id
+
+    def integrate_api(self, api, function_id: str):
+        api_file = self.apis_path / f"{api}.json"
+        write_json(api_file, {**read_json(api_file), "function": function_id})
+        self.start_server()
+        api_url = self.get_api_url(api)
+        print(f"Local API fully created, URL is :\n\t{api_url}")
+        return api, api_url
+
+    def create_api(self, name: str, function_id: str):
+        return self.integrate_api(self.prepare_api(name), function_id)
+
+    def delete_api(self, id: str):
+        (self.apis_path / f"{id}.json").unlink()
+
+    def list_apis(self):
+        return sorted(path.stem for path in self.apis_path.glob("*.json"))
+
+    def create_queue(self, name: str, role=None):
+        raise ValueError("The local cloud has no queues, deploy without --async")
+
+    def create_worker(
+        self,
+        name: str,
+        path: str,
+        queue: str,
+        role=None,
+        layer: str = None,
+        package: bytes = None,
+    ):
+        raise ValueError("The local cloud has no queues, deploy without --async")
+
+    def delete_queue(self, id: str):
+        raise ValueError("The local cloud has no queues")
+
+    def list_queues(self):
+        return []
+
+    def create_idempotency_store(self, role=None):
+        # Each process of a function deduplicates the events it handled
+        return None
+
+
+# The lambda handler of the function a pool process runs
+_lambda_handler = None
+
+
+def _load(path: str, environment: dict):
+    global _lambda_handler
+    os.environ.update(environment)
+    # Like the task directory of Lambda
+    os.chdir(path)
+    _lambda_handler = load_function(path)
+
+
+def _invoke(event: dict):
+    return _lambda_handler(event, None)
+
+
+class Router:
+    """
+    Routes the requests of the server to the function behind their API, each in a
+    pool of processes that is replaced when the function is redeployed.
+    """
+
+    def __init__(self, path: Path, concurrency: int = None):
+        self.path = Path(path)
+        self.concurrency = concurrency or os.cpu_count()
+        # Function name: (version, pool)
+        self.pools = {}
+        # API ID: (mtime, function name)
+        self.apis = {}
+
+    def function_of(self, api_id: str):
+        api_file = self.path / "apis" / f"{api_id}.json"
+        try:
+            mtime = api_file.stat().st_mtime_ns
+        except (FileNotFoundError, ValueError):
+            self.apis.pop(api_id, None)
+            return None
+        cached = self.apis.get(api_id)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, (read_json(api_file) or {}).get("function"))
+            self.apis[api_id] = cached
+        return cached[1]
+
+    def pool_of(self, name: str):
+        directory = self.path / "functions" / name
+        try:
+            version = (directory / FUNCTION_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            self.discard(name)
+            return None
+        current = self.pools.get(name)
+        if current is not None and current[0] == version:
+            return current[1]
+        self.discard(name)
+        configuration = read_json(directory / FUNCTION_FILE)
+        pool = ProcessPoolExecutor(
+            self.concurrency,
+            # Fresh processes, like Lambda instances, rather than copies of the server
+            mp_context=get_context("spawn"),
+            initializer=_load,
+            initargs=(str(directory), configuration["environment"]),
+        )
+        self.pools[name] = (version, pool)
+        return pool
+
+    def discard(self, name: str):
+        current = self.pools.pop(name, None)
+        if current is not None:
+            # Requests in flight finish on the old code
+            current[1].shutdown(wait=False)
+
+    def close(self):
+        for name in list(self.pools):
+            self.discard(name)
+
+    async def invoke(self, event: dict) -> dict:
+        # Like API Gateway: /{api_id}/codehook, and only POST
+        parts = event["path"].split("?")[0].strip("/").split("/")
+        name = None
+        if len(parts) == 2 and parts[1] == API_BASE_PATH:
+            if event["httpMethod"] == "POST":
+                name = self.function_of(parts[0])
+        if name is None:
+            return {
+                "statusCode": 403,
+                "headers": {"Content-Type": "application/json"},
+                "body": json.dumps({"message": "Missing Authentication Token"}),
+            }
+        pool = self.pool_of(name)
+        if pool is None:
+            raise FileNotFoundError(f"No local function named {name}")
+        event = {
+            **event,
+            "path": f"/{API_BASE_PATH}",
+            "resource": f"/{API_BASE_PATH}",
+            "requestContext": {"apiId": parts[0], "stage": "local"},
+        }
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                pool, _invoke, event
+            )
+        except BrokenProcessPool:
+            # A process died, e.g. the handler failed to import: start over
+            self.discard(name)
+            raise
+
+    def has_apis(self) -> bool:
+        return any((self.path / "apis").glob("*.json"))
+
+
+async def serve(path: Path, port: int, concurrency: int = None):
+    router = Router(path, concurrency)
+    server = await FunctionServer(router.invoke, HOST, port).start()
+    print(f"Listening on http://{HOST}:{server.port}", flush=True)
+    stopping = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+    try:
+        while router.has_apis() and not stopping.is_set():
+            try:
+                await asyncio.wait_for(stopping.wait(), IDLE_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        if not stopping.is_set():
+            print("No APIs left, stopping", flush=True)
+    finally:
+        await server.close()
+        router.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves the local codehook APIs")
+    parser.add_argument("--path", default=str(LOCAL_HOME))
+    parser.add_argument(
+        "--port", type=int, default=int(os.getenv("CODEHOOK_LOCAL_PORT", DEFAULT_PORT))
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.getenv("CODEHOOK_LOCAL_CONCURRENCY", 0)) or None,
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(Path(args.path), args.port, args.concurrency))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,17 @@
+import functools
 import os
 import os.path
 from pathlib import Path
 from typing import List, Optional
 
-import boto3
 import typer
 from dotenv import load_dotenv
 from rich import print
 from typing_extensions import Annotated
 
 from .core import CodehookCore
+from .events import registered_events
+from .manifest import ManifestError
 from .model import CloudName, Events, SourceName
 
 CODEHOOK_WELCOME_MESSAGE = """
@@ -32,14 +34,35 @@ Run [bold]codehook reconfigure[/bold] for instructions on setting up a new AWS a
 
 load_dotenv()
 app = typer.Typer()
-codehook_core = CodehookCore(CloudName.aws)
+# Set by the --cloud option of every command
+cloud_name = CloudName.aws
+
+
+@functools.cache
+def get_codehook_core() -> CodehookCore:
+    """
+    Creates the CodehookCore on first use, so that commands that don't need it, and
+    --help, don't pay for its setup.
+    """
+    return CodehookCore(cloud_name)
 
 
 @app.callback()
-def callback():
+def callback(
+    cloud: Annotated[
+        CloudName,
+        typer.Option(
+            case_sensitive=False,
+            envvar="CODEHOOK_CLOUD",
+            help="Where to deploy: aws, or local to run the handlers on this machine",
+        ),
+    ] = CloudName.aws,
+):
     """
     Webhook logic and infrastructure automated
     """
+    global cloud_name
+    cloud_name = cloud
 
 
 @app.command()
@@ -60,6 +83,8 @@ def configure():
         7. Boto2 config file (/etc/boto.cfg and ~/.boto)
         8. Instance metadata service on an Amazon EC2 instance that has an IAM role configured.
     """
+    import boto3
+
     print(CODEHOOK_CONFIGURED_MESSAGE) if boto3.resource("s3") else print(
         CODEHOOK_WELCOME_MESSAGE
     )
@@ -93,8 +118,8 @@ def create(
     Deploys the handler in FILE as a webhook handler for SOURCE, optionally with a custom --name.
     If no custom name is given, the handler will inherit the file name
     """
-    codehook_core.create(command, source, enabled_events) # Creates the handler.py function
-    codehook_core.deploy('handler.py', name, source, enabled_events)
+    get_codehook_core().create(command, source, enabled_events) # Creates the handler.py function
+    get_codehook_core().deploy('handler.py', name, source, enabled_events)
     os.remove('handler.py')
 
 
@@ -116,8 +141,38 @@ def deploy(
         SourceName, typer.Option(case_sensitive=False)
     ] = SourceName.stripe,
     enabled_events: Annotated[
-        Optional[List[Events]], typer.Option(case_sensitive=False)
-    ] = list(Events.all),
+        Optional[List[Events]],
+        typer.Option(
+            case_sensitive=False,
+            help="Defaults to the events the handler registers handlers for with @on, or all events",
+        ),
+    ] = None,
+    lean: Annotated[
+        bool,
+        typer.Option(
+            help="Use the lean skeleton, which starts faster as it doesn't import the source SDK"
+        ),
+    ] = False,
+    asynchronous: Annotated[
+        bool,
+        typer.Option(
+            "--async",
+            help="Acknowledge the events as soon as they are verified, and handle them from a queue in a worker function",
+        ),
+    ] = False,
+    profile: Annotated[
+        bool,
+        typer.Option(
+            help="Print how long each step, build and call to AWS took, and write a trace"
+        ),
+    ] = False,
+    trace: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help="Write a Chrome trace of the steps and calls to AWS to this file, to open in chrome://tracing or ui.perfetto.dev",
+        ),
+    ] = None,
 ):
     """
     This is the main command for codehook. Deploy takes a function and deploys it as a webhook handler,
@@ -129,16 +184,143 @@ def deploy(
     """
     if not name:
         name = os.path.splitext(os.path.basename(file))[0]
+    if not enabled_events:
+        try:
+            enabled_events = registered_events(file) or [Events.all]
+        except ValueError as error:
+            print(f"[bold red]{error}[/bold red]")
+            raise typer.Exit(code=1)
+
+    if asynchronous and cloud_name == CloudName.local:
+        print(
+            "[bold red]The local cloud has no queues, deploy without --async[/bold red]"
+        )
+        raise typer.Exit(code=2)
+    core = get_codehook_core()
+    with core.trace(f"deploy-{name}", trace, profile):
+        core.deploy(
+            file, name, source, enabled_events, lean=lean, asynchronous=asynchronous
+        )
+
+
+@app.command()
+def update(
+    file: Annotated[
+        Path,
+        typer.Option(
+            exists=True,
+            file_okay=True,
+            dir_okay=False,
+            writable=False,
+            readable=True,
+            resolve_path=True,
+        ),
+    ],
+    name: Annotated[str, typer.Option()] = None,
+    source: Annotated[
+        SourceName, typer.Option(case_sensitive=False)
+    ] = SourceName.stripe,
+    lean: Annotated[
+        bool,
+        typer.Option(
+            help="Use the lean skeleton, which starts faster as it doesn't import the source SDK"
+        ),
+    ] = False,
+    profile: Annotated[
+        bool,
+        typer.Option(
+            help="Print how long each step, build and call to AWS took, and write a trace"
+        ),
+    ] = False,
+    trace: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help="Write a Chrome trace of the steps and calls to AWS to this file, to open in chrome://tracing or ui.perfetto.dev",
+        ),
+    ] = None,
+):
+    """
+    Pushes a new version of a handler to an endpoint already deployed with codehook.
+    Only the function code changes: the API URL and the webhook endpoint stay the same.
+    Nothing is uploaded if the code didn't change.
+
+    If no custom --name is given, the handler will inherit the file name
+    """
+    if not name:
+        name = os.path.splitext(os.path.basename(file))[0]
+
+    core = get_codehook_core()
+    with core.trace(f"update-{name}", trace, profile):
+        updated = core.update(file, name, source, lean)
+    if updated is None:
+        raise typer.Exit(code=1)
+
+
+@app.command("deploy-many")
+def deploy_many(
+    manifest: Annotated[
+        Path,
+        typer.Option(
+            exists=True,
+            file_okay=True,
+            dir_okay=False,
+            readable=True,
+            resolve_path=True,
+            help="TOML manifest with a [[handler]] table per handler to deploy",
+        ),
+    ],
+    concurrency: Annotated[
+        int, typer.Option(min=1, help="Maximum number of deployments at once")
+    ] = 4,
+    profile: Annotated[
+        bool,
+        typer.Option(
+            help="Print how long each step, build and call to AWS took, and write a trace"
+        ),
+    ] = False,
+    trace: Annotated[
+        Optional[Path],
+        typer.Option(
+            dir_okay=False,
+            help="Write a Chrome trace of the steps and calls to AWS to this file, to open in chrome://tracing or ui.perfetto.dev",
+        ),
+    ] = None,
+):
+    """
+    Deploys every handler listed in a MANIFEST, several at a time.
 
-    codehook_core.deploy(file, name, source, enabled_events)
+    Each [[handler]] in the manifest has a file, and optionally a name, a source and a list of enabled_events.
+    Calls to AWS and to the source are throttled to stay under their rate limits.
+    """
+    try:
+        core = get_codehook_core()
+        with core.trace("deploy-many", trace, profile):
+            results = core.deploy_many(manifest, concurrency)
+    except ManifestError as error:
+        print(f"[bold red]{error}[/bold red]")
+        raise typer.Exit(code=2)
+    if any(result["status"] == "failed" for result in results):
+        raise typer.Exit(code=1)
 
 
 @app.command()
-def list():
+def list(
+    refresh: Annotated[
+        bool,
+        typer.Option(
+            help="List from the cloud and the source, and sync the local state"
+        ),
+    ] = False,
+    json_output: Annotated[
+        bool,
+        typer.Option("--json", help="Print the endpoints as JSON, for scripts"),
+    ] = False,
+):
     """
     List all the endpoints currently deployed by Codehook
     """
-    codehook_core.list()
+    get_codehook_core().list(refresh, json_output)
 
 
 @app.command()
@@ -151,11 +333,162 @@ def delete(
         str, typer.Option(help="Name of the Webhook Endpoint to delete")
     ] = None,
     delete_all: Annotated[bool, typer.Option("--all")] = False,
+    name: Annotated[
+        str,
+        typer.Option(help="Name of the handler whose endpoints to delete"),
+    ] = None,
+    refresh: Annotated[
+        bool,
+        typer.Option(
+            help="With --all, find the endpoints in the cloud instead of the local state"
+        ),
+    ] = False,
 ):
     """
     Delete the REST API, AWS Lambda function, and security role
     """
-    codehook_core.delete(lambda_function_name, api_id, webhook_id, delete_all)
+    get_codehook_core().delete(
+        lambda_function_name, api_id, webhook_id, delete_all, name, refresh
+    )
+
+
+@app.command()
+def bench(
+    url: Annotated[str, typer.Option(help="URL of the endpoint to load test")] = None,
+    name: Annotated[
+        str, typer.Option(help="Name of a deployed handler to load test")
+    ] = None,
+    file: Annotated[
+        Path,
+        typer.Option(
+            exists=True,
+            file_okay=True,
+            dir_okay=False,
+            readable=True,
+            resolve_path=True,
+            help="Handler to serve on this machine and load test, instead of an endpoint",
+        ),
+    ] = None,
+    source: Annotated[
+        SourceName, typer.Option(case_sensitive=False)
+    ] = SourceName.stripe,
+    lean: Annotated[
+        bool, typer.Option(help="Serve the --file with the lean skeleton")
+    ] = False,
+    requests: Annotated[
+        int, typer.Option(min=1, help="Number of events to send")
+    ] = 1000,
+    rate: Annotated[
+        float, typer.Option(min=0, help="Events per second, 0 for as fast as possible")
+    ] = 0,
+    concurrency: Annotated[
+        int, typer.Option(min=1, help="Maximum number of requests in flight")
+    ] = 10,
+    secret: Annotated[
+        str,
+        typer.Option(
+            envvar="ENDPOINT_SECRET",
+            help="Endpoint secret to sign the events with",
+        ),
+    ] = None,
+    timeout: Annotated[
+        float, typer.Option(min=0, help="Seconds to wait for each response")
+    ] = 10,
+):
+    """
+    Load tests a webhook endpoint with validly signed copies of the example event of the source.
+
+    Prints the throughput, the p50, p95 and p99 latencies and the errors as JSON.
+    """
+    if (
+        get_codehook_core().bench(
+            url,
+            name,
+            file,
+            source,
+            lean,
+            requests,
+            rate,
+            concurrency,
+            secret,
+            timeout,
+        )
+        is None
+    ):
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def coldstart(
+    file: Annotated[
+        Path,
+        typer.Option(
+            exists=True,
+            file_okay=True,
+            dir_okay=False,
+            readable=True,
+            resolve_path=True,
+            help="Handler to profile the cold start of",
+        ),
+    ],
+    source: Annotated[
+        SourceName, typer.Option(case_sensitive=False)
+    ] = SourceName.stripe,
+    lean: Annotated[
+        bool, typer.Option(help="Package the --file with the lean skeleton")
+    ] = False,
+    budget: Annotated[
+        float,
+        typer.Option(
+            min=0,
+            envvar="CODEHOOK_COLDSTART_BUDGET",
+            help="Fail if the init time is over this many milliseconds",
+        ),
+    ] = None,
+    runs: Annotated[
+        int, typer.Option(min=1, help="Number of cold starts, the median one is shown")
+    ] = 3,
+    top: Annotated[
+        int, typer.Option(min=1, help="Number of imports shown under each module")
+    ] = 5,
+    threshold: Annotated[
+        float, typer.Option(min=0, help="Shortest import shown, in milliseconds")
+    ] = 1,
+    json_output: Annotated[
+        bool,
+        typer.Option("--json", help="Print the profile as JSON, for scripts"),
+    ] = False,
+):
+    """
+    Profiles the cold start of a handler, from the package that deploy would upload.
+
+    Prints the time it takes to import the handler and the tree of its imports, slowest first.
+    """
+    if (
+        get_codehook_core().coldstart(
+            file, source, lean, budget, runs, top, threshold, json_output
+        )
+        is None
+    ):
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def cache(
+    prune: Annotated[
+        bool, typer.Option(help="Evict the least recently used packages")
+    ] = False,
+    clear: Annotated[bool, typer.Option(help="Remove every cached package")] = False,
+    max_size: Annotated[
+        int, typer.Option(help="Size in MB to prune the cache to")
+    ] = None,
+):
+    """
+    Inspect and prune the local cache of deployment packages
+    """
+    if max_size is not None:
+        max_size = max_size * 1024 * 1024
+    get_codehook_core().cache(prune, clear, max_size)
 
 
 if __name__ == "__main__":
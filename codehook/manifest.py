@@ -0,0 +1,78 @@
+import os
+import tomllib
+from pathlib import Path
+
+from .events import registered_events
+from .model import Events, SourceName
+
+
+class ManifestError(ValueError):
+    """
+    Raised when a manifest of handlers is malformed.
+    """
+
+
+def load_manifest(path: Path) -> list[dict]:
+    """
+    Loads a TOML manifest describing many handlers to deploy. Each handler is a
+    [[handler]] table with a file, and optionally a name, a source, a list of
+    enabled_events, lean, to use the lean skeleton, and async, to handle the events
+    from a queue once acknowledged. File paths are relative to the manifest. Without
+    enabled_events, the handler gets the events it registers handlers for with @on,
+    or all of them.
+
+        [[handler]]
+        file = "handlers/invoices.py"
+        name = "invoices"
+        enabled_events = ["invoice.paid", "invoice.payment_failed"]
+
+    :param path: The path of the manifest file.
+    :return: A list of handlers, each a dict with file, name, source,
+             enabled_events, lean and asynchronous keys, as accepted by
+             CodehookCore.deploy.
+    """
+    path = Path(path)
+    try:
+        with open(path, "rb") as manifest:
+            entries = tomllib.load(manifest).get("handler", [])
+    except tomllib.TOMLDecodeError as error:
+        raise ManifestError(f"Invalid manifest {path}: {error}") from error
+
+    handlers = []
+    names = set()
+    for index, entry in enumerate(entries):
+        if "file" not in entry:
+            raise ManifestError(f"Handler #{index + 1} in {path} has no file")
+        file = (path.parent / entry["file"]).resolve()
+        if not file.is_file():
+            raise ManifestError(f"Handler file {file} does not exist")
+
+        name = entry.get("name") or os.path.splitext(file.name)[0]
+        if name in names:
+            raise ManifestError(f"Handler name {name} is used more than once")
+        names.add(name)
+
+        try:
+            source = SourceName(entry.get("source", SourceName.stripe.value))
+            if "enabled_events" in entry:
+                enabled_events = [Events(event) for event in entry["enabled_events"]]
+            else:
+                enabled_events = registered_events(file) or [Events.all]
+        except ValueError as error:
+            raise ManifestError(f"Handler {name}: {error}") from error
+
+        handlers.append(
+            {
+                "file": file,
+                "name": name,
+                "source": source,
+                "enabled_events": enabled_events,
+                "lean": bool(entry.get("lean", False)),
+                "asynchronous": bool(entry.get("async", False)),
+            }
+        )
+
+    if not handlers:
+        raise ManifestError(f"No [[handler]] entries in {path}")
+
+    return handlers
@@ -216,27 +216,75 @@ class Events(str, Enum):
 
 class CloudName(str, Enum):
     aws = "aws"
+    local = "local"
+
+
+# The logging settings of the functions and their defaults, which can be overridden
+# with CODEHOOK_<SETTING> environment variables when deploying
+LOG_SETTINGS = {
+    "LOG_LEVEL": "INFO",
+    "LOG_SAMPLE_RATE": "1",
+    "LOG_MAX_LENGTH": "2048",
+    "LOG_REDACT": "stripe-signature,authorization,cookie,x-api-key",
+}
+
 
 class Cloud:
     """
     Represents a cloud service provider.
 
     Methods:
+    - get_role: Gets the identity that functions run as, creating it if needed.
+    - create_layer: Creates or reuses a shared layer with the function dependencies.
+    - create_package: Creates the deployment package of a function.
     - create_function: Creates a new function in the cloud.
     - update_function: Updates an existing function in the cloud.
     - delete_function: Deletes a function from the cloud.
     - list_functions: Lists all functions available in the cloud.
+    - prepare_api: Creates a new API in the cloud, not yet linked to a function.
+    - integrate_api: Links an API created by prepare_api to a function.
     - create_api: Creates a new API in the cloud.
     - delete_api: Deletes an API from the cloud.
     - list_apis: Lists all APIs available in the cloud.
+    - create_queue: Creates a queue for the events a function acknowledges.
+    - create_worker: Creates a function that handles the events of a queue.
+    - delete_queue: Deletes a queue from the cloud.
+    - list_queues: Lists all queues available in the cloud.
+    - create_idempotency_store: Creates or reuses the store that deduplicates events.
+
+    The path of a function is either a directory with all its files or a Bundle of
+    its skeleton and handler.
+
+    Attributes:
+    - public: Whether sources can reach the APIs, to deliver events to them.
     """
+
+    public = True
+
     def __init__(self):
         pass
     
-    def create_function(self, name: str, path: str):
+    def get_role(self):
         pass
 
-    def update_function(self, id: str, path: str):
+    def create_layer(self, path: str):
+        pass
+
+    def create_package(self, path: str):
+        pass
+
+    def create_function(
+        self,
+        name: str,
+        path: str,
+        role=None,
+        layer: str = None,
+        package: bytes = None,
+        queue: str = None,
+    ):
+        pass
+
+    def update_function(self, id: str, path: str, package: bytes = None):
         pass
 
     def delete_function(self, id: str):
@@ -245,6 +293,12 @@ class Cloud:
     def list_functions(self):
         pass
 
+    def prepare_api(self, name: str):
+        pass
+
+    def integrate_api(self, api, function_id: str):
+        pass
+
     def create_api(self, name: str, function_id: str):
         pass
 
@@ -254,6 +308,29 @@ class Cloud:
     def list_apis(self):
         pass
 
+    def create_queue(self, name: str, role=None):
+        pass
+
+    def create_worker(
+        self,
+        name: str,
+        path: str,
+        queue: str,
+        role=None,
+        layer: str = None,
+        package: bytes = None,
+    ):
+        pass
+
+    def delete_queue(self, id: str):
+        pass
+
+    def list_queues(self):
+        pass
+
+    def create_idempotency_store(self, role=None):
+        pass
+
 
 class SourceName(str, Enum):
     stripe = "stripe"
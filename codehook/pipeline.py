@@ -0,0 +1,142 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import tracing
+
+
+class Step:
+    """
+    A unit of work in a pipeline, which runs once all the steps it requires are done.
+    """
+
+    def __init__(self, name: str, func, requires: list[str]):
+        """
+        Initializes a new instance of the Step class.
+
+        Args:
+            name (str): The name of the step, unique in its pipeline.
+            func (callable): The work to do. It is called with the results of the
+                required steps as positional arguments, in the order they are listed.
+            requires (list[str]): The names of the steps this step depends on.
+        """
+        self.name = name
+        self.func = func
+        self.requires = requires
+        self.started = None
+        self.finished = None
+
+    @property
+    def duration(self) -> float:
+        """
+        :return: How long the step took to run, in seconds.
+        """
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class Pipeline:
+    """
+    A dependency graph of steps, run on a thread pool.
+
+    Every step starts as soon as the steps it requires are done, so independent steps
+    overlap and the total time is set by the slowest chain of dependent steps (the
+    critical path) instead of the sum of all steps.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        """
+        Initializes a new instance of the Pipeline class.
+
+        Args:
+            max_workers (int, optional): The maximum number of steps running at once.
+        """
+        self.max_workers = max_workers
+        self.steps: dict[str, Step] = {}
+        self.results = {}
+        self.started = None
+        self.finished = None
+
+    def add_step(self, name: str, func, requires: list[str] = ()):
+        """
+        Adds a step to the pipeline. Required steps must be added before.
+
+        :param name: The name of the step.
+        :param func: The work to do, called with the results of the required steps.
+        :param requires: The names of the steps this step depends on.
+        :return: The new step.
+        """
+        if name in self.steps:
+            raise ValueError(f"Step {name} is already in the pipeline")
+        for required in requires:
+            if required not in self.steps:
+                raise ValueError(f"Step {name} requires unknown step {required}")
+        step = Step(name, func, list(requires))
+        self.steps[name] = step
+        return step
+
+    def _run_step(self, step: Step):
+        step.started = time.perf_counter()
+        try:
+            with tracing.span(step.name, "step"):
+                return step.func(
+                    *[self.results[required] for required in step.requires]
+                )
+        finally:
+            step.finished = time.perf_counter()
+
+    def run(self, on_step=None):
+        """
+        Runs every step in the pipeline. If a step fails, no new steps are started,
+        the running ones are waited for, and the error is raised.
+
+        :param on_step: An optional callback, called with each step once it is done.
+        :return: A dict with the result of every step, by name.
+        """
+        self.results = {}
+        pending = dict(self.steps)
+        running = {}
+        self.started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                while pending or running:
+                    for name, step in list(pending.items()):
+                        if all(required in self.results for required in step.requires):
+                            # The spans of the step nest in the caller's
+                            future = tracing.run_in_context(
+                                executor, self._run_step, step
+                            )
+                            running[future] = step
+                            del pending[name]
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        step = running.pop(future)
+                        self.results[step.name] = future.result()
+                        if on_step:
+                            on_step(step)
+            finally:
+                self.finished = time.perf_counter()
+
+        return self.results
+
+    def critical_path(self) -> list[Step]:
+        """
+        Finds the chain of dependent steps that finished last, which is the one that
+        set the duration of the pipeline.
+
+        :return: The steps in the critical path, in the order they ran.
+        """
+        finished = [step for step in self.steps.values() if step.finished is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda step: step.finished)]
+        while path[-1].requires:
+            path.append(
+                max(
+                    (self.steps[required] for required in path[-1].requires),
+                    key=lambda step: step.finished,
+                )
+            )
+        return list(reversed(path))
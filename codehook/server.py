@@ -0,0 +1,203 @@
+"""
+Serves a function built from a skeleton over HTTP on this machine, the way API
+Gateway and Lambda run it in the cloud: every request is turned into an API Gateway
+proxy event for lambda_handler, and its response back into an HTTP response.
+
+    python -m codehook.server PATH [--host HOST] [--port PORT]
+
+PATH is a directory with the skeleton and the handler, as copied by
+CodehookCore.copy_files. The server prints the URL it listens on once it is ready.
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import subprocess
+import sys
+from contextlib import contextmanager
+from http import HTTPStatus
+
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+
+def load_function(path: str, module: str = "lambda_handler_rest"):
+    """
+    Imports the lambda handler of a function directory in this process.
+
+    :param path: The directory with the skeleton and the handler.
+    :param module: The module of the lambda handler.
+    :return: The lambda_handler function.
+    """
+    sys.path.insert(0, str(path))
+    return importlib.import_module(module).lambda_handler
+
+
+def proxy_event(method: str, path: str, headers: dict, body: bytes) -> dict:
+    """
+    :return: The event API Gateway sends to Lambda for a request, with the fields
+             the skeletons use.
+    """
+    return {
+        "httpMethod": method,
+        "path": path,
+        "headers": headers,
+        "body": body.decode("utf-8"),
+        "isBase64Encoded": False,
+    }
+
+
+class FunctionServer:
+    """
+    An HTTP/1.1 server, with keep-alive connections, that hands each request to a
+    function as an API Gateway proxy event.
+    """
+
+    def __init__(self, invoke, host: str = "127.0.0.1", port: int = 0):
+        """
+        Initializes a new instance of the FunctionServer class.
+
+        Args:
+            invoke (callable): An async function that takes a proxy event and
+                returns the response of the lambda handler.
+            host (str, optional): The address to listen on.
+            port (int, optional): The port to listen on, or 0 for any free port.
+        """
+        self.invoke = invoke
+        self.host = host
+        self.port = port
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/codehook"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.serve, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip()] = value.strip()
+                lowered = {name.lower(): value for name, value in headers.items()}
+                length = int(lowered.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, {}, b"", close=True)
+                    break
+                body = await reader.readexactly(length)
+
+                try:
+                    response = await self.invoke(
+                        proxy_event(method, path, headers, body)
+                    )
+                    status = response["statusCode"]
+                    response_headers = response.get("headers") or {}
+                    response_body = (response.get("body") or "").encode("utf-8")
+                except Exception as error:
+                    # Like API Gateway when the function fails
+                    status, response_headers = 502, {}
+                    response_body = json.dumps(
+                        {"message": "Internal server error", "error": repr(error)}
+                    ).encode()
+
+                close = lowered.get("connection", "").lower() == "close"
+                await self.respond(
+                    writer, status, response_headers, response_body, close
+                )
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, headers, body, close=False):
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ""
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append(f"Content-Length: {len(body)}")
+        if close:
+            lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+@contextmanager
+def serving(path: str, environment: dict = None, timeout: float = 30):
+    """
+    Serves a function directory from another process, so that its modules and
+    environment variables don't leak into this one.
+
+    :param path: The directory with the skeleton and the handler.
+    :param environment: The environment variables of the function.
+    :param timeout: How long to wait for the server to stop, in seconds.
+    :return: A context manager that yields the URL of the function.
+    """
+    process = subprocess.Popen(
+        [sys.executable, "-m", "codehook.server", str(path)],
+        env={**os.environ, **(environment or {})},
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        # The server prints its URL once it listens, after the handler is imported
+        line = process.stdout.readline()
+        if not line.startswith("Listening on "):
+            raise RuntimeError(f"The function in {path} failed to start")
+        yield line.split()[-1]
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        process.stdout.close()
+
+
+async def serve_function(path: str, host: str, port: int):
+    lambda_handler = load_function(path)
+
+    async def invoke(event):
+        return lambda_handler(event, None)
+
+    server = await FunctionServer(invoke, host, port).start()
+    print(f"Listening on {server.url}", flush=True)
+    async with server.server:
+        await server.server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", help="The directory with the skeleton and handler")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve_function(args.path, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
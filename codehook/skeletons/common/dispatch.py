@@ -0,0 +1,130 @@
+"""
+Routes events to the handlers registered for their type, instead of one
+handler_logic that branches on it.
+
+    from dispatch import on
+
+    @on("invoice.paid")
+    def invoice_paid(event):
+        return (200, "Invoice paid")
+
+    @on("customer.subscription.*", "customer.created")
+    def customer_changed(event):
+        return (200, "Customer changed")
+
+A pattern is an event type, a prefix ending with ".*", or "*" for every event. The
+exact type wins over prefixes, and longer prefixes over shorter ones. Events that
+no handler is registered for are acknowledged with a 200 and never decoded. When
+no handler is registered at all, every event goes to handler_logic.
+
+codehook deploy subscribes the endpoint to the registered patterns only, unless
+--enabled-events is given.
+"""
+
+import re
+
+# Stripe events have their type either last, or before their data. A "type" key
+# right before the closing brace of the payload, or before the first nested object
+# or array, is the type of the event and not of an object inside it.
+TRAILING_TYPE = re.compile(r'"type"\s*:\s*"([^"\\]+)"\s*}\s*$')
+LEADING_TYPE = re.compile(r'"type"\s*:\s*"([^"\\]+)"')
+# How far from the ends of the payload the type is looked for
+PEEK_LENGTH = 512
+
+
+class Registry:
+    def __init__(self):
+        # Exact types, and prefixes with their trailing dot ("" matches every type)
+        self.types = {}
+        self.prefixes = {}
+
+    def __bool__(self):
+        return bool(self.types or self.prefixes)
+
+    def on(self, *patterns):
+        """
+        Registers the decorated function as the handler of the events matching
+        the patterns. It is called like handler_logic, with the event.
+        """
+
+        def register(func):
+            for pattern in patterns:
+                if pattern == "*":
+                    self.prefixes[""] = func
+                elif pattern.endswith(".*"):
+                    self.prefixes[pattern[:-1]] = func
+                else:
+                    self.types[pattern] = func
+            return func
+
+        return register
+
+    def resolve(self, event_type):
+        """
+        :return: The handler of an event type, or None if it has none.
+        """
+        func = self.types.get(event_type)
+        if func is not None:
+            return func
+        # One lookup per level of the type, from the most specific prefix
+        end = len(event_type)
+        while end > 0:
+            end = event_type.rfind(".", 0, end)
+            if end > 0:
+                func = self.prefixes.get(event_type[: end + 1])
+                if func is not None:
+                    return func
+        return self.prefixes.get("")
+
+    def handle(self, event):
+        """
+        Runs the handler of the event, or acknowledges it if it has none.
+        """
+        func = self.resolve(event["type"])
+        if func is None:
+            return (200, f"No handler for {event['type']}")
+        return func(event)
+
+
+registry = Registry()
+on = registry.on
+
+
+def peek_type(payload):
+    """
+    Reads the type of an event from the ends of its raw payload, without decoding it.
+
+    :param payload: The payload, as bytes or a string.
+    :return: The type of the event, or None if it isn't where Stripe puts it.
+    """
+    head, tail = payload[1:PEEK_LENGTH], payload[-PEEK_LENGTH:]
+    if isinstance(payload, bytes):
+        head = head.decode("utf-8", "replace")
+        tail = tail.decode("utf-8", "replace")
+    match = TRAILING_TYPE.search(tail)
+    if match:
+        return match.group(1)
+    nested = [index for index in (head.find("{"), head.find("[")) if index != -1]
+    match = LEADING_TYPE.search(head[: min(nested)] if nested else "")
+    return match.group(1) if match else None
+
+
+def ignores(payload) -> bool:
+    """
+    Tells whether an event can be acknowledged without being decoded, as handlers
+    are registered but none for its type.
+    """
+    if not registry:
+        return False
+    event_type = peek_type(payload)
+    return event_type is not None and registry.resolve(event_type) is None
+
+
+def handle(handler, event):
+    """
+    Runs the handler registered for the type of the event, or the handler_logic of
+    the handler module if no handler is registered.
+    """
+    if registry:
+        return registry.handle(event)
+    return handler.handler_logic(event)
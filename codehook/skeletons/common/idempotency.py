@@ -0,0 +1,155 @@
+"""
+Deduplicates the events a source delivers more than once, by their ID.
+
+Stripe retries the deliveries it didn't get a 2xx response for, and may deliver an
+event twice anyway. The responses of the events that were handled are kept in an
+LRU cache, which lasts as long as the warm function, in front of a store shared by
+every instance of the function: a DynamoDB table that expires them after a while,
+or the local process when there is no table. A duplicate gets the response of the
+first delivery without running the handler again. Failed events (5xx) are not
+recorded, so they are handled again when they are retried.
+
+Two deliveries of the same event that run at the very same time may both be
+handled, as the response is recorded once the handler is done.
+
+    IDEMPOTENCY_TABLE      The DynamoDB table, set on deployment. When it is not set,
+                           events are only deduplicated within the process.
+    IDEMPOTENCY_NAMESPACE  Prefixes the event IDs, so deployments that get the same
+                           events from one account don't share responses.
+    IDEMPOTENCY_TTL        How long responses are kept, in seconds. Default 259200,
+                           the 3 days Stripe retries a delivery for.
+    IDEMPOTENCY_CACHE_SIZE The number of responses kept in memory. Default 1024.
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 3 * 24 * 3600
+DEFAULT_CACHE_SIZE = 1024
+
+
+class LocalStore:
+    """
+    Keeps the responses in the process, e.g. for tests and local runs.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self.responses = {}
+
+    def get(self, key):
+        response, expires_at = self.responses.get(key, (None, 0))
+        if expires_at < time.time():
+            self.responses.pop(key, None)
+            return None
+        return response
+
+    def put(self, key, response):
+        self.responses[key] = (response, time.time() + self.ttl)
+
+
+class DynamoDBStore:
+    """
+    Keeps the responses in a DynamoDB table with an "id" partition key, which
+    deletes them once their expires_at time passes.
+    """
+
+    def __init__(self, table_name, ttl=DEFAULT_TTL, client=None):
+        self.table_name = table_name
+        self.ttl = ttl
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Boto3 is provided by the Lambda runtime. It is imported on the first
+            # verified event, so requests that are rejected never pay for it.
+            import boto3
+
+            self._client = boto3.client("dynamodb")
+        return self._client
+
+    def get(self, key):
+        item = self.client.get_item(
+            TableName=self.table_name, Key={"id": {"S": key}}, ConsistentRead=True
+        ).get("Item")
+        # Expired items may linger until DynamoDB deletes them
+        if item is None or int(item["expires_at"]["N"]) < time.time():
+            return None
+        return json.loads(item["response"]["S"])
+
+    def put(self, key, response):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "id": {"S": key},
+                "response": {"S": json.dumps(response, default=str)},
+                "expires_at": {"N": str(int(time.time() + self.ttl))},
+            },
+        )
+
+
+class Idempotency:
+    def __init__(self, store, namespace="", cache_size=DEFAULT_CACHE_SIZE):
+        self.store = store
+        self.namespace = namespace
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Creates the deduplication configured by the IDEMPOTENCY_* environment variables.
+        """
+        ttl = int(os.getenv("IDEMPOTENCY_TTL", DEFAULT_TTL))
+        table_name = os.getenv("IDEMPOTENCY_TABLE")
+        store = DynamoDBStore(table_name, ttl) if table_name else LocalStore(ttl)
+        return cls(
+            store,
+            os.getenv("IDEMPOTENCY_NAMESPACE", ""),
+            int(os.getenv("IDEMPOTENCY_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+        )
+
+    def key(self, event):
+        """
+        :return: The key of an event, or None if it has no ID to deduplicate it by.
+        """
+        event_id = event.get("id") if isinstance(event, dict) else None
+        if not event_id:
+            return None
+        return f"{self.namespace}:{event_id}" if self.namespace else event_id
+
+    def lookup(self, event):
+        """
+        :return: The (response_code, response_body) of the first delivery of the
+                 event, or None if it wasn't handled yet.
+        """
+        key = self.key(event)
+        if key is None:
+            return None
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        response = self.store.get(key)
+        if response is not None:
+            response = tuple(response)
+            self._cache(key, response)
+        return response
+
+    def remember(self, event, response):
+        """
+        Records the response of a handled event, unless it failed.
+        """
+        key = self.key(event)
+        if key is None or response[0] >= 500:
+            return
+        self.store.put(key, list(response))
+        self._cache(key, tuple(response))
+
+    def _cache(self, key, response):
+        self.cache[key] = response
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
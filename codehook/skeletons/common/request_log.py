@@ -0,0 +1,93 @@
+"""
+Logs the requests and responses of the function, within a budget: only a sample of
+the invocations is logged, sensitive fields are redacted and long values are cut.
+It is configured with the environment variables that codehook sets on deployment.
+
+    LOG_LEVEL        The level of the logger, e.g. INFO, or WARNING to log no requests
+    LOG_SAMPLE_RATE  The share of invocations whose request and response are logged
+    LOG_MAX_LENGTH   The maximum length of a logged request or response, 0 for no limit
+    LOG_REDACT       Comma-separated names of the fields to redact, at any depth
+"""
+
+import json
+import logging
+import os
+
+DEFAULT_REDACT = "stripe-signature,authorization,cookie,x-api-key"
+REDACTED = "[REDACTED]"
+
+
+class RequestLogger:
+    def __init__(
+        self,
+        logger: logging.Logger,
+        sample_rate: float = 1.0,
+        max_length: int = 2048,
+        redact: str = DEFAULT_REDACT,
+    ):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.max_length = max_length
+        self.redact = {field.strip().lower() for field in redact.split(",")} - {""}
+
+    @classmethod
+    def from_env(cls, logger: logging.Logger = None):
+        """
+        Creates a logger configured by the LOG_* environment variables.
+        """
+        logger = logger or logging.getLogger()
+        logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        return cls(
+            logger,
+            float(os.getenv("LOG_SAMPLE_RATE", "1")),
+            int(os.getenv("LOG_MAX_LENGTH", "2048")),
+            os.getenv("LOG_REDACT", DEFAULT_REDACT),
+        )
+
+    def sample(self) -> bool:
+        """
+        Decides whether to log the current invocation. The decision is taken once
+        per invocation, so its request and response are logged together.
+        """
+        if not self.logger.isEnabledFor(logging.INFO):
+            return False
+        if self.sample_rate >= 1:
+            return True
+        if self.sample_rate <= 0:
+            return False
+        # Imported here, as it takes a few milliseconds of the cold start otherwise
+        import random
+
+        return random.random() < self.sample_rate
+
+    def redacted(self, value):
+        """
+        :return: A copy of VALUE with the fields to redact replaced, at any depth.
+        """
+        if isinstance(value, dict):
+            return {
+                key: (
+                    REDACTED if str(key).lower() in self.redact else self.redacted(item)
+                )
+                for key, item in value.items()
+            }
+        if isinstance(value, list):
+            return [self.redacted(item) for item in value]
+        return value
+
+    def format(self, value) -> str:
+        """
+        :return: VALUE redacted, as JSON, cut to the maximum length.
+        """
+        text = json.dumps(self.redacted(value), default=str, ensure_ascii=False)
+        if self.max_length and len(text) > self.max_length:
+            cut = len(text) - self.max_length
+            text = f"{text[:self.max_length]}... ({cut} more characters)"
+        return text
+
+    def log(self, message: str, value, sampled: bool):
+        """
+        Logs VALUE if the invocation was sampled. Nothing is formatted otherwise.
+        """
+        if sampled:
+            self.logger.info("%s: %s", message, self.format(value))
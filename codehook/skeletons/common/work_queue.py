@@ -0,0 +1,127 @@
+"""
+The queue between a function deployed with codehook deploy --async and its worker.
+
+The function verifies each event, sends it to the queue and acknowledges it right
+away, so the source never waits for the handler. The worker function is invoked by
+Lambda with batches of queued events, and runs the handler on them: all at once
+with handler_logic_batch(events), if the handler defines it, or one by one with
+handler_logic(body). Only the events the handler failed on are retried.
+
+    QUEUE_URL   The URL of the Amazon SQS queue, set on the function that enqueues.
+                Events are handled inline when it is not set.
+"""
+
+import logging
+import os
+
+import dispatch
+
+# SQS rejects larger messages, so bigger events are handled inline instead
+MAX_MESSAGE_SIZE = 256 * 1024
+
+logger = logging.getLogger()
+
+
+class WorkQueue:
+    def __init__(self, url, client=None):
+        if client is None:
+            # Boto3 is provided by the Lambda runtime, and only needed to enqueue
+            import boto3
+
+            client = boto3.client("sqs")
+        self.url = url
+        self.client = client
+
+    @classmethod
+    def from_env(cls):
+        """
+        :return: The queue of the function, or None if it handles events inline.
+        """
+        url = os.getenv("QUEUE_URL")
+        # The client is created on import, so the first request doesn't pay for it
+        return cls(url) if url else None
+
+    def accepts(self, payload) -> bool:
+        return len(payload) <= MAX_MESSAGE_SIZE
+
+    def send(self, payload):
+        """
+        Enqueues the raw payload of a verified event.
+        """
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8")
+        self.client.send_message(QueueUrl=self.url, MessageBody=payload)
+
+
+def run_handler(handler, events):
+    """
+    Runs the handler on a batch of events, with handler_logic_batch if the handler
+    defines it, or else with its handlers or handler_logic on each event. An error fails the events
+    it was raised for: the whole batch with handler_logic_batch, or a single event.
+
+    :param handler: The handler module.
+    :param events: The decoded events.
+    :return: A (response_code, response_body) tuple per event, in the same order.
+    """
+    handler_logic_batch = getattr(handler, "handler_logic_batch", None)
+    if handler_logic_batch is not None:
+        try:
+            results = list(handler_logic_batch(events))
+        except Exception as error:
+            logger.exception("The batch handler failed")
+            return [(500, str(error))] * len(events)
+        if len(results) != len(events):
+            logger.error(
+                "The batch handler returned %d results for %d events",
+                len(results),
+                len(events),
+            )
+            return [(500, "Missing results")] * len(events)
+        return results
+
+    results = []
+    for event in events:
+        try:
+            results.append(dispatch.handle(handler, event))
+        except Exception as error:
+            logger.exception("The handler failed")
+            results.append((500, str(error)))
+    return results
+
+
+def handle_batch(event, handler, decode, request_log, idempotency=None):
+    """
+    Handles a batch of messages Lambda polled from the queue, and reports the ones
+    the handler failed on, with a 5xx response code or an error. Only those are
+    returned to the queue and retried, as the event source mapping is set up with
+    ReportBatchItemFailures.
+
+    :param event: The event sent by Lambda to the worker, with the messages in Records.
+    :param handler: The handler module.
+    :param decode: Turns the payload of a message into the event the handler gets.
+    :param request_log: The RequestLogger of the worker.
+    :param idempotency: The Idempotency that deduplicates the events, as SQS may
+                        deliver a message more than once, if any.
+    :return: The response to Lambda, with the IDs of the failed messages.
+    """
+    records = event.get("Records", [])
+    sampled = request_log.sample()
+    events = [decode(record["body"]) for record in records]
+    # Events that were already handled get the response they had then
+    results = [idempotency and idempotency.lookup(event) for event in events]
+    pending = [index for index, result in enumerate(results) if result is None]
+    if pending:
+        handled = run_handler(handler, [events[index] for index in pending])
+        for index, result in zip(pending, handled):
+            results[index] = result
+            if idempotency is not None:
+                idempotency.remember(events[index], result)
+
+    failures = []
+    for record, (response_code, response_body) in zip(records, results):
+        request_log.log(
+            "Handled", [record["messageId"], response_code, response_body], sampled
+        )
+        if response_code >= 500:
+            failures.append({"itemIdentifier": record["messageId"]})
+    return {"batchItemFailures": failures}
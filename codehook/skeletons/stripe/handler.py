@@ -16,3 +16,30 @@ def handler_logic(body):
     # else:
     #     print('Unhandled event type {}'.format(event.type))
     return (500, "Handler logic skeleton")
+
+
+# Optionally, define handler_logic_batch to handle the events of an endpoint deployed
+# with --async in batches, e.g. to write them to a database at once. handler_logic
+# is then only used for the events that are not queued.
+#
+# def handler_logic_batch(events):
+#     """
+#     :param events: A list of up to 10 events, as handler_logic gets them.
+#     :return: A list with a (response_code, response_body) tuple per event, in the
+#     same order. The events with a 5xx response code are retried, and so is the
+#     whole batch if the function raises an error.
+#     """
+
+# Instead of branching on the type of the event in handler_logic, a handler can be
+# registered per type or prefix. Events of other types are then acknowledged without
+# being decoded, and codehook deploy only subscribes to the registered ones.
+#
+# from dispatch import on
+#
+# @on("invoice.paid")
+# def invoice_paid(body):
+#     return (200, "Invoice paid")
+#
+# @on("customer.subscription.*")
+# def subscription_changed(body):
+#     return (200, "Subscription changed")
@@ -1,15 +1,31 @@
+import base64
 import json
 import logging
 import os
 
+import dispatch
 import handler
+from idempotency import Idempotency
+from request_log import RequestLogger
 import stripe
+from work_queue import WorkQueue, handle_batch
+
+try:
+    # Decode with orjson when it is in the package or a layer, as it is much faster
+    from orjson import loads
+except ImportError:
+    from json import loads
 
 stripe.api_key = os.getenv("API_KEY")
 endpoint_secret = os.getenv("ENDPOINT_SECRET")
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+# Configured by the LOG_* environment variables set on deployment
+request_log = RequestLogger.from_env(logger)
+# Set when the function was deployed with --async, see work_queue.py
+work_queue = WorkQueue.from_env()
+# Survives across warm invocations, see idempotency.py
+idempotency = Idempotency.from_env()
 
 
 def lambda_handler(event, _):
@@ -28,40 +44,30 @@ def lambda_handler(event, _):
              an HTTP response. The 'statusCode' field is the HTTP status code
              and the 'body' field is the body of the response.
     """
-    logger.info("Request: %s", event)
+    sampled = request_log.sample()
+    request_log.log("Request", event, sampled)
     response_code = 200
 
-    headers = event.get("headers")
+    headers = event.get("headers") or {}
     body = event.get("body")
 
-    event = None
-
     if body:
         payload = body
     else:
         payload = "{}"
+    if event.get("isBase64Encoded"):
+        payload = base64.b64decode(payload).decode("utf-8")
 
-    try:
-        event = json.loads(payload)
-    except json.decoder.JSONDecodeError as e:
-        print("Invalid webhook request: " + str(e))
-        response_code = 400
-        return {
-            "statusCode": response_code,
-            "headers": {"Content-Type": "*/*"},
-            "body": json.dumps(
-                {
-                    "status_code": response_code,
-                    "body": str(e),
-                }
-            ),
-        }
     if endpoint_secret:
         # Only verify the event if there is an endpoint secret defined
         # Otherwise use the basic event deserialized with json
-        sig_header = headers.get("stripe-signature")
+        # The signature is checked on the raw payload, so forged requests are
+        # rejected before the payload is parsed
+        sig_header = headers.get("stripe-signature") or headers.get("Stripe-Signature")
         try:
-            event = stripe.Webhook.construct_event(payload, sig_header, endpoint_secret)  # type: ignore
+            stripe.WebhookSignature.verify_header(
+                payload, sig_header, endpoint_secret, stripe.Webhook.DEFAULT_TOLERANCE
+            )
         except stripe.error.SignatureVerificationError as e:  # type: ignore
             print("⚠️  Webhook signature verification failed." + str(e))
             response_code = 400
@@ -75,10 +81,50 @@ def lambda_handler(event, _):
                     }
                 ),
             }
-        pass
 
-    # Inject code here
-    (response_code, response_body) = handler.handler_logic(event)
+    if dispatch.ignores(payload):
+        # Handlers are registered, but not for this type of event
+        response_code = 200
+        return {
+            "statusCode": response_code,
+            "headers": {"Content-Type": "*/*"},
+            "body": json.dumps(
+                {
+                    "status_code": response_code,
+                    "body": "Ignored",
+                }
+            ),
+        }
+
+    try:
+        # The payload is parsed once, whether it was verified or not
+        event = loads(payload)
+    except json.decoder.JSONDecodeError as e:
+        print("Invalid webhook request: " + str(e))
+        response_code = 400
+        return {
+            "statusCode": response_code,
+            "headers": {"Content-Type": "*/*"},
+            "body": json.dumps(
+                {
+                    "status_code": response_code,
+                    "body": str(e),
+                }
+            ),
+        }
+
+    duplicate = idempotency.lookup(event)
+    if duplicate is not None:
+        # Retried deliveries get the first response, without running the handler
+        response_code, response_body = duplicate
+    elif work_queue is not None and work_queue.accepts(payload):
+        # Acknowledge the event once it is queued, the worker handles it
+        work_queue.send(payload)
+        response_code, response_body = 200, "Queued"
+    else:
+        # Inject code here
+        response_code, response_body = dispatch.handle(handler, construct(event))
+        idempotency.remember(event, (response_code, response_body))
 
     response = {
         "statusCode": response_code,
@@ -91,5 +137,32 @@ def lambda_handler(event, _):
         ),
     }
 
-    logger.info("Response: %s", response)
+    request_log.log("Response", response, sampled)
     return response
+
+
+def construct(event):
+    if endpoint_secret:
+        # Verified events are passed as a StripeObject, like construct_event does
+        event = stripe.Event.construct_from(event, stripe.api_key)
+    return event
+
+
+def decode(payload):
+    return construct(loads(payload))
+
+
+def worker_handler(event, _):
+    """
+    Handles the events queued by lambda_handler, in the batches Lambda polls from the
+    queue. They were verified before they were queued.
+
+    The events the handler fails on, with an error or a 5xx status code, are
+    returned to the queue and retried, and moved to the dead letter queue after a
+    few attempts.
+
+    :param event: The event dict sent by Lambda, with the queued messages in Records.
+    :param context: The context in which the function is called.
+    :return: The IDs of the messages that failed, as batchItemFailures.
+    """
+    return handle_batch(event, handler, decode, request_log, idempotency)
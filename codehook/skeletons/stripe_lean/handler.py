@@ -0,0 +1,46 @@
+def handler_logic(body):
+    """
+    Handles the logic around a Stripe webhook event
+    :param body: The event as a dict, decoded from JSON. Example available on
+    https://docs.stripe.com/api/events/object
+    :return: A tuple containing the HTTP status code and the body of the response.
+    The response body is used for logging purposes only, as webhooks are asynchronous.
+        (response_code, response_body)
+    """
+    # if body['type'] == 'payment_intent.succeeded':
+    #     payment_intent = body['data']['object'] # contains a PaymentIntent
+    #     print('PaymentIntent was successful!')
+    # elif body['type'] == 'payment_method.attached':
+    #     payment_method = body['data']['object'] # contains a PaymentMethod
+    #     print('PaymentMethod was attached to a Customer!')
+    # # ... handle other event types
+    # else:
+    #     print('Unhandled event type {}'.format(body['type']))
+    return (500, "Handler logic skeleton")
+
+
+# Optionally, define handler_logic_batch to handle the events of an endpoint deployed
+# with --async in batches, e.g. to write them to a database at once. handler_logic
+# is then only used for the events that are not queued.
+#
+# def handler_logic_batch(events):
+#     """
+#     :param events: A list of up to 10 events, as handler_logic gets them.
+#     :return: A list with a (response_code, response_body) tuple per event, in the
+#     same order. The events with a 5xx response code are retried, and so is the
+#     whole batch if the function raises an error.
+#     """
+
+# Instead of branching on the type of the event in handler_logic, a handler can be
+# registered per type or prefix. Events of other types are then acknowledged without
+# being decoded, and codehook deploy only subscribes to the registered ones.
+#
+# from dispatch import on
+#
+# @on("invoice.paid")
+# def invoice_paid(body):
+#     return (200, "Invoice paid")
+#
+# @on("customer.subscription.*")
+# def subscription_changed(body):
+#     return (200, "Subscription changed")
@@ -0,0 +1,125 @@
+import base64
+import json
+import logging
+import os
+
+import dispatch
+import handler
+from idempotency import Idempotency
+from request_log import RequestLogger
+from stripe_signature import SignatureVerificationError, verify_header
+from work_queue import WorkQueue, handle_batch
+
+try:
+    # Decode with orjson when it is in the package or a layer, as it is much faster
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+# The Stripe SDK is not imported here, as it takes a large share of a cold start.
+# Signatures are verified by stripe_signature, and events are plain dicts.
+endpoint_secret = os.getenv("ENDPOINT_SECRET")
+tolerance = int(os.getenv("SIGNATURE_TOLERANCE", "300"))
+
+logger = logging.getLogger()
+# Configured by the LOG_* environment variables set on deployment
+request_log = RequestLogger.from_env(logger)
+# Set when the function was deployed with --async, see work_queue.py
+work_queue = WorkQueue.from_env()
+# Survives across warm invocations, see idempotency.py
+idempotency = Idempotency.from_env()
+
+
+def respond(response_code, body):
+    return {
+        "statusCode": response_code,
+        "headers": {"Content-Type": "*/*"},
+        "body": json.dumps(
+            {
+                "status_code": response_code,
+                "body": body,
+            }
+        ),
+    }
+
+
+def lambda_handler(event, _):
+    """
+    Handles POST requests that are passed through an Amazon API Gateway REST API,
+        with a JSON payload consisting of an event object.
+    Quickly returns a successful status code (2xx) prior to any complex logic
+        that could cause a timeout.
+
+    :param event: The event dict sent by Amazon API Gateway that contains all of the
+                  request data.
+    :param context: The context in which the function is called.
+    :return: A response that is sent to Amazon API Gateway, to be wrapped into
+             an HTTP response. The 'statusCode' field is the HTTP status code
+             and the 'body' field is the body of the response.
+    """
+    sampled = request_log.sample()
+    request_log.log("Request", event, sampled)
+
+    headers = event.get("headers") or {}
+    # The signature and the decoder both work on the raw bytes of the payload
+    if event.get("isBase64Encoded"):
+        payload = base64.b64decode(event["body"])
+    else:
+        payload = (event.get("body") or "{}").encode("utf-8")
+
+    if endpoint_secret:
+        # Only verify the event if there is an endpoint secret defined
+        # Otherwise use the basic event deserialized with json
+        # REST APIs pass the headers with the case they were sent with
+        sig_header = next(
+            (v for k, v in headers.items() if k.lower() == "stripe-signature"), None
+        )
+        try:
+            verify_header(payload, sig_header, endpoint_secret, tolerance)
+        except SignatureVerificationError as e:
+            print("⚠️  Webhook signature verification failed." + str(e))
+            return respond(400, str(e))
+
+    if dispatch.ignores(payload):
+        # Handlers are registered, but not for this type of event
+        return respond(200, "Ignored")
+
+    try:
+        # The payload is parsed once, after the signature is checked
+        event = loads(payload)
+    except json.decoder.JSONDecodeError as e:
+        print("Invalid webhook request: " + str(e))
+        return respond(400, str(e))
+
+    duplicate = idempotency.lookup(event)
+    if duplicate is not None:
+        # Retried deliveries get the first response, without running the handler
+        response_code, response_body = duplicate
+    elif work_queue is not None and work_queue.accepts(payload):
+        # Acknowledge the event once it is queued, the worker handles it
+        work_queue.send(payload)
+        response_code, response_body = 200, "Queued"
+    else:
+        # Inject code here
+        response_code, response_body = dispatch.handle(handler, event)
+        idempotency.remember(event, (response_code, response_body))
+
+    response = respond(response_code, response_body)
+    request_log.log("Response", response, sampled)
+    return response
+
+
+def worker_handler(event, _):
+    """
+    Handles the events queued by lambda_handler, in the batches Lambda polls from the
+    queue. They were verified before they were queued.
+
+    The events the handler fails on, with an error or a 5xx status code, are
+    returned to the queue and retried, and moved to the dead letter queue after a
+    few attempts.
+
+    :param event: The event dict sent by Lambda, with the queued messages in Records.
+    :param context: The context in which the function is called.
+    :return: The IDs of the messages that failed, as batchItemFailures.
+    """
+    return handle_batch(event, handler, loads, request_log, idempotency)
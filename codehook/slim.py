@@ -0,0 +1,221 @@
+"""
+Slims the packages of functions and layers before they are zipped: files that the
+code never needs at run time are left out, like the tests, type stubs and docs that
+pip installs with the dependencies, and the modules are compiled to bytecode for the
+Python version of the runtime, so they aren't compiled on every cold start. Lambda
+unpacks the code to a read-only directory, where Python can't cache the bytecode it
+compiles itself.
+"""
+
+import functools
+import hashlib
+import importlib.util
+import marshal
+import os
+import sys
+from fnmatch import fnmatch
+from pathlib import Path, PurePosixPath
+
+from rich import print
+
+from .cache import format_size
+
+# Patterns of the names of the files in a package that are left out
+DEFAULT_EXCLUDE = [
+    "*.dist-info/*",
+    "*.egg-info/*",
+    "tests/*",
+    "*/tests/*",
+    "*/test/*",
+    "*.pyi",
+    "*/py.typed",
+    "*.md",
+    "*.rst",
+    "*/docs/*",
+    "*.c",
+    "*.h",
+    "*.pyx",
+    "*.pxd",
+]
+# Patterns of the names of the files that are kept even if they match an exclusion.
+# importlib.metadata reads the version of a distribution from its METADATA, and the
+# plugins it provides from its entry points.
+DEFAULT_KEEP = ["*.dist-info/METADATA", "*.dist-info/entry_points.txt"]
+
+
+class SlimPolicy:
+    """
+    Which files a package leaves out, and whether its modules are precompiled.
+    """
+
+    def __init__(
+        self,
+        exclude: list[str] = None,
+        keep: list[str] = None,
+        precompile: bool = True,
+    ):
+        """
+        Initializes a new instance of the SlimPolicy class.
+
+        Args:
+            exclude (list[str], optional): Glob patterns of the names of the files to
+                leave out, relative to the package. Defaults to DEFAULT_EXCLUDE.
+            keep (list[str], optional): Glob patterns of the names of the files to keep
+                even if they match an exclusion. Defaults to DEFAULT_KEEP.
+            precompile (bool, optional): Flag indicating whether to add the bytecode of
+                the modules.
+        """
+        self.exclude = DEFAULT_EXCLUDE if exclude is None else exclude
+        self.keep = DEFAULT_KEEP if keep is None else keep
+        self.precompile = precompile
+
+    @classmethod
+    def from_env(cls):
+        """
+        :return: The default policy, unless $CODEHOOK_SLIM is 0, with the comma
+                 separated patterns of $CODEHOOK_SLIM_EXCLUDE and $CODEHOOK_SLIM_KEEP
+                 added, and without bytecode if $CODEHOOK_PRECOMPILE is 0. None if
+                 packages are not slimmed at all.
+        """
+
+        def patterns(variable):
+            value = os.getenv(variable, "")
+            return [pattern.strip() for pattern in value.split(",") if pattern.strip()]
+
+        if os.getenv("CODEHOOK_SLIM", "1") in ["0", "false"]:
+            return None
+        return cls(
+            DEFAULT_EXCLUDE + patterns("CODEHOOK_SLIM_EXCLUDE"),
+            DEFAULT_KEEP + patterns("CODEHOOK_SLIM_KEEP"),
+            os.getenv("CODEHOOK_PRECOMPILE", "1") not in ["0", "false"],
+        )
+
+    def fingerprint(self) -> str:
+        """
+        :return: A digest of the policy, for the cache keys of the packages it slims.
+        """
+        digest = hashlib.sha256()
+        for pattern in ["exclude", *self.exclude, "keep", *self.keep]:
+            digest.update(pattern.encode() + b"\0")
+        if self.precompile:
+            # The bytecode depends on the version of Python that compiles it
+            digest.update(f"precompile-{python_version()}".encode())
+        return f"slim-{digest.hexdigest()[:16]}"
+
+    def excludes(self, name: str) -> bool:
+        """
+        :param name: The name of a file in the package, e.g. stripe/py.typed.
+        :return: Whether the file is left out.
+        """
+        return any(fnmatch(name, pattern) for pattern in self.exclude) and not any(
+            fnmatch(name, pattern) for pattern in self.keep
+        )
+
+    def apply(self, entries: dict, runtime: str, root: str = "/var/task") -> dict:
+        """
+        Slims the files of a package, and reports how much smaller it got.
+
+        :param entries: The content of each file by its name in the package, either
+                        the path of a file or bytes.
+        :param runtime: The Lambda runtime the package is built for, e.g. python3.11.
+                        Modules are only precompiled when it runs the same version of
+                        Python as codehook.
+        :param root: The directory the package is unpacked to, which tracebacks show
+                     the modules in, e.g. /opt for layers.
+        :return: The files that are kept, and the bytecode of the modules.
+        """
+        sizes = {name: entry_size(content) for name, content in entries.items()}
+        slimmed = {
+            name: content
+            for name, content in entries.items()
+            if not self.excludes(name)
+        }
+        bytecode = self.bytecode(slimmed, runtime, root)
+        before = sum(sizes.values())
+        left_out = before - sum(sizes[name] for name in slimmed)
+        compiled = sum(map(len, bytecode.values()))
+        print(
+            f"Slimmed the package: left out {len(entries) - len(slimmed)} files "
+            f"(-{format_size(left_out)}), precompiled {len(bytecode)} modules "
+            f"(+{format_size(compiled)}), {format_size(before)} -> "
+            f"{format_size(before - left_out + compiled)} unzipped"
+        )
+        return {**slimmed, **bytecode}
+
+    def bytecode(self, entries: dict, runtime: str, root: str = "/var/task") -> dict:
+        """
+        Compiles the modules of a package, if the policy precompiles them and the
+        runtime runs the same version of Python as codehook.
+
+        :param entries: The content of each file by its name in the package.
+        :param runtime: The Lambda runtime the package is built for.
+        :param root: The directory the package is unpacked to.
+        :return: The content of the .pyc file of each module, by its name.
+        """
+        bytecode = {}
+        if not self.precompile:
+            return bytecode
+        if runtime.removeprefix("python") != python_version():
+            warn_not_precompiled(runtime)
+            return bytecode
+        for name, content in entries.items():
+            if name.endswith(".py"):
+                compiled = compile_module(content, f"{root}/{name}")
+                if compiled is not None:
+                    bytecode[cache_name(name)] = compiled
+        return bytecode
+
+
+def python_version() -> str:
+    return "{}.{}".format(*sys.version_info[:2])
+
+
+@functools.cache
+def warn_not_precompiled(runtime: str):
+    """
+    Warns, once per runtime, that its modules are not precompiled.
+    """
+    print(
+        f"[bold red]Not precompiling the modules:[/bold red] the {runtime} runtime "
+        f"runs a different version of Python than codehook, {python_version()}. "
+        "Run codehook with the same version to save their compilation on cold starts."
+    )
+
+
+def entry_size(content) -> int:
+    return len(content) if isinstance(content, bytes) else os.path.getsize(content)
+
+
+def cache_name(name: str) -> str:
+    """
+    :param name: The name of a module in the package, e.g. stripe/__init__.py.
+    :return: The name of its bytecode, e.g. stripe/__pycache__/__init__.cpython-311.pyc.
+    """
+    path = PurePosixPath(name)
+    tag = sys.implementation.cache_tag
+    return (path.parent / "__pycache__" / f"{path.stem}.{tag}.pyc").as_posix()
+
+
+def compile_module(content, filename: str):
+    """
+    Compiles a module to a .pyc file that is checked against nothing: the package is
+    never changed once unpacked, so neither the timestamps nor the hashes of the
+    sources need to be checked on import.
+
+    :param content: The path of the module or its source as bytes.
+    :param filename: The path of the module once the package is unpacked.
+    :return: The content of the .pyc file, or None if the module doesn't compile.
+    """
+    source = content if isinstance(content, bytes) else Path(content).read_bytes()
+    try:
+        code = compile(source, filename, "exec", dont_inherit=True)
+    except (SyntaxError, ValueError):
+        # Like compileall, leave the modules that don't compile to fail on import
+        return None
+    # The layout of PEP 552, with the flags of an unchecked hash-based .pyc
+    return (
+        importlib.util.MAGIC_NUMBER
+        + (0b01).to_bytes(4, "little")
+        + importlib.util.source_hash(source)
+        + marshal.dumps(code)
+    )
@@ -2,12 +2,14 @@ import stripe
 from rich import print
 
 from ..model import Source
+from ..throttle import Throttle
 
 
 class Stripe(Source):
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, throttle: Throttle = None):
         super().__init__()
         self.tags = {"codehook": "true"}
+        self.throttle = throttle or Throttle()
 
         stripe.api_key = api_key
 
@@ -21,11 +23,23 @@ class Stripe(Source):
         :return: The webhook endpoint id.
         """
         print("Creating a webhook endpoint in Stripe")
-        endpoint = stripe.WebhookEndpoint.create(
-            enabled_events=events, url=url, metadata=self.tags
+        endpoint = self.throttle.retry(
+            lambda: self._create_webhook(events, url),
+            "stripe",
+            "WebhookEndpoint.create",
         )
         return endpoint.id
 
+    def _create_webhook(self, events: list[str], url: str):
+        with self.throttle.call("stripe", "WebhookEndpoint.create"):
+            return stripe.WebhookEndpoint.create(
+                enabled_events=events, url=url, metadata=self.tags
+            )
+
+    def _delete_webhook(self, id: str):
+        with self.throttle.call("stripe", "WebhookEndpoint.delete"):
+            return stripe.WebhookEndpoint.delete(id)
+
     def delete_webhook(self, id: str):
         """
         Deletes a Stripe Webhook Endpoint.
@@ -34,30 +48,49 @@ class Stripe(Source):
         """
         print(f"Deleting the Stripe webhook endpoint with id {id}")
         try:
-            stripe.WebhookEndpoint.delete(id)
+            self.throttle.retry(
+                lambda: self._delete_webhook(id), "stripe", "WebhookEndpoint.delete"
+            )
         except Exception:
             print(f"[bold red]Error: Couldn't delete endpoint {id}[/bold red]")
             raise
 
+    def _list_webhooks(self, starting_after: str = None):
+        # Stripe defaults to pages of 10, and allows up to 100
+        params = {"limit": 100}
+        if starting_after is not None:
+            params["starting_after"] = starting_after
+        with self.throttle.call("stripe", "WebhookEndpoint.list"):
+            return stripe.WebhookEndpoint.list(**params)
+
     def list_webhooks(self):
         """
-        Returns a list of your webhook endpoints for the current account.
+        Returns a list of your webhook endpoints for the current account. Each page is
+        throttled like the other calls to Stripe.
 
         :return: A list of your webhook endpoints.
         """
         try:
-            print("Retrieving Stripe webhook endpoints")
             endpoints = []
-            for endpoint in stripe.WebhookEndpoint.list().auto_paging_iter():
-                if endpoint["metadata"] == self.tags:
-                    endpoints.append(endpoint)
-
-            webhook_ids = [webhook["id"] for webhook in endpoints]
-            if webhook_ids:
-                print(webhook_ids)
-            else:
-                print("[bold red]No webhook endpoints[/bold red]")
-            return webhook_ids
+            starting_after = None
+            while True:
+                page = self.throttle.retry(
+                    lambda starting_after=starting_after: self._list_webhooks(
+                        starting_after
+                    ),
+                    "stripe",
+                    "WebhookEndpoint.list",
+                )
+                endpoints.extend(
+                    endpoint
+                    for endpoint in page.data
+                    if endpoint["metadata"] == self.tags
+                )
+                if not page.has_more or not page.data:
+                    break
+                starting_after = page.data[-1]["id"]
+
+            return [webhook["id"] for webhook in endpoints]
         except Exception:
             print("[bold red]Error: Couldn't retreive Stripe endpoints[/bold red]")
             raise
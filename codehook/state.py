@@ -0,0 +1,250 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+from .cache import CODEHOOK_HOME
+
+FIELDS = [
+    "name",
+    "source",
+    "function_arn",
+    "api_id",
+    "api_url",
+    "webhook_id",
+    "code_hash",
+    "queue_url",
+    "worker_arn",
+    "created_at",
+    "updated_at",
+]
+# The fields of the resources a deployment is made of
+RESOURCE_FIELDS = ["function_arn", "api_id", "webhook_id", "worker_arn", "queue_url"]
+# Columns added after the first version of the table, with their types
+ADDED_COLUMNS = {"queue_url": "TEXT", "worker_arn": "TEXT"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deployments (
+    name TEXT PRIMARY KEY,
+    source TEXT,
+    function_arn TEXT,
+    api_id TEXT,
+    api_url TEXT,
+    webhook_id TEXT,
+    code_hash TEXT,
+    queue_url TEXT,
+    worker_arn TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deployments_api_id ON deployments (api_id);
+CREATE INDEX IF NOT EXISTS deployments_webhook_id ON deployments (webhook_id);
+"""
+
+
+class StateStore:
+    """
+    A local index of the endpoints deployed with codehook, kept in SQLite.
+
+    Each deployment is recorded under its handler name, with the ARN of its function,
+    the ID and URL of its API, the ID of its webhook endpoint and the hash of its
+    code, so commands can find the resources of a handler without listing everything
+    in the cloud and in the source. Use reconcile to sync it with what actually exists.
+    """
+
+    def __init__(self, path: Path = None):
+        """
+        Initializes a new instance of the StateStore class.
+
+        Args:
+            path (Path, optional): The SQLite database file.
+                Defaults to $CODEHOOK_STATE or ~/.codehook/state.db.
+        """
+        self.path = Path(
+            path or os.getenv("CODEHOOK_STATE", CODEHOOK_HOME / "state.db")
+        )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # The resources of a deployment are deleted concurrently, and each deletion
+        # reads and rewrites its row
+        self._forget_lock = threading.Lock()
+        with closing(self._connect()) as connection, connection:
+            connection.executescript(SCHEMA)
+            columns = {
+                row["name"]
+                for row in connection.execute("PRAGMA table_info(deployments)")
+            }
+            for column, type in ADDED_COLUMNS.items():
+                if column not in columns:
+                    connection.execute(
+                        f"ALTER TABLE deployments ADD COLUMN {column} {type}"
+                    )
+
+    def _connect(self):
+        # One connection per operation, so the store can be used from any thread
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def record(self, name: str, **fields):
+        """
+        Creates or updates the deployment of a handler. Fields that are not given keep
+        their current value.
+
+        :param name: The name of the handler.
+        :param fields: The fields to set, e.g. function_arn, api_id or code_hash.
+        """
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown deployment fields {unknown}")
+        now = time.time()
+        columns = ["name", *fields, "created_at", "updated_at"]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in fields)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                f"INSERT INTO deployments ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT (name) DO UPDATE SET "
+                f"{updates + ', ' if updates else ''}updated_at = excluded.updated_at",
+                [name, *fields.values(), now, now],
+            )
+
+    def get(self, name: str):
+        """
+        :param name: The name of the handler.
+        :return: The deployment of the handler as a dict, or None if there is none.
+        """
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT * FROM deployments WHERE name = ?", [name]
+            ).fetchone()
+        return dict(row) if row else None
+
+    def find(self, column: str, value: str):
+        """
+        :param column: The field to search by, e.g. api_id or webhook_id.
+        :param value: The value of the field.
+        :return: The deployment with that value as a dict, or None if there is none.
+        """
+        if column not in FIELDS:
+            raise ValueError(f"Unknown deployment field {column}")
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                f"SELECT * FROM deployments WHERE {column} = ?", [value]
+            ).fetchone()
+        return dict(row) if row else None
+
+    def all(self):
+        """
+        :return: Every deployment as a dict, ordered by name.
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT * FROM deployments ORDER BY name"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def remove(self, name: str):
+        """
+        Forgets the deployment of a handler.
+
+        :param name: The name of the handler.
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM deployments WHERE name = ?", [name])
+
+    def _find_function(self, name: str):
+        # Functions can be referred to by name as well as by ARN, and are either the
+        # function of a deployment, named after it, or its worker
+        deployment = self.get(name)
+        if deployment is not None and deployment["function_arn"]:
+            return deployment, "function_arn"
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT * FROM deployments WHERE worker_arn LIKE ?",
+                [f"%:function:{name}"],
+            ).fetchone()
+        return (dict(row), "worker_arn") if row else (None, None)
+
+    def forget(self, column: str, value: str):
+        """
+        Clears a resource from the deployment that has it, e.g. once it is deleted.
+        Deployments that are left without any resources are removed.
+
+        :param column: The field of the resource, one of RESOURCE_FIELDS.
+        :param value: The identifier of the resource.
+        """
+        with self._forget_lock:
+            deployment = self.find(column, value)
+            if deployment is None and column in ["function_arn", "worker_arn"]:
+                deployment, column = self._find_function(value)
+            if deployment is None:
+                return
+            if column == "api_id":
+                deployment["api_url"] = None
+            deployment[column] = None
+            if not any(deployment[field] for field in RESOURCE_FIELDS):
+                self.remove(deployment["name"])
+            else:
+                self.record(
+                    deployment["name"],
+                    **{
+                        field: deployment[field]
+                        for field in RESOURCE_FIELDS + ["api_url"]
+                    },
+                )
+
+    def reconcile(self, function_names, api_ids, webhook_ids, queue_urls=None):
+        """
+        Syncs the store with the resources that actually exist: resources that are
+        gone are cleared, and functions that are not recorded are added by name.
+
+        :param function_names: The names of the codehook functions in the cloud.
+        :param api_ids: The IDs of the codehook APIs in the cloud.
+        :param webhook_ids: The IDs of the codehook webhook endpoints in the source.
+        :param queue_urls: The URLs of the codehook queues in the cloud, or None if
+                           they were not listed.
+        :return: The number of deployments that were changed.
+        """
+        changed = 0
+        function_names, api_ids, webhook_ids = (
+            set(function_names),
+            set(api_ids),
+            set(webhook_ids),
+        )
+        for deployment in self.all():
+            if deployment["name"] not in function_names and deployment["function_arn"]:
+                self.forget("function_arn", deployment["function_arn"])
+                changed += 1
+            if deployment["api_id"] and deployment["api_id"] not in api_ids:
+                self.forget("api_id", deployment["api_id"])
+                changed += 1
+            if deployment["webhook_id"] and deployment["webhook_id"] not in webhook_ids:
+                self.forget("webhook_id", deployment["webhook_id"])
+                changed += 1
+            worker_arn = deployment["worker_arn"]
+            if worker_arn and function_name(worker_arn) not in function_names:
+                self.forget("worker_arn", worker_arn)
+                changed += 1
+            queue_url = deployment["queue_url"]
+            if queue_urls is not None and queue_url and queue_url not in queue_urls:
+                self.forget("queue_url", queue_url)
+                changed += 1
+
+        recorded = set()
+        for deployment in self.all():
+            recorded.add(deployment["name"])
+            if deployment["worker_arn"]:
+                recorded.add(function_name(deployment["worker_arn"]))
+        for name in function_names - recorded:
+            self.record(name, function_arn=name)
+            changed += 1
+        return changed
+
+
+def function_name(function_arn: str) -> str:
+    """
+    :return: The name of a Lambda function from its ARN, or the name itself.
+    """
+    return function_arn.split(":")[6] if ":" in function_arn else function_arn
@@ -0,0 +1,279 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from rich import print
+
+from . import tracing
+
+# Maximum number of calls in flight at once, per service
+SERVICE_CONCURRENCY = {
+    "lambda": 8,
+    "api-gateway": 4,
+    "iam": 2,
+    "sts": 2,
+    "resource-groups-tagging-api": 2,
+    "stripe": 4,
+}
+DEFAULT_CONCURRENCY = 4
+
+# Sustained calls per second and burst size, per service and operation ("*" matches
+# any operation). These follow the AWS control plane quotas and the Stripe test mode
+# rate limit.
+SERVICE_RATES = {
+    ("api-gateway", "CreateRestApi"): (1 / 3, 1),
+    ("api-gateway", "CreateDeployment"): (1 / 5, 1),
+    ("api-gateway", "DeleteRestApi"): (1 / 30, 1),
+    ("api-gateway", "CreateResource"): (5, 5),
+    ("api-gateway", "GetResources"): (2.5, 5),
+    ("api-gateway", "*"): (10, 40),
+    ("lambda", "*"): (15, 15),
+    ("iam", "*"): (10, 10),
+    ("sts", "*"): (10, 10),
+    ("resource-groups-tagging-api", "*"): (5, 5),
+    ("stripe", "*"): (25, 25),
+}
+
+# Error codes that AWS and Stripe use when a call was rejected for going too fast
+THROTTLING_ERRORS = {
+    "TooManyRequestsException",
+    "ThrottlingException",
+    "Throttling",
+    "ThrottledException",
+    "RequestLimitExceeded",
+    "RateLimitError",
+}
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    Tells whether ERROR means a call was rejected by a rate limit, and can be retried.
+    """
+    if type(error).__name__ in THROTTLING_ERRORS:
+        return True
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") in THROTTLING_ERRORS
+    return False
+
+
+class TokenBucket:
+    """
+    A token bucket rate limiter. Tokens are added at a steady rate up to the size of
+    the bucket, and every call takes one. Callers that find the bucket empty reserve
+    the next token and sleep until it is added, so they are served in order.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Initializes a new instance of the TokenBucket class.
+
+        Args:
+            rate (float): The tokens added per second.
+            burst (int, optional): The size of the bucket, i.e. how many calls can be
+                made at once after a quiet period.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """
+        Takes a token, borrowing it from the future if the bucket is empty.
+
+        :return: How long to wait, in seconds, before the token can be used.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        """
+        Blocks until a token is available, and takes it.
+        """
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    def drain(self):
+        """
+        Empties the bucket, so the next calls wait for a full refill interval. Used
+        when the service rejected a call, as the limit is shared with other clients.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0)
+
+
+class Throttle:
+    """
+    Schedules calls to AWS and Stripe under the limits of each service, however many
+    deployments or deletions run at once: a token bucket per operation, shared by
+    every caller, a cap on the calls in flight per service, and retries with
+    exponential backoff and jitter when a call is throttled anyway.
+
+    Boto3 clients are throttled transparently once registered with register_client.
+    Other calls are wrapped with the call context manager.
+    """
+
+    def __init__(
+        self,
+        concurrency: dict = None,
+        rates: dict = None,
+        retries: int = 8,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        """
+        Initializes a new instance of the Throttle class.
+
+        Args:
+            concurrency (dict, optional): The maximum calls in flight, by service.
+            rates (dict, optional): The (calls per second, burst) limits, by
+                (service, operation).
+            retries (int, optional): How many times a throttled call is retried.
+            base_delay (float, optional): The backoff before the first retry, in
+                seconds. It doubles with every retry.
+            max_delay (float, optional): The maximum backoff between retries.
+        """
+        self.concurrency = {**SERVICE_CONCURRENCY, **(concurrency or {})}
+        self.rates = {**SERVICE_RATES, **(rates or {})}
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._buckets = {}
+
+    def _semaphore(self, service: str):
+        with self._lock:
+            if service not in self._semaphores:
+                self._semaphores[service] = threading.BoundedSemaphore(
+                    self.concurrency.get(service, DEFAULT_CONCURRENCY)
+                )
+            return self._semaphores[service]
+
+    def _rate_key(self, service: str, operation: str):
+        if (service, operation) in self.rates:
+            return service, operation
+        if (service, "*") in self.rates:
+            return service, "*"
+        return None
+
+    def _bucket(self, service: str, operation: str):
+        key = self._rate_key(service, operation)
+        if key is None:
+            return None
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(*self.rates[key])
+            return self._buckets[key]
+
+    def wait(self, service: str, operation: str):
+        """
+        Blocks until a call to OPERATION is allowed by the rate of the service.
+
+        :param service: The name of the service, e.g. api-gateway.
+        :param operation: The name of the operation, e.g. CreateRestApi.
+        """
+        bucket = self._bucket(service, operation)
+        if bucket is not None:
+            bucket.acquire()
+
+    def acquire(self, service: str, operation: str):
+        """
+        Waits for the rate of the service and takes a slot from it, before making a
+        call. Every acquire must be followed by a release.
+        """
+        started = time.perf_counter()
+        # Wait for the rate first, so slow operations don't hold slots while waiting
+        self.wait(service, operation)
+        self._semaphore(service).acquire()
+        tracing.add("throttle_wait", time.perf_counter() - started)
+
+    def release(self, service: str):
+        """
+        Gives back the slot taken by acquire, once a call is done.
+        """
+        self._semaphore(service).release()
+
+    @contextmanager
+    def call(self, service: str, operation: str):
+        """
+        Throttles the call made inside the context.
+
+        :param service: The name of the service, e.g. stripe.
+        :param operation: The name of the operation, e.g. WebhookEndpoint.create.
+        """
+        with tracing.span(f"{service}.{operation}", service):
+            self.acquire(service, operation)
+            try:
+                yield
+            finally:
+                self.release(service)
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Computes the delay before a retry, with exponential backoff and full jitter,
+        so that callers throttled at the same time don't all retry at the same time.
+
+        :param attempt: The number of the retry, starting at 0.
+        :return: The delay in seconds.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def retry(self, func, service: str, operation: str):
+        """
+        Calls FUNC, retrying it with backoff while it fails with a throttling error.
+        FUNC is expected to be throttled itself, either by a registered client or by
+        the call context manager.
+
+        :param func: The call to make, without arguments.
+        :param service: The name of the service FUNC calls.
+        :param operation: The name of the operation FUNC calls.
+        :return: The result of FUNC.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return func()
+            except Exception as error:
+                if not is_throttling_error(error) or attempt == self.retries:
+                    raise
+                bucket = self._bucket(service, operation)
+                if bucket is not None:
+                    bucket.drain()
+                delay = self.backoff(attempt)
+                tracing.add("retries", 1)
+                print(f"{service} {operation} was throttled, retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _before_call(self, model, context, **kwargs):
+        service = model.service_model.service_id.hyphenize()
+        self.acquire(service, model.name)
+        context["codehook_throttle"] = service
+
+    def _after_call(self, context, **kwargs):
+        service = context.pop("codehook_throttle", None)
+        if service is not None:
+            self.release(service)
+
+    def register_client(self, client):
+        """
+        Throttles every call made with a Boto3 client, and traces it.
+
+        :param client: The Boto3 client.
+        :return: The same client.
+        """
+        tracing.register_client(client)
+        client.meta.events.register("before-call", self._before_call)
+        client.meta.events.register("after-call", self._after_call)
+        client.meta.events.register("after-call-error", self._after_call)
+        return client
@@ -0,0 +1,257 @@
+"""
+Times what codehook does in spans: the steps of a deployment, the calls to AWS and
+Stripe they make, and the builds and waits in between. Spans nest, per thread, and
+record how often their calls were retried and how long they waited for the throttle.
+
+Spans are only recorded while a Tracer is active, so the instrumentation costs next
+to nothing otherwise:
+
+    tracer = Tracer()
+    with tracer.activate():
+        with span("package", "build"):
+            ...
+    tracer.write("trace.json")  # Open it in chrome://tracing or ui.perfetto.dev
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+_tracer = contextvars.ContextVar("codehook_tracer", default=None)
+_span = contextvars.ContextVar("codehook_span", default=None)
+
+
+class Span:
+    def __init__(self, id: int, name: str, category: str, parent, args: dict):
+        self.id = id
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.args = args
+        self.thread = threading.current_thread()
+        self.started = time.perf_counter()
+        self.finished = None
+
+    @property
+    def duration(self) -> float:
+        """
+        :return: How long the span lasted, in seconds, or until now if it is open.
+        """
+        return (self.finished or time.perf_counter()) - self.started
+
+
+class Tracer:
+    """
+    Collects the spans recorded while it is active, from any thread that runs in its
+    context.
+    """
+
+    def __init__(self):
+        self.spans: list[Span] = []
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """
+        Records the spans of the code run inside the context, and of the threads it
+        starts with a copy of its context.
+        """
+        token = _tracer.set(self)
+        try:
+            yield self
+        finally:
+            _tracer.reset(token)
+
+    def start(self, name: str, category: str, args: dict) -> Span:
+        with self._lock:
+            span = Span(len(self.spans), name, category, _span.get(), args)
+            self.spans.append(span)
+        return span
+
+    def to_chrome(self) -> dict:
+        """
+        :return: The spans in the Chrome trace event format, as complete events.
+        """
+        pid = os.getpid()
+        threads = {}
+        events = []
+        for span in self.spans:
+            tid = threads.setdefault(span.thread.ident, len(threads) + 1)
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": round((span.started - self.started) * 1e6, 1),
+                    "dur": round(span.duration * 1e6, 1),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": span.args,
+                }
+            )
+        names = {span.thread.ident: span.thread.name for span in self.spans}
+        events += [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": names[ident]},
+            }
+            for ident, tid in threads.items()
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path: Path):
+        """
+        Writes the spans to a Chrome trace file.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_chrome()))
+        return path
+
+    def summary(self) -> list[dict]:
+        """
+        Aggregates the spans by name. The self time of a span is the part of its
+        duration that none of its children account for.
+
+        :return: A dict per name with its category, number of calls, total, self and
+                 maximum durations in seconds, retries and throttle wait, by total
+                 duration.
+        """
+        children = {}
+        for span in self.spans:
+            if span.parent is not None:
+                children[span.parent.id] = (
+                    children.get(span.parent.id, 0) + span.duration
+                )
+        rows = {}
+        for span in self.spans:
+            row = rows.setdefault(
+                span.name,
+                {
+                    "name": span.name,
+                    "category": span.category,
+                    "calls": 0,
+                    "total": 0.0,
+                    "self": 0.0,
+                    "max": 0.0,
+                    "retries": 0,
+                    "throttle_wait": 0.0,
+                },
+            )
+            row["calls"] += 1
+            row["total"] += span.duration
+            row["self"] += max(0.0, span.duration - children.get(span.id, 0))
+            row["max"] = max(row["max"], span.duration)
+            row["retries"] += span.args.get("retries", 0)
+            row["throttle_wait"] += span.args.get("throttle_wait", 0.0)
+        return sorted(rows.values(), key=lambda row: row["total"], reverse=True)
+
+
+def enabled() -> bool:
+    return _tracer.get() is not None
+
+
+def open_span(name: str, category: str, **args):
+    """
+    Starts a span and makes it the current one, until close_span. For callbacks that
+    start and end in different functions, like the events of Boto3 clients.
+
+    :return: The span and the token to close it with, or None if no tracer is active.
+    """
+    tracer = _tracer.get()
+    if tracer is None:
+        return None
+    span = tracer.start(name, category, args)
+    return span, _span.set(span)
+
+
+def close_span(opened, **args):
+    """
+    Ends a span started by open_span.
+    """
+    if opened is None:
+        return
+    span, token = opened
+    span.args.update(args)
+    span.finished = time.perf_counter()
+    try:
+        _span.reset(token)
+    except ValueError:
+        # Closed from another context than the one it was opened in
+        pass
+
+
+@contextmanager
+def span(name: str, category: str = "codehook", **args):
+    """
+    Times the code run inside the context, nested in the current span.
+
+    :param name: The name of the span, e.g. the step or the call.
+    :param category: The kind of span, e.g. step, aws or build.
+    :param args: Details to record with the span.
+    """
+    opened = open_span(name, category, **args)
+    try:
+        yield
+    except BaseException as error:
+        close_span(opened, error=type(error).__name__)
+        raise
+    else:
+        close_span(opened)
+
+
+def add(key: str, value):
+    """
+    Adds VALUE to a counter of the current span, e.g. its retries.
+    """
+    current = _span.get()
+    if current is not None:
+        current.args[key] = current.args.get(key, 0) + value
+
+
+def run_in_context(executor, func, *args):
+    """
+    Submits FUNC to a thread pool with a copy of the current context, so the spans it
+    records nest in the current span.
+    """
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+
+def _before_call(model, context, **kwargs):
+    service = model.service_model.service_id.hyphenize()
+    context["codehook_span"] = open_span(f"{service}.{model.name}", "aws")
+
+
+def _after_call(context, parsed=None, exception=None, **kwargs):
+    details = {}
+    if parsed:
+        metadata = parsed.get("ResponseMetadata", {})
+        details["retries"] = metadata.get("RetryAttempts", 0)
+        details["status"] = metadata.get("HTTPStatusCode")
+        if "Error" in parsed:
+            details["error"] = parsed["Error"].get("Code")
+    if exception is not None:
+        details["error"] = type(exception).__name__
+    close_span(context.pop("codehook_span", None), **details)
+
+
+def register_client(client):
+    """
+    Traces every call made with a Boto3 client, with the retries of Botocore. Register
+    it before the throttle, so the spans include the time waiting for it.
+
+    :param client: The Boto3 client.
+    :return: The same client.
+    """
+    client.meta.events.register("before-call", _before_call)
+    client.meta.events.register("after-call", _after_call)
+    client.meta.events.register("after-call-error", _after_call)
+    return client
@@ -0,0 +1,225 @@
+"""
+Installs the dependencies of Lambda packages from a local wheelhouse, a directory of
+wheels built for the platform of the Lambda runtime rather than for this machine.
+
+Requirements are resolved by pip against the wheelhouse only, for the Python version,
+ABI and manylinux platform of the runtime, so a package built on macOS or Windows
+gets the same Linux wheels as one built in CI. Wheels that are missing are downloaded
+into the wheelhouse first; once it holds every requirement, builds need no network.
+The resolved wheels are then unpacked into the package in parallel.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import urllib.parse
+import urllib.request
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+
+from rich import print
+
+from . import tracing
+from .cache import CODEHOOK_HOME
+
+# Lambda runs Python 3.11 on Amazon Linux 2, whose glibc 2.26 runs manylinux2014 wheels
+PLATFORMS = {
+    "x86_64": ["manylinux2014_x86_64", "manylinux_2_17_x86_64"],
+    "arm64": ["manylinux2014_aarch64", "manylinux_2_17_aarch64"],
+}
+
+
+class WheelhouseError(RuntimeError):
+    """
+    Raised when the requirements can't be resolved or installed for the runtime.
+    """
+
+
+class Wheelhouse:
+    """
+    A local directory of wheels for one Lambda runtime and architecture.
+    """
+
+    def __init__(
+        self,
+        runtime: str,
+        architecture: str = "x86_64",
+        path: Path = None,
+        offline: bool = None,
+        concurrency: int = None,
+    ):
+        """
+        Initializes a new instance of the Wheelhouse class.
+
+        Args:
+            runtime (str): The Lambda runtime, e.g. python3.11.
+            architecture (str, optional): The Lambda architecture, x86_64 or arm64.
+            path (Path, optional): The directory holding the wheelhouses of every
+                platform. Defaults to $CODEHOOK_WHEELHOUSE or ~/.codehook/wheelhouse.
+            offline (bool, optional): Flag indicating whether to fail instead of
+                downloading missing wheels. Defaults to $CODEHOOK_OFFLINE.
+            concurrency (int, optional): The maximum number of wheels to unpack at
+                once. Defaults to the number of CPUs.
+        """
+        if architecture not in PLATFORMS:
+            raise ValueError(f"Unknown Lambda architecture {architecture}")
+        self.runtime = runtime
+        self.architecture = architecture
+        # Wheels of different platforms are kept apart, so pip can't pick the wrong one
+        self.path = (
+            Path(path or os.getenv("CODEHOOK_WHEELHOUSE", CODEHOOK_HOME / "wheelhouse"))
+            / f"{runtime}-{architecture}"
+        )
+        self.offline = (
+            offline
+            if offline is not None
+            else os.getenv("CODEHOOK_OFFLINE", "") not in ["", "0", "false"]
+        )
+        self.concurrency = concurrency or os.cpu_count()
+
+    def platform_options(self) -> list[str]:
+        """
+        :return: The pip options that select the wheels of the runtime and platform.
+        """
+        version = self.runtime.removeprefix("python")
+        abi = "cp" + version.replace(".", "")
+        options = ["--only-binary=:all:", "--implementation", "cp"]
+        options += ["--python-version", version, "--abi", abi]
+        for platform in PLATFORMS[self.architecture]:
+            options += ["--platform", platform]
+        return options
+
+    def _pip(self, *args: str):
+        command = [sys.executable, "-m", "pip", *args, "--disable-pip-version-check"]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise WheelhouseError(
+                f"pip {args[0]} exited with code {result.returncode} for "
+                f"{self.runtime} on {self.architecture}:\n{result.stderr.strip()}"
+            )
+        return result
+
+    def download(self, requirements_path):
+        """
+        Downloads the wheels of the requirements and their dependencies into the
+        wheelhouse.
+
+        :param requirements_path: The path of the requirements.txt file.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        print(f"Downloading wheels for {self.runtime} on {self.architecture}")
+        with tracing.span("pip download", "build"):
+            self._pip(
+                "download",
+                "--requirement",
+                str(requirements_path),
+                "--dest",
+                str(self.path),
+                *self.platform_options(),
+            )
+
+    def resolve(self, requirements_path) -> list[Path]:
+        """
+        Resolves the requirements against the wheelhouse only, without the network.
+
+        :param requirements_path: The path of the requirements.txt file.
+        :return: The wheels to install.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            tracing.span("pip resolve", "build"),
+        ):
+            report = Path(directory) / "report.json"
+            # pip only takes platform options when installing to a target, which
+            # --dry-run leaves untouched
+            self._pip(
+                "install",
+                "--dry-run",
+                "--ignore-installed",
+                "--no-index",
+                "--find-links",
+                str(self.path),
+                "--target",
+                str(Path(directory) / "target"),
+                "--report",
+                str(report),
+                "--requirement",
+                str(requirements_path),
+                *self.platform_options(),
+            )
+            resolved = json.loads(report.read_text())["install"]
+        return [
+            Path(urllib.request.url2pathname(urllib.parse.urlparse(url).path))
+            for url in (item["download_info"]["url"] for item in resolved)
+        ]
+
+    def wheels(self, requirements_path) -> list[Path]:
+        """
+        Resolves the requirements, downloading the missing wheels unless offline.
+
+        :param requirements_path: The path of the requirements.txt file.
+        :return: The wheels to install.
+        """
+        try:
+            return self.resolve(requirements_path)
+        except WheelhouseError:
+            if self.offline:
+                raise
+        self.download(requirements_path)
+        return self.resolve(requirements_path)
+
+    def install(self, requirements_path, target) -> list[Path]:
+        """
+        Installs the requirements into a directory, from the wheelhouse.
+
+        :param requirements_path: The path of the requirements.txt file.
+        :param target: The directory to install the packages into.
+        :return: The installed wheels.
+        """
+        wheels = self.wheels(requirements_path)
+        print(
+            f"Installing {len(wheels)} wheels for {self.runtime} on {self.architecture}"
+        )
+        with (
+            tracing.span("unpack wheels", "build", wheels=len(wheels)),
+            ThreadPoolExecutor(max_workers=self.concurrency) as executor,
+        ):
+            futures = [
+                tracing.run_in_context(executor, install_wheel, wheel, target)
+                for wheel in wheels
+            ]
+            for future in futures:
+                future.result()
+        return wheels
+
+
+def install_wheel(wheel: Path, target):
+    """
+    Unpacks a wheel into a directory, like pip install --target does: the files of its
+    .data/purelib and .data/platlib directories go to the root, and its scripts,
+    headers and data files are left out.
+
+    :param wheel: The path of the wheel.
+    :param target: The directory to install the wheel into.
+    """
+    target = Path(target)
+    with zipfile.ZipFile(wheel) as zipped:
+        for info in zipped.infolist():
+            parts = PurePosixPath(info.filename).parts
+            if info.is_dir() or not parts:
+                continue
+            if parts[0].endswith(".data"):
+                if len(parts) < 3 or parts[1] not in ["purelib", "platlib"]:
+                    continue
+                parts = parts[2:]
+            if PurePosixPath(info.filename).is_absolute() or ".." in parts:
+                raise WheelhouseError(f"Unsafe path {info.filename} in {wheel.name}")
+            destination = target.joinpath(*parts)
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            with zipped.open(info) as source, open(destination, "wb") as file:
+                while chunk := source.read(1024 * 1024):
+                    file.write(chunk)
@@ -0,0 +1,116 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from codehook import archive
+
+
+@pytest.fixture
+def my_tree(tmp_path):
+    tree = tmp_path / "tree"
+    (tree / "stripe" / "api_resources").mkdir(parents=True)
+    (tree / "handler.py").write_text("def handler_logic(event): pass\n" * 50)
+    (tree / "stripe" / "__init__.py").write_text("")
+    (tree / "stripe" / "api_resources" / "charge.py").write_text("class Charge: pass\n")
+    (tree / "__pycache__").mkdir()
+    (tree / "__pycache__" / "handler.cpython-311.pyc").write_bytes(b"bytecode")
+    return tree
+
+
+def read(package):
+    return zipfile.ZipFile(io.BytesIO(package))
+
+
+class TestBuildArchive:
+    def test_recursive_and_sorted(self, my_tree):
+        with read(archive.build_tree_archive(my_tree)) as zipped:
+            assert zipped.namelist() == [
+                "handler.py",
+                "stripe/__init__.py",
+                "stripe/api_resources/charge.py",
+            ]
+            assert zipped.read("stripe/api_resources/charge.py") == (
+                b"class Charge: pass\n"
+            )
+
+    def test_deterministic(self, my_tree):
+        first = archive.build_tree_archive(my_tree)
+        os.utime(my_tree / "handler.py", (0, 0))
+        (my_tree / "stripe" / "__init__.py").chmod(0o600)
+
+        assert archive.build_tree_archive(my_tree) == first
+
+    def test_fixed_timestamps_and_permissions(self, my_tree):
+        (my_tree / "bootstrap").write_text("#!/bin/sh\n")
+        (my_tree / "bootstrap").chmod(0o700)
+
+        with read(archive.build_tree_archive(my_tree)) as zipped:
+            infos = {info.filename: info for info in zipped.infolist()}
+
+        assert {info.date_time for info in infos.values()} == {archive.ZIP_DATE}
+        assert infos["bootstrap"].external_attr >> 16 == 0o100755
+        assert infos["handler.py"].external_attr >> 16 == 0o100644
+
+    def test_compression_level(self, my_tree, monkeypatch):
+        stored = archive.build_tree_archive(my_tree, level=0)
+        with read(stored) as zipped:
+            assert zipped.getinfo("handler.py").compress_type == zipfile.ZIP_STORED
+
+        monkeypatch.setenv("CODEHOOK_COMPRESSION_LEVEL", "9")
+        compressed = archive.build_tree_archive(my_tree)
+        with read(compressed) as zipped:
+            assert zipped.getinfo("handler.py").compress_type == zipfile.ZIP_DEFLATED
+        assert len(compressed) < len(stored)
+
+    def test_invalid_compression_level(self):
+        with pytest.raises(ValueError):
+            archive.compression_level(10)
+
+    def test_roots_and_prefixes(self, my_tree, tmp_path):
+        other = tmp_path / "other"
+        other.mkdir()
+        (other / "handler.py").write_text("shadowed")
+        (other / "extra.py").write_text("")
+
+        with read(archive.build_tree_archive(my_tree, (other, "python/"))) as zipped:
+            assert "python/handler.py" in zipped.namelist()
+        with read(archive.build_tree_archive(my_tree, other)) as zipped:
+            assert zipped.read("handler.py") != b"shadowed"
+            assert "extra.py" in zipped.namelist()
+
+    def test_bytes_entries(self):
+        package = archive.build_archive({"b.py": b"b", "a.py": b"a"})
+        with read(package) as zipped:
+            assert zipped.namelist() == ["a.py", "b.py"]
+        assert archive.build_archive({"a.py": b"a", "b.py": b"b"}) == package
+
+
+class TestAppendArchive:
+    def test_append(self, my_tree, tmp_path):
+        base = archive.build_tree_archive(my_tree)
+        handler = tmp_path / "main.py"
+        handler.write_text("print('main')")
+        package = archive.append_archive(base, {"main.py": handler})
+
+        # The entries of the base are copied as they are
+        assert package.startswith(base[: base.index(b"PK\x01\x02")])
+        with read(package) as zipped:
+            assert zipped.namelist()[-1] == "main.py"
+            assert zipped.read("main.py") == b"print('main')"
+        assert archive.append_archive(base, {"main.py": handler}) == package
+
+    def test_replace(self, my_tree):
+        (my_tree / "bootstrap").write_text("#!/bin/sh\n")
+        (my_tree / "bootstrap").chmod(0o755)
+        base = archive.build_tree_archive(my_tree)
+        package = archive.append_archive(base, {"handler.py": b"replaced"})
+
+        with read(package) as zipped:
+            assert zipped.namelist().count("handler.py") == 1
+            assert zipped.read("handler.py") == b"replaced"
+            assert zipped.getinfo("bootstrap").external_attr >> 16 == 0o100755
+        assert package == archive.build_archive(
+            {**archive.tree_entries(my_tree), "handler.py": b"replaced"}
+        )
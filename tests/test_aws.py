@@ -13,7 +13,11 @@ def my_aws():
 
 @pytest.fixture(scope="module")
 def my_lambda():
-    return Lambda(boto3.client("lambda"), boto3.resource("iam"))
+    return Lambda(
+        boto3.client("lambda"),
+        boto3.resource("iam"),
+        boto3.client("resourcegroupstaggingapi"),
+    )
 
 
 @pytest.fixture(scope="module")
@@ -0,0 +1,317 @@
+import io
+import json
+import shutil
+import zipfile
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from codehook.aws import AWS, LAMBDA_RUNTIME, LOG_SETTINGS, Lambda
+from codehook.cache import BuildCache
+from codehook.slim import cache_name, python_version
+
+REQUIREMENTS = "./codehook/skeletons/stripe/requirements.txt"
+UNRELATED_FUNCTIONS = 2000
+UNRELATED_APIS = 500
+
+
+@pytest.fixture
+def aws_credentials(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+
+@pytest.fixture
+def my_lambda(aws_credentials):
+    with mock_aws():
+        yield Lambda(
+            boto3.client("lambda"),
+            boto3.resource("iam"),
+            boto3.client("resourcegroupstaggingapi"),
+        )
+
+
+@pytest.fixture
+def my_aws(aws_credentials, monkeypatch, my_cache):
+    monkeypatch.setenv("IAM_ROLE_NAME", "CODEHOOK_LAMBDA_ROLE")
+    monkeypatch.setenv("STRIPE_API_KEY", "sk_test")
+    with mock_aws():
+        boto3.client("iam").create_role(
+            RoleName="CODEHOOK_LAMBDA_ROLE", AssumeRolePolicyDocument="{}"
+        )
+        yield AWS(my_cache)
+
+
+@pytest.fixture
+def my_source(tmp_path):
+    source = tmp_path / "source"
+    shutil.copytree(
+        "./codehook/skeletons/stripe",
+        source,
+        ignore=shutil.ignore_patterns("__pycache__"),
+    )
+    shutil.copy("./tests/handler.py", source / "handler.py")
+    return source
+
+
+@pytest.fixture
+def my_cache(tmp_path):
+    cache = BuildCache(tmp_path / "cache")
+    # Seed the layer package, so the tests do not install the dependencies
+    cache.put(Lambda.get_layer_name(REQUIREMENTS), b"layer package")
+    return cache
+
+
+class TestDependenciesLayer:
+    def test_layer_name_depends_on_requirements(self, tmp_path):
+        requirements = tmp_path / "requirements.txt"
+        requirements.write_text("stripe==7.6.0")
+        name = Lambda.get_layer_name(requirements)
+        requirements.write_text("stripe==7.7.0")
+
+        assert name.startswith("codehook-dependencies-")
+        assert name != Lambda.get_layer_name(requirements)
+
+    def test_layer_name_depends_on_runtime(self):
+        assert Lambda.get_layer_name(REQUIREMENTS, "python3.11") != (
+            Lambda.get_layer_name(REQUIREMENTS, "python3.12")
+        )
+
+    def test_publish_layer(self, my_lambda, my_cache):
+        result = my_lambda.get_dependencies_layer(REQUIREMENTS, my_cache)
+        assert Lambda.get_layer_name(REQUIREMENTS) in result
+
+    def test_reuse_layer(self, my_lambda, my_cache):
+        first = my_lambda.get_dependencies_layer(REQUIREMENTS, my_cache)
+        my_cache.clear()
+        second = my_lambda.get_dependencies_layer(REQUIREMENTS, my_cache)
+
+        assert first == second
+        versions = my_lambda.lambda_client.list_layer_versions(
+            LayerName=Lambda.get_layer_name(REQUIREMENTS)
+        )["LayerVersions"]
+        assert len(versions) == 1
+
+
+class TestDeploymentPackage:
+    def test_package_without_dependencies(self, tmp_path):
+        (tmp_path / "handler.py").write_text("def handler_logic(body): pass")
+        (tmp_path / "requirements.txt").write_text("stripe")
+
+        result = Lambda.create_deployment_package(tmp_path, install_dependencies=False)
+        expected = ["handler.py", "requirements.txt"]
+        # The modules are only precompiled by the Python version of the runtime
+        if python_version() == LAMBDA_RUNTIME.removeprefix("python"):
+            expected.insert(0, cache_name("handler.py"))
+        with zipfile.ZipFile(io.BytesIO(result)) as zipped:
+            assert sorted(zipped.namelist()) == expected
+
+
+class TestFunctionEnvironment:
+    def test_log_settings(self, my_aws, my_source, monkeypatch):
+        monkeypatch.setenv("CODEHOOK_LOG_LEVEL", "WARNING")
+        my_aws = AWS(my_aws.build_cache)
+        my_aws.create_function("test_function", my_source)
+
+        variables = my_aws.lambda_client.get_function_configuration(
+            FunctionName="test_function"
+        )["Environment"]["Variables"]
+        assert variables["LOG_LEVEL"] == "WARNING"
+        assert variables["LOG_REDACT"] == LOG_SETTINGS["LOG_REDACT"]
+
+
+class TestIdempotencyStore:
+    def test_create_idempotency_store(self, my_aws):
+        assert my_aws.create_idempotency_store() == AWS.IDEMPOTENCY_TABLE
+        # The table is shared by every deployment
+        assert my_aws.create_idempotency_store() == AWS.IDEMPOTENCY_TABLE
+
+        dynamodb_client = boto3.client("dynamodb")
+        ttl = dynamodb_client.describe_time_to_live(TableName=AWS.IDEMPOTENCY_TABLE)
+        assert ttl["TimeToLiveDescription"]["AttributeName"] == "expires_at"
+        policy = boto3.client("iam").get_role_policy(
+            RoleName="CODEHOOK_LAMBDA_ROLE", PolicyName=AWS.IDEMPOTENCY_POLICY_NAME
+        )["PolicyDocument"]
+        assert "dynamodb:PutItem" in policy["Statement"][0]["Action"]
+
+    def test_function_environment(self, my_aws, my_source):
+        my_aws.create_function("test_function", my_source)
+        variables = my_aws.lambda_client.get_function_configuration(
+            FunctionName="test_function"
+        )["Environment"]["Variables"]
+
+        assert variables["IDEMPOTENCY_TABLE"] == AWS.IDEMPOTENCY_TABLE
+        assert variables["IDEMPOTENCY_NAMESPACE"] == "test_function"
+
+
+class TestUpdateFunction:
+    def test_update_missing_function(self, my_aws, my_source):
+        assert my_aws.update_function("missing_function", my_source) is None
+        assert boto3.client("dynamodb").list_tables()["TableNames"] == []
+
+    def test_update_unchanged_function(self, my_aws, my_source):
+        my_aws.create_function("test_function", my_source)
+        assert my_aws.update_function("test_function", my_source) is False
+        # The function already uses the store, so it isn't checked for again
+        assert boto3.client("dynamodb").list_tables()["TableNames"] == []
+
+    def test_update_adds_idempotency_store(self, my_aws, my_source):
+        my_aws.create_function("test_function", my_source)
+        # Like a function deployed before events were deduplicated
+        my_aws.lambda_wrapper.reconfigure_function(
+            "test_function", Environment={"Variables": {"API_KEY": "sk_test"}}
+        )
+
+        assert my_aws.update_function("test_function", my_source) is True
+        assert boto3.client("dynamodb").list_tables()["TableNames"] == [
+            AWS.IDEMPOTENCY_TABLE
+        ]
+
+    def test_update_log_settings(self, my_aws, my_source):
+        my_aws.create_function("test_function", my_source)
+        my_aws.log_settings["LOG_SAMPLE_RATE"] = "0.01"
+
+        assert my_aws.update_function("test_function", my_source) is True
+        configuration = my_aws.lambda_client.get_function_configuration(
+            FunctionName="test_function"
+        )
+        assert configuration["Environment"]["Variables"]["LOG_SAMPLE_RATE"] == "0.01"
+        assert my_aws.update_function("test_function", my_source) is False
+
+    def test_update_changed_function(self, my_aws, my_source):
+        my_aws.create_function("test_function", my_source)
+        shutil.copy("./tests/echo.py", my_source / "handler.py")
+
+        assert my_aws.update_function("test_function", my_source) is True
+        assert my_aws.update_function("test_function", my_source) is False
+
+
+@pytest.fixture
+def my_crowded_account(my_aws):
+    """
+    An account with thousands of functions and hundreds of APIs codehook didn't create
+    """
+    # Seed with clients of their own, as the ones of my_aws are throttled
+    lambda_client = boto3.client("lambda")
+    apigateway_client = boto3.client("apigateway")
+    role = my_aws.get_role().arn
+    package = io.BytesIO()
+    with zipfile.ZipFile(package, "w") as zipped:
+        zipped.writestr("handler.py", "def handler(event, context): pass")
+    for index in range(UNRELATED_FUNCTIONS):
+        lambda_client.create_function(
+            FunctionName=f"unrelated_{index}",
+            Runtime="python3.11",
+            Role=role,
+            Handler="handler.handler",
+            Code={"ZipFile": package.getvalue()},
+            Tags={"team": "billing"} if index % 2 else {},
+        )
+    for index in range(UNRELATED_APIS):
+        apigateway_client.create_rest_api(
+            name=f"unrelated_{index}",
+            tags={"codehook": "false"} if index % 2 else {},
+        )
+    return my_aws
+
+
+def count_calls(client):
+    calls = []
+    client.meta.events.register(
+        "before-call", lambda model, **kwargs: calls.append(model.name)
+    )
+    return calls
+
+
+class TestDiscovery:
+    def test_list_functions_by_tag(self, my_crowded_account, my_source):
+        function_arn = my_crowded_account.create_function("test_function", my_source)
+        lambda_calls = count_calls(my_crowded_account.lambda_client)
+        tagging_calls = count_calls(my_crowded_account.tagging_client)
+
+        assert my_crowded_account.list_functions() == ["test_function"]
+        assert tagging_calls == ["GetResources"]
+        assert lambda_calls == []
+
+        my_crowded_account.delete_function(function_arn)
+        assert my_crowded_account.list_functions() == []
+
+    def test_list_apis_by_tag(self, my_crowded_account):
+        api_id, _ = my_crowded_account.prepare_api("test_api")
+        apigateway_calls = count_calls(my_crowded_account.apigateway_client)
+
+        assert my_crowded_account.list_apis() == [api_id]
+        assert len(apigateway_calls) <= 2
+
+    def test_list_many_codehook_functions(self, my_crowded_account):
+        lambda_client = boto3.client("lambda")
+        names = [f"unrelated_{index}" for index in range(0, UNRELATED_FUNCTIONS, 10)]
+        for name in names:
+            function_arn = lambda_client.get_function(FunctionName=name)[
+                "Configuration"
+            ]["FunctionArn"]
+            lambda_client.tag_resource(Resource=function_arn, Tags={"codehook": "true"})
+
+        assert sorted(my_crowded_account.list_functions()) == sorted(names)
+
+
+class TestQueues:
+    def test_create_queue(self, my_aws):
+        queue_url = my_aws.create_queue("invoices")
+        sqs_client = boto3.client("sqs")
+        attributes = sqs_client.get_queue_attributes(
+            QueueUrl=queue_url, AttributeNames=["All"]
+        )["Attributes"]
+        redrive_policy = json.loads(attributes["RedrivePolicy"])
+
+        assert queue_url.endswith("/codehook-invoices")
+        assert redrive_policy["deadLetterTargetArn"].endswith(":codehook-invoices-dlq")
+        assert int(redrive_policy["maxReceiveCount"]) == AWS.MAX_RECEIVE_COUNT
+        assert int(attributes["VisibilityTimeout"]) == 6 * AWS.WORKER_TIMEOUT
+        policy = boto3.client("iam").get_role_policy(
+            RoleName="CODEHOOK_LAMBDA_ROLE", PolicyName=AWS.QUEUE_POLICY_NAME
+        )["PolicyDocument"]
+        assert "sqs:SendMessage" in policy["Statement"][0]["Action"]
+
+    def test_list_and_delete_queues(self, my_aws):
+        boto3.client("sqs").create_queue(QueueName="unrelated")
+        queue_url = my_aws.create_queue("invoices")
+
+        assert my_aws.list_queues() == [queue_url]
+        my_aws.delete_queue(queue_url)
+        assert my_aws.list_queues() == []
+        assert my_aws.sqs_wrapper.list_queues(AWS.QUEUE_PREFIX) == []
+
+    def test_function_keeps_its_queue(self, my_aws, my_source):
+        queue_url = my_aws.create_queue("test_function")
+        my_aws.create_function("test_function", my_source, queue=queue_url)
+        my_aws.log_settings["LOG_LEVEL"] = "DEBUG"
+
+        assert my_aws.update_function("test_function", my_source) is True
+        variables = my_aws.lambda_client.get_function_configuration(
+            FunctionName="test_function"
+        )["Environment"]["Variables"]
+        assert variables["QUEUE_URL"] == queue_url
+        assert variables["LOG_LEVEL"] == "DEBUG"
+
+    def test_worker(self, my_aws, my_source):
+        queue_url = my_aws.create_queue("test_function")
+        worker_arn = my_aws.create_worker("test_function", my_source, queue_url)
+        lambda_client = boto3.client("lambda")
+        configuration = lambda_client.get_function_configuration(
+            FunctionName="test_function-worker"
+        )
+
+        assert configuration["FunctionArn"] == worker_arn
+        assert configuration["Timeout"] == AWS.WORKER_TIMEOUT
+        assert "QUEUE_URL" not in configuration["Environment"]["Variables"]
+        (mapping,) = lambda_client.list_event_source_mappings(
+            FunctionName="test_function-worker"
+        )["EventSourceMappings"]
+        assert mapping["BatchSize"] == 10
+        assert mapping["FunctionResponseTypes"] == ["ReportBatchItemFailures"]
+
+        my_aws.delete_function("test_function-worker")
+        assert lambda_client.list_event_source_mappings()["EventSourceMappings"] == []
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import shutil
+
+import pytest
+
+from codehook import bench
+from codehook.server import FunctionServer, serving
+from codehook.skeletons.stripe_lean.stripe_signature import verify_header
+
+
+def run_against(invoke, **options):
+    """
+    Runs the benchmark against a server that answers with INVOKE.
+    """
+
+    async def main():
+        server = await FunctionServer(invoke).start()
+        try:
+            return await bench.run(server.url, **options)
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def my_function(tmp_path):
+    """
+    A function directory with the lean skeleton and the echo handler.
+    """
+    shutil.copytree("./codehook/skeletons/common", tmp_path, dirs_exist_ok=True)
+    shutil.copytree("./codehook/skeletons/stripe_lean", tmp_path, dirs_exist_ok=True)
+    shutil.copy("./tests/echo.py", tmp_path / "handler.py")
+    return tmp_path
+
+
+class TestPayloads:
+    def test_unique_ids(self):
+        payloads = bench.synthesize_payloads(3)
+        events = [json.loads(payload) for payload in payloads]
+
+        assert len({event["id"] for event in events}) == 3
+        assert all(event["type"] == "customer.subscription.updated" for event in events)
+
+    def test_signature(self):
+        (payload,) = bench.synthesize_payloads(1)
+        verify_header(payload, bench.sign(payload, "whsec_test"), "whsec_test")
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert bench.percentile(values, 50) == 50
+        assert bench.percentile(values, 99) == 99
+        assert bench.percentile([7], 95) == 7
+        assert bench.percentile([], 50) == 0.0
+
+
+class TestRun:
+    def test_report(self):
+        received = []
+
+        async def invoke(event):
+            received.append(event)
+            return {"statusCode": 200, "body": "ok"}
+
+        report = run_against(invoke, requests=50, concurrency=5)
+
+        assert report["succeeded"] == 50
+        assert report["failed"] == 0
+        assert report["throughput_rps"] > 0
+        latency = report["latency_ms"]
+        assert latency["min"] <= latency["p50"] <= latency["p95"] <= latency["p99"]
+        assert len({json.loads(event["body"])["id"] for event in received}) == 50
+        assert all("Stripe-Signature" in event["headers"] for event in received)
+
+    def test_error_breakdown(self):
+        count = 0
+
+        async def invoke(event):
+            nonlocal count
+            count += 1
+            if count % 5 == 0:
+                raise RuntimeError("Handler failed")
+            return {"statusCode": 400 if count % 2 else 200, "body": ""}
+
+        report = run_against(invoke, requests=20, concurrency=2)
+
+        assert report["errors"] == {"HTTP 400": 8, "HTTP 502": 4}
+        assert report["succeeded"] == 8
+
+    def test_rate(self):
+        async def invoke(event):
+            return {"statusCode": 200, "body": "ok"}
+
+        report = run_against(invoke, requests=20, rate=100, concurrency=4)
+
+        # The last request is due after 19 intervals of 10ms
+        assert report["duration_s"] >= 0.19
+        assert report["succeeded"] == 20
+
+    def test_connection_errors(self):
+        report = asyncio.run(bench.run("http://127.0.0.1:1/codehook", requests=3))
+
+        assert report["errors"] == {"ConnectionRefusedError": 3}
+
+
+class TestLocalFunction:
+    def test_signed_events_are_verified(self, my_function):
+        with serving(my_function, {"ENDPOINT_SECRET": "whsec_test"}) as url:
+            report = asyncio.run(bench.run(url, requests=20, secret="whsec_test"))
+            forged = asyncio.run(bench.run(url, requests=5, secret="whsec_other"))
+
+        assert report["succeeded"] == 20
+        assert forged["errors"] == {"HTTP 400": 5}
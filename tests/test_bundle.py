@@ -0,0 +1,108 @@
+import io
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from codehook import archive
+from codehook.bundle import Bundle, build_package
+from codehook.cache import BuildCache
+from codehook.core import SKELETONS_PATH
+
+SKELETON = [SKELETONS_PATH / "common", SKELETONS_PATH / "stripe"]
+
+
+@pytest.fixture
+def my_cache(tmp_path):
+    return BuildCache(tmp_path / "cache")
+
+
+@pytest.fixture
+def my_handlers(tmp_path):
+    handlers = []
+    for name in ["invoices", "refunds"]:
+        handler = tmp_path / f"{name}.py"
+        handler.write_text(f"def handler_logic(event):\n    return {name!r}\n")
+        handlers.append(handler)
+    return handlers
+
+
+def read(package, name):
+    with zipfile.ZipFile(io.BytesIO(package)) as zipped:
+        return zipped.read(name)
+
+
+class TestBundle:
+    def test_files_win_over_directories(self, my_handlers):
+        bundle = Bundle(*SKELETON, files={"handler.py": my_handlers[0]})
+        entries = bundle.entries()
+
+        assert entries["handler.py"] == my_handlers[0]
+        assert "handler.py" not in bundle.base_entries()
+        assert entries["dispatch.py"] == SKELETONS_PATH / "common" / "dispatch.py"
+        assert (
+            bundle.requirements_path == SKELETONS_PATH / "stripe" / "requirements.txt"
+        )
+
+    def test_write(self, my_handlers, tmp_path):
+        bundle = Bundle(*SKELETON, files={"handler.py": my_handlers[0]})
+        path = tmp_path / "lambda"
+        bundle.write(path)
+
+        assert (path / "handler.py").read_text() == my_handlers[0].read_text()
+        assert (path / "lambda_handler_rest.py").exists()
+
+    def test_of_directory(self, tmp_path):
+        bundle = Bundle.of(tmp_path)
+        assert Bundle.of(bundle) is bundle
+        assert bundle.directories == [tmp_path]
+        assert bundle.requirements_path is None
+
+
+class TestBuildPackage:
+    def test_base_is_shared(self, my_cache, my_handlers):
+        packages = [
+            build_package(
+                Bundle(*SKELETON, files={"handler.py": handler}), my_cache, "python3.11"
+            )
+            for handler in my_handlers
+        ]
+
+        assert len(my_cache.entries()) == 1
+        assert read(packages[0], "handler.py") != read(packages[1], "handler.py")
+        assert b"refunds" in read(packages[1], "handler.py")
+
+    def test_same_as_zipping_the_tree(self, my_cache, my_handlers, tmp_path):
+        bundle = Bundle(*SKELETON, files={"handler.py": my_handlers[0]})
+        package = build_package(bundle, my_cache, "python3.11")
+        tree = archive.build_tree_archive(bundle.write(tmp_path / "lambda"))
+
+        with zipfile.ZipFile(io.BytesIO(package)) as zipped:
+            files = {name: zipped.read(name) for name in zipped.namelist()}
+        with zipfile.ZipFile(io.BytesIO(tree)) as zipped:
+            assert files == {name: zipped.read(name) for name in zipped.namelist()}
+
+    def test_deterministic(self, my_cache, my_handlers):
+        bundle = Bundle(*SKELETON, files={"handler.py": my_handlers[0]})
+        cached = build_package(bundle, my_cache, "python3.11")
+        assert build_package(bundle, my_cache, "python3.11") == cached
+        assert build_package(bundle, None, "python3.11") == cached
+
+    def test_dependencies_are_in_the_base(self, my_cache, my_handlers):
+        installs = []
+
+        def install(requirements_path, target):
+            installs.append(requirements_path)
+            (Path(target) / "stripe").mkdir()
+            (Path(target) / "stripe" / "__init__.py").write_text("")
+
+        for handler in my_handlers:
+            package = build_package(
+                Bundle(*SKELETON, files={"handler.py": handler}),
+                my_cache,
+                "python3.11",
+                dependencies=install,
+            )
+
+        assert len(installs) == 1
+        assert read(package, "stripe/__init__.py") == b""
@@ -0,0 +1,77 @@
+import os
+import shutil
+
+import pytest
+
+from codehook.cache import BuildCache
+
+
+@pytest.fixture
+def my_cache(tmp_path):
+    return BuildCache(tmp_path / "cache", max_size=1024)
+
+
+@pytest.fixture
+def my_source(tmp_path):
+    source = tmp_path / "source"
+    shutil.copytree(
+        "./codehook/skeletons/stripe",
+        source,
+        ignore=shutil.ignore_patterns("__pycache__"),
+    )
+    shutil.copy("./tests/handler.py", source / "handler.py")
+    return source
+
+
+class TestBuildCache:
+    def test_key_is_stable(self, my_cache, my_source):
+        key = my_cache.compute_key(my_source, "python3.11")
+        assert key == my_cache.compute_key(my_source, "python3.11")
+
+    def test_key_changes_with_runtime(self, my_cache, my_source):
+        key = my_cache.compute_key(my_source, "python3.11")
+        assert key != my_cache.compute_key(my_source, "python3.12")
+
+    def test_key_changes_with_handler(self, my_cache, my_source):
+        key = my_cache.compute_key(my_source, "python3.11")
+        shutil.copy("./tests/echo.py", my_source / "handler.py")
+        assert key != my_cache.compute_key(my_source, "python3.11")
+
+    def test_key_ignores_bytecode(self, my_cache, my_source):
+        key = my_cache.compute_key(my_source, "python3.11")
+        (my_source / "__pycache__").mkdir()
+        (my_source / "__pycache__" / "handler.cpython-311.pyc").write_bytes(b"pyc")
+        assert key == my_cache.compute_key(my_source, "python3.11")
+
+    def test_get_missing(self, my_cache):
+        assert my_cache.get("missing") is None
+
+    def test_put_and_get(self, my_cache):
+        my_cache.put("key", b"package")
+        assert my_cache.get("key") == b"package"
+        assert my_cache.size() == len(b"package")
+
+    def test_evicts_least_recently_used(self, my_cache):
+        my_cache.put("old", b"0" * 400)
+        my_cache.put("used", b"1" * 400)
+        os.utime(my_cache.path / "old.zip", (0, 0))
+        os.utime(my_cache.path / "used.zip", (1, 1))
+        my_cache.get("used")
+        my_cache.put("new", b"2" * 400)
+
+        keys = [key for key, _, _ in my_cache.entries()]
+        assert "old" not in keys
+        assert "used" in keys
+        assert "new" in keys
+
+    def test_prune(self, my_cache):
+        my_cache.put("first", b"0" * 400)
+        my_cache.put("second", b"1" * 400)
+        evicted = my_cache.prune(max_size=500)
+        assert len(evicted) == 1
+        assert my_cache.size() <= 500
+
+    def test_clear(self, my_cache):
+        my_cache.put("key", b"package")
+        assert my_cache.clear() == ["key"]
+        assert my_cache.entries() == []
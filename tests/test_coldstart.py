@@ -0,0 +1,89 @@
+from pathlib import Path
+
+import pytest
+
+from codehook import coldstart
+from codehook.aws import Lambda
+from codehook.core import CodehookCore
+from codehook.model import CloudName, SourceName
+
+ECHO = Path(__file__).parent / "echo.py"
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       900 |        900 | _frozen_importlib_external
+codehook: importing the handler
+import time:       120 |        120 |     _json
+import time:       873 |        993 |   json.decoder
+import time:       100 |        100 |   json.scanner
+import time:       650 |       1743 | json
+import time:      3000 |       3000 |   _hashlib
+import time:       500 |       3500 | hashlib
+import time:       400 |       5643 | lambda_handler_rest
+"""
+
+
+@pytest.fixture
+def my_core(tmp_path, monkeypatch):
+    monkeypatch.setenv("CODEHOOK_CACHE_DIR", str(tmp_path / "cache"))
+    return CodehookCore(CloudName.local)
+
+
+class TestParseImporttime:
+    def test_tree(self):
+        modules = coldstart.parse_importtime(IMPORTTIME)
+
+        assert [node.name for node in modules] == [
+            "json",
+            "hashlib",
+            "lambda_handler_rest",
+        ]
+        json_node = modules[0]
+        assert [node.name for node in json_node.children] == [
+            "json.decoder",
+            "json.scanner",
+        ]
+        assert json_node.children[0].children[0].name == "_json"
+        assert json_node.self_time == pytest.approx(0.00065)
+        assert json_node.cumulative == pytest.approx(0.001743)
+
+    def test_ranked(self):
+        profile = coldstart.ColdStart(0.006, coldstart.parse_importtime(IMPORTTIME))
+        result = profile.to_dict()
+
+        assert [node["module"] for node in result["imports"]] == [
+            "lambda_handler_rest",
+            "hashlib",
+            "json",
+        ]
+        assert result["imports"][2]["imports"][0]["module"] == "json.decoder"
+        assert result["init_ms"] == 6
+
+
+class TestRun:
+    def test_package(self, my_core):
+        bundle = my_core.bundle_files(ECHO, SourceName.stripe, lean=True)
+        package = Lambda.create_deployment_package(bundle, install_dependencies=False)
+        profile = coldstart.run(package)
+
+        assert profile.init > 0
+        assert [node.name for node in profile.modules][-1] == "lambda_handler_rest"
+        names = {child.name for child in profile.modules[-1].children}
+        assert {"handler", "stripe_signature"} <= names
+
+    def test_missing_dependency(self, my_core, tmp_path):
+        # Left out of the package, and no layer provides it
+        handler = tmp_path / "handler.py"
+        handler.write_text("import codehook_missing\n")
+        bundle = my_core.bundle_files(handler, SourceName.stripe, lean=True)
+        package = Lambda.create_deployment_package(bundle, install_dependencies=False)
+
+        with pytest.raises(coldstart.ColdStartError, match="codehook_missing"):
+            coldstart.run(package)
+
+    def test_budget(self, my_core):
+        result = my_core.coldstart(ECHO, SourceName.stripe, lean=True, runs=1)
+        assert result["init_ms"] > 0
+        assert result["imports"][0]["module"] == "lambda_handler_rest"
+
+        assert my_core.coldstart(ECHO, SourceName.stripe, lean=True, budget=0) is None
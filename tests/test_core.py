@@ -0,0 +1,206 @@
+import json
+import threading
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from codehook.aws import Lambda
+from codehook.core import CodehookCore, imports_module
+from codehook.model import CloudName, Events, SourceName
+
+
+@pytest.fixture
+def my_core(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("STRIPE_API_KEY", "sk_test")
+    monkeypatch.setenv("CODEHOOK_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("CODEHOOK_STATE", str(tmp_path / "state.db"))
+    with mock_aws():
+        core = CodehookCore(CloudName.aws)
+        monkeypatch.setattr(core.stripe_wrapper, "list_webhooks", lambda: ["we_123"])
+        yield core
+
+
+class TestList:
+    def test_list_from_state(self, my_core, capsys):
+        my_core.state.record(
+            "invoices", function_arn="invoices", api_id="abc123", webhook_id="we_123"
+        )
+
+        assert my_core.list() == (["abc123"], ["invoices"], ["we_123"], [])
+        assert "From the local state" in capsys.readouterr().out
+
+    def test_list_json(self, my_core, capsys):
+        my_core.state.record("invoices", function_arn="invoices", api_id="abc123")
+        my_core.list(json_output=True)
+        output = json.loads(capsys.readouterr().out)
+
+        assert output["apis"] == ["abc123"]
+        assert output["functions"] == ["invoices"]
+        assert output["webhooks"] == []
+        assert output["deployments"][0]["name"] == "invoices"
+
+    def test_refresh_json(self, my_core, capsys):
+        boto3.client("apigateway").create_rest_api(
+            name="invoices", tags={"codehook": "true"}
+        )
+        my_core.list(refresh=True, json_output=True)
+        output = json.loads(capsys.readouterr().out)
+
+        assert len(output["apis"]) == 1
+        assert output["functions"] == []
+        assert output["webhooks"] == ["we_123"]
+
+    def test_refresh_lists_concurrently(self, my_core, monkeypatch):
+        def slowly(result):
+            def list_resources():
+                time.sleep(0.5)
+                return result
+
+            return list_resources
+
+        monkeypatch.setattr(my_core.cloud, "list_apis", slowly(["abc123"]))
+        monkeypatch.setattr(my_core.cloud, "list_functions", slowly(["invoices"]))
+        monkeypatch.setattr(my_core.stripe_wrapper, "list_webhooks", slowly([]))
+        monkeypatch.setattr(my_core.cloud, "list_queues", slowly([]))
+
+        started = time.perf_counter()
+        result = my_core.list(refresh=True)
+
+        assert time.perf_counter() - started < 1.0
+        assert result == (["abc123"], ["invoices"], [], [])
+        assert my_core.state.get("invoices")["function_arn"] == "invoices"
+
+
+class TestDelete:
+    def test_delete_all_from_state(self, my_core, capsys):
+        apigateway = boto3.client("apigateway")
+        recorded, other = [
+            apigateway.create_rest_api(name=name, tags={"codehook": "true"})["id"]
+            for name in ["invoices", "from-ci"]
+        ]
+        my_core.state.record("invoices", api_id=recorded)
+
+        my_core.delete(delete_all=True)
+
+        # Deployments that this machine didn't record are left, with a warning
+        assert my_core.cloud.list_apis() == [other]
+        assert "Only the deployments recorded in the local state" in (
+            capsys.readouterr().out
+        )
+
+    def test_functions_are_not_held_up_by_apis(self, my_core, monkeypatch):
+        for index in range(20):
+            my_core.state.record(
+                f"handler{index}", function_arn=f"handler{index}", api_id=f"api{index}"
+            )
+        api_lock = threading.Lock()
+        api_deleted, function_deleted = [], []
+
+        def delete_api(id):
+            # Like the throttle, which lets one API deletion through at a time
+            with api_lock:
+                time.sleep(0.05)
+                api_deleted.append(time.perf_counter())
+
+        monkeypatch.setattr(my_core.cloud, "delete_api", delete_api)
+        monkeypatch.setattr(
+            my_core.cloud,
+            "delete_function",
+            lambda id: function_deleted.append(time.perf_counter()),
+        )
+
+        my_core.delete(delete_all=True)
+
+        assert len(api_deleted) == len(function_deleted) == 20
+        assert max(function_deleted) < api_deleted[1]
+        assert my_core.state.all() == []
+
+
+class TestLeanSkeleton:
+    def test_imports_module(self, tmp_path):
+        handler = tmp_path / "handler.py"
+        for source in [
+            "import stripe",
+            "from stripe import Customer",
+            "import stripe.error",
+        ]:
+            handler.write_text(f"def handler_logic(body):\n    {source}\n")
+            assert imports_module(handler, "stripe")
+        for source in ["import stripes", "from . import stripe", "x = 'import stripe'"]:
+            handler.write_text(source)
+            assert not imports_module(handler, "stripe")
+
+    def test_lean_skeleton_without_stripe(self, my_core, tmp_path):
+        my_core.copy_files("tests/echo.py", SourceName.stripe, str(tmp_path), lean=True)
+
+        assert (tmp_path / "stripe_signature.py").exists()
+        assert not Lambda.has_requirements(tmp_path / "requirements.txt")
+
+    def test_lean_skeleton_with_stripe(self, my_core, tmp_path):
+        handler = tmp_path / "stripe_handler.py"
+        handler.write_text("import stripe\n\ndef handler_logic(body):\n    pass\n")
+        lambda_path = tmp_path / "lambda"
+        my_core.copy_files(handler, SourceName.stripe, str(lambda_path), lean=True)
+
+        assert (lambda_path / "requirements.txt").read_text().strip() == "stripe"
+
+    def test_lean_function_has_no_layer(self, my_core, tmp_path):
+        boto3.client("iam").create_role(
+            RoleName="CODEHOOK_LAMBDA_ROLE", AssumeRolePolicyDocument="{}"
+        )
+        my_core.cloud.iam_role_name = "CODEHOOK_LAMBDA_ROLE"
+        my_core.copy_files("tests/echo.py", SourceName.stripe, str(tmp_path), lean=True)
+        my_core.cloud.create_function("echo", str(tmp_path))
+
+        configuration = boto3.client("lambda").get_function_configuration(
+            FunctionName="echo"
+        )
+        assert configuration.get("Layers", []) == []
+
+
+class TestAsynchronousDeployment:
+    def test_deploy_and_delete(self, my_core, monkeypatch):
+        boto3.client("iam").create_role(
+            RoleName="CODEHOOK_LAMBDA_ROLE", AssumeRolePolicyDocument="{}"
+        )
+        my_core.cloud.iam_role_name = "CODEHOOK_LAMBDA_ROLE"
+        monkeypatch.setattr(
+            my_core.stripe_wrapper, "create_webhook", lambda events, url: "we_123"
+        )
+        monkeypatch.setattr(my_core.stripe_wrapper, "delete_webhook", lambda id: None)
+
+        my_core.deploy(
+            "tests/echo.py",
+            "echo",
+            SourceName.stripe,
+            [Events.all],
+            lean=True,
+            asynchronous=True,
+        )
+        deployment = my_core.state.get("echo")
+        lambda_client = boto3.client("lambda")
+        variables = lambda_client.get_function_configuration(FunctionName="echo")[
+            "Environment"
+        ]["Variables"]
+        worker = lambda_client.get_function_configuration(FunctionName="echo-worker")
+        (mapping,) = lambda_client.list_event_source_mappings(
+            FunctionName="echo-worker"
+        )["EventSourceMappings"]
+
+        assert variables["QUEUE_URL"] == deployment["queue_url"]
+        assert variables["IDEMPOTENCY_NAMESPACE"] == "echo"
+        assert worker["Environment"]["Variables"]["IDEMPOTENCY_NAMESPACE"] == "echo"
+        assert worker["FunctionArn"] == deployment["worker_arn"]
+        assert worker["Handler"] == "lambda_handler_rest.worker_handler"
+        assert mapping["EventSourceArn"].endswith(":codehook-echo")
+
+        my_core.delete(name="echo")
+        assert my_core.state.get("echo") is None
+        assert my_core.cloud.list_functions() == []
+        assert my_core.cloud.list_queues() == []
+        assert boto3.client("sqs").list_queues().get("QueueUrls", []) == []
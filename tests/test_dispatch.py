@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from codehook.skeletons.common.dispatch import Registry, peek_type
+
+
+@pytest.fixture
+def my_payload():
+    with open("./codehook/skeletons/stripe/example_payload.json") as payload:
+        return payload.read()
+
+
+@pytest.fixture
+def my_registry():
+    registry = Registry()
+    for pattern in ["invoice.paid", "invoice.*", "invoice.payment.*", "*"]:
+        registry.on(pattern)(lambda event, pattern=pattern: (200, pattern))
+    return registry
+
+
+class TestRegistry:
+    @pytest.mark.parametrize(
+        "event_type, pattern",
+        [
+            ("invoice.paid", "invoice.paid"),
+            ("invoice.created", "invoice.*"),
+            ("invoice.payment.failed", "invoice.payment.*"),
+            ("charge.succeeded", "*"),
+        ],
+    )
+    def test_resolve(self, my_registry, event_type, pattern):
+        assert my_registry.handle({"type": event_type}) == (200, pattern)
+
+    def test_unhandled_type(self):
+        registry = Registry()
+        registry.on("invoice.*")(lambda event: (200, "invoice"))
+
+        assert registry.resolve("invoiceitem.created") is None
+        assert registry.resolve("invoice") is None
+        assert registry.handle({"type": "charge.failed"})[0] == 200
+
+    def test_empty_registry(self):
+        assert not Registry()
+
+
+class TestPeekType:
+    def test_type_before_data(self, my_payload):
+        assert peek_type(my_payload) == "customer.subscription.updated"
+        assert peek_type(my_payload.encode()) == "customer.subscription.updated"
+
+    def test_type_last(self, my_payload):
+        event = json.loads(my_payload)
+        event["type"] = event.pop("type")
+        payload = json.dumps(event).encode()
+
+        assert peek_type(payload) == "customer.subscription.updated"
+
+    @pytest.mark.parametrize(
+        "payload",
+        [
+            '{"data": {"object": {"type": "card"}}}',
+            '{"id": "evt_1", "request": {"type": "card"}}',
+            '{"id": "evt_1", "items": [{"type": "card"}]}',
+            '{"description": "\\"type\\": \\"card\\""}',
+            "{}",
+        ],
+    )
+    def test_nested_types_are_ignored(self, payload):
+        assert peek_type(payload) is None
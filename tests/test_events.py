@@ -0,0 +1,66 @@
+import pytest
+
+from codehook.events import expand_pattern, registered_events, registered_patterns
+from codehook.model import Events
+
+HANDLER = """
+from dispatch import on
+import dispatch
+
+
+@on("invoice.paid", "invoice.payment_failed")
+def invoice(body):
+    return (200, "invoice")
+
+
+@dispatch.on("payout.*")
+def payout(body):
+    return (200, "payout")
+
+
+@staticmethod
+def not_a_handler(body):
+    pass
+"""
+
+
+class TestRegisteredEvents:
+    def test_registered_patterns(self, tmp_path):
+        handler = tmp_path / "handler.py"
+        handler.write_text(HANDLER)
+
+        assert registered_patterns(handler) == [
+            "invoice.paid",
+            "invoice.payment_failed",
+            "payout.*",
+        ]
+
+    def test_registered_events(self, tmp_path):
+        handler = tmp_path / "handler.py"
+        handler.write_text(HANDLER)
+        events = registered_events(handler)
+
+        assert events[:2] == [Events.invoice_paid, Events.invoice_payment_failed]
+        assert Events.payout_paid in events
+        assert Events.payment_intent_created not in events
+
+    def test_handler_logic_only(self):
+        assert registered_events("tests/echo.py") == []
+
+    def test_wildcard(self, tmp_path):
+        handler = tmp_path / "handler.py"
+        handler.write_text(HANDLER + '\n@on("*")\ndef other(body):\n    pass\n')
+        assert registered_events(handler) == [Events.all]
+
+    def test_expand_pattern(self):
+        assert expand_pattern("charge.dispute.*") == [
+            Events.charge_dispute_closed,
+            Events.charge_dispute_created,
+            Events.charge_dispute_funds_reinstated,
+            Events.charge_dispute_funds_withdrawn,
+            Events.charge_dispute_updated,
+        ]
+        with pytest.raises(ValueError):
+            expand_pattern("unknown.*")
+        with pytest.raises(ValueError):
+            expand_pattern("unknown.event")
@@ -0,0 +1,107 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from codehook.skeletons.common.idempotency import (
+    DynamoDBStore,
+    Idempotency,
+    LocalStore,
+)
+
+EVENT = {"id": "evt_123", "type": "invoice.paid"}
+
+
+@pytest.fixture
+def my_idempotency():
+    return Idempotency(LocalStore(), cache_size=2)
+
+
+@pytest.fixture
+def my_table(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        boto3.client("dynamodb").create_table(
+            TableName="codehook-idempotency",
+            AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield "codehook-idempotency"
+
+
+class TestIdempotency:
+    def test_duplicate_gets_first_response(self, my_idempotency):
+        assert my_idempotency.lookup(EVENT) is None
+        my_idempotency.remember(EVENT, (200, "Handled"))
+
+        assert my_idempotency.lookup(dict(EVENT)) == (200, "Handled")
+
+    def test_failures_are_not_remembered(self, my_idempotency):
+        my_idempotency.remember(EVENT, (500, "Database down"))
+        assert my_idempotency.lookup(EVENT) is None
+
+    def test_events_without_id(self, my_idempotency):
+        my_idempotency.remember({}, (200, "Handled"))
+        assert my_idempotency.lookup({}) is None
+        assert my_idempotency.lookup([]) is None
+
+    def test_cache_is_lru(self, my_idempotency):
+        for event_id in ["evt_1", "evt_2"]:
+            my_idempotency.remember({"id": event_id}, (200, event_id))
+        my_idempotency.lookup({"id": "evt_1"})
+        my_idempotency.remember({"id": "evt_3"}, (200, "evt_3"))
+
+        assert list(my_idempotency.cache) == ["evt_1", "evt_3"]
+        # Evicted responses are still in the store
+        assert my_idempotency.lookup({"id": "evt_2"}) == (200, "evt_2")
+
+    def test_namespace(self):
+        store = LocalStore()
+        Idempotency(store, "invoices").remember(EVENT, (200, "Handled"))
+
+        assert list(store.responses) == ["invoices:evt_123"]
+        assert Idempotency(store, "refunds").lookup(EVENT) is None
+
+    def test_local_store_expires(self):
+        store = LocalStore(ttl=-1)
+        store.put("evt_123", [200, "Handled"])
+        assert store.get("evt_123") is None
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.setenv("IDEMPOTENCY_NAMESPACE", "invoices")
+        monkeypatch.setenv("IDEMPOTENCY_CACHE_SIZE", "10")
+        idempotency = Idempotency.from_env()
+        assert isinstance(idempotency.store, LocalStore)
+        assert idempotency.namespace == "invoices"
+        assert idempotency.cache_size == 10
+
+        monkeypatch.setenv("IDEMPOTENCY_TABLE", "codehook-idempotency")
+        assert isinstance(Idempotency.from_env().store, DynamoDBStore)
+
+
+class TestDynamoDBStore:
+    def test_shared_between_instances(self, my_table):
+        Idempotency(DynamoDBStore(my_table)).remember(EVENT, (200, {"id": "in_1"}))
+
+        assert Idempotency(DynamoDBStore(my_table)).lookup(EVENT) == (
+            200,
+            {"id": "in_1"},
+        )
+
+    def test_expired_items_are_ignored(self, my_table):
+        store = DynamoDBStore(my_table, ttl=-10)
+        store.put("evt_123", [200, "Handled"])
+        assert store.get("evt_123") is None
+
+    def test_warm_duplicates_skip_the_table(self, my_table):
+        idempotency = Idempotency(DynamoDBStore(my_table))
+        idempotency.remember(EVENT, (200, "Handled"))
+        calls = []
+        idempotency.store.client.meta.events.register(
+            "before-call", lambda model, **kwargs: calls.append(model.name)
+        )
+
+        assert idempotency.lookup(EVENT) == (200, "Handled")
+        assert calls == []
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import socket
+import urllib.error
+import urllib.request
+
+import pytest
+from typer.testing import CliRunner
+
+from codehook import bench, local, main
+from codehook.core import CodehookCore
+from codehook.local import LocalCloud, Router
+from codehook.model import CloudName, Events, SourceName
+from codehook.server import FunctionServer
+
+HANDLER = """
+def handler_logic(event):
+    return (200, {"id": event["id"], "version": VERSION})
+
+VERSION = "{version}"
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def post(url, payload=b"{}", method="POST"):
+    request = urllib.request.Request(url, data=payload, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+@pytest.fixture
+def my_handler(tmp_path):
+    def write(version):
+        file = tmp_path / "handler.py"
+        file.write_text(HANDLER.replace('"{version}"', str(version)))
+        return file
+
+    return write
+
+
+@pytest.fixture
+def my_core(tmp_path, monkeypatch):
+    monkeypatch.setenv("CODEHOOK_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("CODEHOOK_LOCAL_PORT", str(free_port()))
+    monkeypatch.setattr(local, "LOCAL_HOME", tmp_path / "local")
+    core = CodehookCore(CloudName.local)
+    yield core
+    if core.cloud.server_process is not None:
+        core.cloud.server_process.terminate()
+        core.cloud.server_process.wait(30)
+
+
+@pytest.fixture
+def my_cloud(tmp_path):
+    return LocalCloud(path=tmp_path / "local", port=free_port())
+
+
+class TestLocalCloud:
+    def test_functions_and_apis(self, my_cloud, my_core, my_handler):
+        path = my_core.copy_files(
+            my_handler(1), SourceName.stripe, str(my_cloud.path / "build"), lean=True
+        )
+        function = my_cloud.create_function("invoices", path)
+        api_id = my_cloud.prepare_api("invoices")
+
+        assert function == "invoices"
+        assert my_cloud.list_functions() == ["invoices"]
+        assert my_cloud.list_apis() == [api_id]
+        assert my_cloud.list_queues() == []
+
+        my_cloud.delete_api(api_id)
+        my_cloud.delete_function(function)
+        assert my_cloud.list_apis() == my_cloud.list_functions() == []
+        with pytest.raises(FileNotFoundError):
+            my_cloud.delete_function(function)
+
+    def test_update_skips_unchanged_code(self, my_cloud, my_core, my_handler, tmp_path):
+        build = str(tmp_path / "build")
+        my_cloud.create_function(
+            "invoices",
+            my_core.copy_files(my_handler(1), SourceName.stripe, build, lean=True),
+        )
+
+        assert my_cloud.update_function("invoices", build) is False
+        my_core.copy_files(my_handler(2), SourceName.stripe, build, lean=True)
+        assert my_cloud.update_function("invoices", build) is True
+        assert my_cloud.update_function("refunds", build) is None
+
+    def test_no_queues(self, my_cloud):
+        with pytest.raises(ValueError):
+            my_cloud.create_queue("invoices")
+
+
+class TestRouter:
+    def run(self, cloud, requests):
+        """
+        Serves the APIs of CLOUD in this process, and sends it REQUESTS as
+        (path, method, payload). Returns the (status, body) of each.
+        """
+
+        async def main():
+            router = Router(cloud.path, concurrency=1)
+            server = await FunctionServer(router.invoke).start()
+            try:
+                loop = asyncio.get_running_loop()
+                return [
+                    await loop.run_in_executor(
+                        None,
+                        post,
+                        f"http://127.0.0.1:{server.port}{path}",
+                        payload,
+                        method,
+                    )
+                    for path, method, payload in requests
+                ]
+            finally:
+                await server.close()
+                router.close()
+
+        return asyncio.run(main())
+
+    def test_routes_like_api_gateway(self, my_cloud, my_core, my_handler, tmp_path):
+        path = my_core.copy_files(
+            my_handler(1), SourceName.stripe, str(tmp_path / "build"), lean=True
+        )
+        function = my_cloud.create_function("invoices", path)
+        api_id = my_cloud.prepare_api("invoices")
+        local.write_json(
+            my_cloud.apis_path / f"{api_id}.json",
+            {"name": "invoices", "function": function},
+        )
+        (payload,) = bench.synthesize_payloads(1)
+
+        found, wrong_method, unknown = self.run(
+            my_cloud,
+            [
+                (f"/{api_id}/codehook", "POST", payload),
+                (f"/{api_id}/codehook", "PUT", payload),
+                ("/abc/codehook", "POST", payload),
+            ],
+        )
+
+        # The response shape of lambda_handler_rest
+        assert found == (
+            200,
+            {
+                "status_code": 200,
+                "body": {"id": json.loads(payload)["id"], "version": 1},
+            },
+        )
+        assert (
+            wrong_method
+            == unknown
+            == (403, {"message": "Missing Authentication Token"})
+        )
+
+    def test_failing_function(self, my_cloud, tmp_path):
+        broken = tmp_path / "broken"
+        broken.mkdir()
+        (broken / "lambda_handler_rest.py").write_text(
+            "def lambda_handler(event, _):\n    raise RuntimeError('Boom')\n"
+        )
+        my_cloud.create_function("broken", str(broken))
+        api_id = my_cloud.prepare_api("broken")
+        local.write_json(
+            my_cloud.apis_path / f"{api_id}.json",
+            {"name": "broken", "function": "broken"},
+        )
+
+        ((status, body),) = self.run(my_cloud, [(f"/{api_id}/codehook", "POST", b"{}")])
+
+        assert status == 502
+        assert body["message"] == "Internal server error"
+
+
+class TestLocalDeployment:
+    def test_no_asynchronous_deployments(self, my_core, my_handler, monkeypatch):
+        with pytest.raises(ValueError, match="no queues"):
+            my_core.deploy(
+                my_handler(1),
+                "invoices",
+                SourceName.stripe,
+                [Events.all],
+                asynchronous=True,
+            )
+        # Rejected before any step ran
+        assert my_core.cloud.list_functions() == []
+
+        # Restored after the test, as the --cloud option sets it
+        monkeypatch.setattr(main, "cloud_name", main.cloud_name)
+        result = CliRunner().invoke(
+            main.app,
+            ["--cloud", "local", "deploy", "--file", str(my_handler(1)), "--async"],
+        )
+        assert result.exit_code == 2
+        assert "no queues" in result.output
+
+    def test_deploy_update_delete(self, my_core, my_handler, tmp_path):
+        _, api_id, api_url, webhook_id = my_core.deploy(
+            my_handler(1), "invoices", SourceName.stripe, [Events.all], lean=True
+        )
+        (payload,) = bench.synthesize_payloads(1)
+
+        assert webhook_id is None
+        assert api_url == my_core.cloud.get_api_url(api_id)
+        assert post(api_url, payload)[1]["body"]["version"] == 1
+
+        assert my_core.update(my_handler(2), "invoices", SourceName.stripe, lean=True)
+        assert post(api_url, payload)[1]["body"]["version"] == 2
+
+        report = asyncio.run(bench.run(api_url, requests=50, concurrency=4))
+        assert report["succeeded"] == 50
+
+        my_core.delete(name="invoices")
+        assert my_core.cloud.list_apis() == my_core.cloud.list_functions() == []
+        assert my_core.state.all() == []
+
+    def test_traced_deploy(self, my_core, my_handler, tmp_path):
+        path = tmp_path / "deploy.json"
+        with my_core.trace("deploy-invoices", path, profile=True) as tracer:
+            my_core.deploy(
+                my_handler(1), "invoices", SourceName.stripe, [Events.all], lean=True
+            )
+        my_core.delete(name="invoices")
+        spans = {span.name: span for span in tracer.spans}
+
+        assert spans["function"].parent is spans["deploy invoices"]
+        assert spans["zip"].category == "build"
+        assert len(json.loads(path.read_text())["traceEvents"]) >= len(spans)
@@ -0,0 +1,71 @@
+import pytest
+
+from codehook.manifest import ManifestError, load_manifest
+from codehook.model import Events, SourceName
+
+
+@pytest.fixture
+def my_manifest(tmp_path):
+    (tmp_path / "handlers").mkdir()
+    (tmp_path / "handlers" / "echo.py").write_text("def handler_logic(body): pass")
+    return tmp_path / "codehook.toml"
+
+
+class TestManifest:
+    def test_load_manifest(self, my_manifest):
+        my_manifest.write_text("""
+            [[handler]]
+            file = "handlers/echo.py"
+            name = "echo_function"
+            enabled_events = ["charge.succeeded", "charge.failed"]
+            """)
+        result = load_manifest(my_manifest)
+
+        assert len(result) == 1
+        assert result[0]["file"] == my_manifest.parent / "handlers" / "echo.py"
+        assert result[0]["name"] == "echo_function"
+        assert result[0]["source"] == SourceName.stripe
+        assert result[0]["enabled_events"] == [
+            Events.charge_succeeded,
+            Events.charge_failed,
+        ]
+
+    def test_defaults(self, my_manifest):
+        my_manifest.write_text('[[handler]]\nfile = "handlers/echo.py"')
+        result = load_manifest(my_manifest)
+
+        assert result[0]["name"] == "echo"
+        assert result[0]["enabled_events"] == [Events.all]
+
+    def test_events_of_registered_handlers(self, my_manifest):
+        (my_manifest.parent / "handlers" / "payouts.py").write_text(
+            'from dispatch import on\n\n@on("payout.paid")\ndef paid(body):\n    pass\n'
+        )
+        my_manifest.write_text('[[handler]]\nfile = "handlers/payouts.py"')
+
+        assert load_manifest(my_manifest)[0]["enabled_events"] == [Events.payout_paid]
+
+    def test_missing_file(self, my_manifest):
+        my_manifest.write_text('[[handler]]\nfile = "handlers/missing.py"')
+        with pytest.raises(ManifestError):
+            load_manifest(my_manifest)
+
+    def test_unknown_event(self, my_manifest):
+        my_manifest.write_text(
+            '[[handler]]\nfile = "handlers/echo.py"\nenabled_events = ["charge.unknown"]'
+        )
+        with pytest.raises(ManifestError):
+            load_manifest(my_manifest)
+
+    def test_duplicate_name(self, my_manifest):
+        my_manifest.write_text(
+            '[[handler]]\nfile = "handlers/echo.py"\n'
+            '[[handler]]\nfile = "handlers/echo.py"'
+        )
+        with pytest.raises(ManifestError):
+            load_manifest(my_manifest)
+
+    def test_empty_manifest(self, my_manifest):
+        my_manifest.write_text("")
+        with pytest.raises(ManifestError):
+            load_manifest(my_manifest)
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from codehook.pipeline import Pipeline
+
+
+class TestPipeline:
+    def test_results(self):
+        pipeline = Pipeline()
+        pipeline.add_step("a", lambda: 1)
+        pipeline.add_step("b", lambda: 2)
+        pipeline.add_step("sum", lambda a, b: a + b, ["a", "b"])
+
+        result = pipeline.run()
+        assert result == {"a": 1, "b": 2, "sum": 3}
+
+    def test_independent_steps_overlap(self):
+        barrier = threading.Barrier(2, timeout=5)
+        pipeline = Pipeline()
+        # Both steps must be running at the same time for the barrier to pass
+        pipeline.add_step("a", barrier.wait)
+        pipeline.add_step("b", barrier.wait)
+
+        pipeline.run()
+
+    def test_dependencies_run_first(self):
+        order = []
+        pipeline = Pipeline()
+        pipeline.add_step("slow", lambda: time.sleep(0.05) or order.append("slow"))
+        pipeline.add_step("after", lambda _: order.append("after"), ["slow"])
+
+        pipeline.run()
+        assert order == ["slow", "after"]
+
+    def test_unknown_requirement(self):
+        pipeline = Pipeline()
+        with pytest.raises(ValueError):
+            pipeline.add_step("a", lambda: 1, ["missing"])
+
+    def test_duplicate_step(self):
+        pipeline = Pipeline()
+        pipeline.add_step("a", lambda: 1)
+        with pytest.raises(ValueError):
+            pipeline.add_step("a", lambda: 1)
+
+    def test_failure_stops_pipeline(self):
+        ran = []
+
+        def fail():
+            raise RuntimeError("step failed")
+
+        pipeline = Pipeline()
+        pipeline.add_step("fail", fail)
+        pipeline.add_step("after", lambda _: ran.append("after"), ["fail"])
+
+        with pytest.raises(RuntimeError):
+            pipeline.run()
+        assert ran == []
+
+    def test_timings(self):
+        steps = []
+        pipeline = Pipeline()
+        pipeline.add_step("a", lambda: time.sleep(0.01))
+        pipeline.run(on_step=steps.append)
+
+        assert steps == [pipeline.steps["a"]]
+        assert pipeline.steps["a"].duration >= 0.01
+        assert pipeline.finished - pipeline.started >= 0.01
+
+    def test_critical_path(self):
+        pipeline = Pipeline()
+        pipeline.add_step("fast", lambda: None)
+        pipeline.add_step("slow", lambda: time.sleep(0.05))
+        pipeline.add_step("end", lambda fast, slow: None, ["fast", "slow"])
+        pipeline.run()
+
+        path = [step.name for step in pipeline.critical_path()]
+        assert path == ["slow", "end"]
@@ -0,0 +1,74 @@
+import json
+import logging
+
+import pytest
+
+from codehook.skeletons.common.request_log import REDACTED, RequestLogger
+
+REQUEST = {
+    "headers": {"Stripe-Signature": "t=1,v1=abc", "Content-Type": "application/json"},
+    "body": json.dumps({"id": "evt_123", "data": {"object": {"id": "ch_123"}}}),
+}
+
+
+@pytest.fixture
+def my_logger():
+    logger = logging.getLogger("codehook.tests.request_log")
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+class TestRequestLogger:
+    def test_redacts_fields_at_any_depth(self, my_logger):
+        request_log = RequestLogger(my_logger, redact="stripe-signature, token")
+        value = {"a": [{"Token": "secret"}], **REQUEST}
+
+        redacted = request_log.redacted(value)
+        assert redacted["headers"]["Stripe-Signature"] == REDACTED
+        assert redacted["headers"]["Content-Type"] == "application/json"
+        assert redacted["a"] == [{"Token": REDACTED}]
+        assert REQUEST["headers"]["Stripe-Signature"] == "t=1,v1=abc"
+
+    def test_truncates_long_values(self, my_logger):
+        request_log = RequestLogger(my_logger, max_length=20)
+        text = request_log.format({"body": "x" * 100})
+
+        assert text.startswith('{"body": "xxxxxxxxxx')
+        assert text.endswith("... (92 more characters)")
+        assert len(RequestLogger(my_logger, max_length=0).format("x" * 5000)) == 5002
+
+    def test_sampling(self, my_logger):
+        assert RequestLogger(my_logger, sample_rate=1).sample()
+        assert not any(
+            RequestLogger(my_logger, sample_rate=0).sample() for _ in range(100)
+        )
+        sampled = [
+            RequestLogger(my_logger, sample_rate=0.5).sample() for _ in range(1000)
+        ]
+        assert 350 < sum(sampled) < 650
+
+    def test_nothing_is_logged_above_info(self, my_logger):
+        my_logger.setLevel(logging.WARNING)
+        assert not RequestLogger(my_logger).sample()
+
+    def test_log(self, my_logger, caplog):
+        request_log = RequestLogger(my_logger)
+        with caplog.at_level(logging.INFO, logger=my_logger.name):
+            request_log.log("Request", REQUEST, sampled=True)
+            request_log.log("Response", REQUEST, sampled=False)
+
+        (record,) = caplog.records
+        assert record.getMessage().startswith("Request: {")
+        assert "t=1,v1=abc" not in record.getMessage()
+
+    def test_from_env(self, my_logger, monkeypatch):
+        monkeypatch.setenv("LOG_LEVEL", "warning")
+        monkeypatch.setenv("LOG_SAMPLE_RATE", "0.1")
+        monkeypatch.setenv("LOG_MAX_LENGTH", "100")
+        monkeypatch.setenv("LOG_REDACT", "email")
+        request_log = RequestLogger.from_env(my_logger)
+
+        assert my_logger.level == logging.WARNING
+        assert request_log.sample_rate == 0.1
+        assert request_log.max_length == 100
+        assert request_log.redact == {"email"}
@@ -0,0 +1,353 @@
+import base64
+import importlib
+import json
+import sys
+import time
+import types
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from codehook.skeletons.stripe_lean.stripe_signature import compute_signature
+
+SECRET = "whsec_test_secret"
+MODULES = [
+    "handler",
+    "lambda_handler_rest",
+    "request_log",
+    "stripe_signature",
+    "work_queue",
+    "idempotency",
+    "dispatch",
+]
+
+
+def sign(payload: str, secret=SECRET):
+    timestamp = int(time.time())
+    return f"t={timestamp},v1={compute_signature(timestamp, payload.encode(), secret)}"
+
+
+@pytest.fixture
+def my_payload():
+    with open("./codehook/skeletons/stripe/example_payload.json") as payload:
+        return payload.read()
+
+
+@pytest.fixture(params=["stripe", "stripe_lean"])
+def my_skeleton(request, monkeypatch):
+    """
+    Imports the lambda_handler_rest module of a skeleton, with a handler that
+    records the events it gets
+    """
+    monkeypatch.setenv("ENDPOINT_SECRET", SECRET)
+    monkeypatch.syspath_prepend("./codehook/skeletons/common")
+    monkeypatch.syspath_prepend(f"./codehook/skeletons/{request.param}")
+    handler = types.ModuleType("handler")
+    handler.events = []
+    handler.handler_logic = lambda body: handler.events.append(body) or (200, "ok")
+    for module in MODULES:
+        monkeypatch.delitem(sys.modules, module, raising=False)
+    monkeypatch.setitem(sys.modules, "handler", handler)
+    yield importlib.import_module("lambda_handler_rest")
+    for module in MODULES:
+        sys.modules.pop(module, None)
+
+
+class TestSkeleton:
+    def test_signed_request(self, my_skeleton, my_payload):
+        response = my_skeleton.lambda_handler(
+            {"headers": {"Stripe-Signature": sign(my_payload)}, "body": my_payload},
+            None,
+        )
+        assert response["statusCode"] == 200
+        (event,) = my_skeleton.handler.events
+        assert event["id"] == json.loads(my_payload)["id"]
+        assert event["data"]["object"]["object"] == "subscription"
+
+    def test_base64_request(self, my_skeleton, my_payload):
+        response = my_skeleton.lambda_handler(
+            {
+                "headers": {"stripe-signature": sign(my_payload)},
+                "body": base64.b64encode(my_payload.encode()).decode(),
+                "isBase64Encoded": True,
+            },
+            None,
+        )
+        assert response["statusCode"] == 200
+
+    def test_forged_request_is_not_parsed(self, my_skeleton, my_payload, monkeypatch):
+        def loads(payload):
+            raise AssertionError("The payload was parsed")
+
+        monkeypatch.setattr(my_skeleton, "loads", loads)
+        response = my_skeleton.lambda_handler(
+            {
+                "headers": {"Stripe-Signature": sign(my_payload, "whsec_other")},
+                "body": my_payload,
+            },
+            None,
+        )
+        assert response["statusCode"] == 400
+        assert my_skeleton.handler.events == []
+
+    def test_signed_invalid_json(self, my_skeleton):
+        response = my_skeleton.lambda_handler(
+            {"headers": {"Stripe-Signature": sign("{")}, "body": "{"}, None
+        )
+        assert response["statusCode"] == 400
+
+    def test_payload_is_parsed_once(self, my_skeleton, my_payload, monkeypatch):
+        calls = []
+        loads = my_skeleton.loads
+        monkeypatch.setattr(
+            my_skeleton,
+            "loads",
+            lambda payload: calls.append(payload) or loads(payload),
+        )
+        my_skeleton.lambda_handler(
+            {"headers": {"Stripe-Signature": sign(my_payload)}, "body": my_payload},
+            None,
+        )
+        assert len(calls) == 1
+
+
+class TestIdempotency:
+    def test_retried_delivery_is_not_handled(self, my_skeleton, my_payload):
+        request = {
+            "headers": {"Stripe-Signature": sign(my_payload)},
+            "body": my_payload,
+        }
+        first = my_skeleton.lambda_handler(request, None)
+        retried = my_skeleton.lambda_handler(request, None)
+
+        assert retried == first
+        assert len(my_skeleton.handler.events) == 1
+
+    def test_failed_delivery_is_handled_again(
+        self, my_skeleton, my_payload, monkeypatch
+    ):
+        responses = iter([(500, "Database down"), (200, "ok")])
+        monkeypatch.setattr(
+            my_skeleton.handler, "handler_logic", lambda body: next(responses)
+        )
+        request = {
+            "headers": {"Stripe-Signature": sign(my_payload)},
+            "body": my_payload,
+        }
+
+        assert my_skeleton.lambda_handler(request, None)["statusCode"] == 500
+        assert my_skeleton.lambda_handler(request, None)["statusCode"] == 200
+
+
+class TestDispatch:
+    def test_registered_handler(self, my_skeleton, my_payload):
+        events = []
+        my_skeleton.dispatch.on("customer.subscription.*")(
+            lambda body: events.append(body) or (200, "Subscription")
+        )
+        response = my_skeleton.lambda_handler(
+            {"headers": {"Stripe-Signature": sign(my_payload)}, "body": my_payload},
+            None,
+        )
+
+        assert json.loads(response["body"])["body"] == "Subscription"
+        assert len(events) == 1
+        assert my_skeleton.handler.events == []
+
+    def test_unhandled_type_is_not_decoded(self, my_skeleton, my_payload, monkeypatch):
+        def loads(payload):
+            raise AssertionError("The payload was parsed")
+
+        monkeypatch.setattr(my_skeleton, "loads", loads)
+        my_skeleton.dispatch.on("invoice.paid")(lambda body: (500, "Not called"))
+        response = my_skeleton.lambda_handler(
+            {"headers": {"Stripe-Signature": sign(my_payload)}, "body": my_payload},
+            None,
+        )
+
+        assert response["statusCode"] == 200
+        assert json.loads(response["body"])["body"] == "Ignored"
+
+
+class TestLeanSkeleton:
+    def test_does_not_import_stripe(self, monkeypatch):
+        monkeypatch.syspath_prepend("./codehook/skeletons/common")
+        monkeypatch.syspath_prepend("./codehook/skeletons/stripe_lean")
+        for module in MODULES:
+            monkeypatch.delitem(sys.modules, module, raising=False)
+        module = importlib.import_module("lambda_handler_rest")
+
+        assert "stripe" not in vars(module)
+        response = module.lambda_handler({"headers": {}, "body": "{}"}, None)
+        assert json.loads(response["body"])["body"] == "Handler logic skeleton"
+        for name in MODULES:
+            sys.modules.pop(name, None)
+
+
+class TestFullSkeleton:
+    @pytest.mark.parametrize("my_skeleton", ["stripe"], indirect=True)
+    def test_verified_event_is_stripe_object(self, my_skeleton, my_payload):
+        my_skeleton.lambda_handler(
+            {"headers": {"stripe-signature": sign(my_payload)}, "body": my_payload},
+            None,
+        )
+        (event,) = my_skeleton.handler.events
+        assert event.type == "customer.subscription.updated"
+        assert event.data.object.id == "sub_1Mqqb6Lt4dXK03v50OA219Ya"
+
+
+@pytest.fixture
+def my_queue(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        queue_url = boto3.client("sqs").create_queue(QueueName="codehook-test")[
+            "QueueUrl"
+        ]
+        monkeypatch.setenv("QUEUE_URL", queue_url)
+        yield queue_url
+
+
+@pytest.fixture
+def my_queued_skeleton(my_queue, my_skeleton):
+    """
+    A skeleton deployed with --async, which enqueues the events it verifies
+    """
+    return my_skeleton
+
+
+def records(*payloads):
+    return [
+        {"messageId": str(index), "body": payload}
+        for index, payload in enumerate(payloads)
+    ]
+
+
+def receive(queue_url):
+    messages = boto3.client("sqs").receive_message(
+        QueueUrl=queue_url, MaxNumberOfMessages=10
+    )
+    return [message["Body"] for message in messages.get("Messages", [])]
+
+
+class TestQueuedSkeleton:
+    def test_signed_request_is_queued(self, my_queued_skeleton, my_queue, my_payload):
+        response = my_queued_skeleton.lambda_handler(
+            {"headers": {"Stripe-Signature": sign(my_payload)}, "body": my_payload},
+            None,
+        )
+
+        assert response["statusCode"] == 200
+        assert json.loads(response["body"])["body"] == "Queued"
+        assert my_queued_skeleton.handler.events == []
+        assert receive(my_queue) == [my_payload]
+
+    def test_forged_request_is_not_queued(
+        self, my_queued_skeleton, my_queue, my_payload
+    ):
+        response = my_queued_skeleton.lambda_handler(
+            {
+                "headers": {"Stripe-Signature": sign(my_payload, "whsec_other")},
+                "body": my_payload,
+            },
+            None,
+        )
+
+        assert response["statusCode"] == 400
+        assert receive(my_queue) == []
+
+    def test_large_request_is_handled_inline(self, my_queued_skeleton, my_queue):
+        payload = json.dumps({"id": "evt_large", "padding": "x" * 300_000})
+        response = my_queued_skeleton.lambda_handler(
+            {"headers": {"Stripe-Signature": sign(payload)}, "body": payload}, None
+        )
+
+        assert response["statusCode"] == 200
+        assert len(my_queued_skeleton.handler.events) == 1
+        assert receive(my_queue) == []
+
+    def test_worker_handles_batch(self, my_queued_skeleton, my_payload):
+        response = my_queued_skeleton.worker_handler(
+            {"Records": records(my_payload, my_payload)}, None
+        )
+
+        assert response == {"batchItemFailures": []}
+        assert len(my_queued_skeleton.handler.events) == 2
+        assert (
+            my_queued_skeleton.handler.events[0]["id"] == json.loads(my_payload)["id"]
+        )
+
+    def test_worker_reports_failed_events(self, my_queued_skeleton, monkeypatch):
+        def handler_logic(body):
+            if body["id"] == "evt_error":
+                raise ValueError("Unexpected event")
+            return (500, "Retry") if body["id"] == "evt_retry" else (200, "ok")
+
+        monkeypatch.setattr(my_queued_skeleton.handler, "handler_logic", handler_logic)
+        response = my_queued_skeleton.worker_handler(
+            {
+                "Records": records(
+                    '{"id": "evt_ok"}', '{"id": "evt_retry"}', '{"id": "evt_error"}'
+                )
+            },
+            None,
+        )
+
+        assert response == {
+            "batchItemFailures": [{"itemIdentifier": "1"}, {"itemIdentifier": "2"}]
+        }
+
+    def test_worker_prefers_batch_handler(self, my_queued_skeleton, monkeypatch):
+        batches = []
+
+        def handler_logic_batch(events):
+            batches.append(events)
+            return [
+                (500 if event["id"] == "evt_retry" else 200, "") for event in events
+            ]
+
+        monkeypatch.setattr(
+            my_queued_skeleton.handler,
+            "handler_logic_batch",
+            handler_logic_batch,
+            raising=False,
+        )
+        response = my_queued_skeleton.worker_handler(
+            {"Records": records('{"id": "evt_ok"}', '{"id": "evt_retry"}')}, None
+        )
+
+        assert response == {"batchItemFailures": [{"itemIdentifier": "1"}]}
+        assert [[event["id"] for event in batch] for batch in batches] == [
+            ["evt_ok", "evt_retry"]
+        ]
+        assert my_queued_skeleton.handler.events == []
+
+    @pytest.mark.parametrize(
+        "handler_logic_batch",
+        [lambda events: 1 / 0, lambda events: [(200, "ok")]],
+        ids=["error", "missing results"],
+    )
+    def test_worker_fails_whole_batch(
+        self, my_queued_skeleton, monkeypatch, handler_logic_batch
+    ):
+        monkeypatch.setattr(
+            my_queued_skeleton.handler,
+            "handler_logic_batch",
+            handler_logic_batch,
+            raising=False,
+        )
+        response = my_queued_skeleton.worker_handler(
+            {"Records": records('{"id": "evt_1"}', '{"id": "evt_2"}')}, None
+        )
+
+        assert len(response["batchItemFailures"]) == 2
+
+    def test_worker_skips_handled_events(self, my_queued_skeleton):
+        batch = {"Records": records('{"id": "evt_1"}', '{"id": "evt_2"}')}
+        my_queued_skeleton.worker_handler(batch, None)
+        response = my_queued_skeleton.worker_handler(batch, None)
+
+        assert response == {"batchItemFailures": []}
+        assert len(my_queued_skeleton.handler.events) == 2
@@ -0,0 +1,88 @@
+import io
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from codehook.slim import SlimPolicy, cache_name, python_version
+
+RUNTIME = f"python{python_version()}"
+
+
+@pytest.fixture
+def my_entries():
+    return {
+        "handler.py": b"VALUE = 'compiled'\n",
+        "stripe/__init__.py": b"",
+        "stripe/py.typed": b"",
+        "stripe/_client.pyi": b"class Client: ...\n",
+        "stripe/tests/test_client.py": b"def test(): pass\n",
+        "stripe-7.6.0.dist-info/METADATA": b"Name: stripe\n",
+        "stripe-7.6.0.dist-info/RECORD": b"stripe/__init__.py,,\n",
+        "tests/__init__.py": b"",
+        "README.md": b"# Stripe\n",
+        "broken.py": b"def broken(:\n",
+    }
+
+
+class TestSlimPolicy:
+    def test_default_policy(self, my_entries):
+        slimmed = SlimPolicy(precompile=False).apply(my_entries, RUNTIME)
+        assert sorted(slimmed) == [
+            "broken.py",
+            "handler.py",
+            "stripe-7.6.0.dist-info/METADATA",
+            "stripe/__init__.py",
+        ]
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.setenv("CODEHOOK_SLIM_EXCLUDE", "*.txt, data/*")
+        monkeypatch.setenv("CODEHOOK_SLIM_KEEP", "README.md")
+        monkeypatch.setenv("CODEHOOK_PRECOMPILE", "0")
+        policy = SlimPolicy.from_env()
+
+        assert policy.excludes("data/words.txt")
+        assert not policy.excludes("README.md")
+        assert policy.excludes("docs/index.md")
+        assert not policy.precompile
+        assert policy.fingerprint() != SlimPolicy().fingerprint()
+
+        monkeypatch.setenv("CODEHOOK_SLIM", "0")
+        assert SlimPolicy.from_env() is None
+
+    def test_precompile(self, my_entries):
+        slimmed = SlimPolicy().apply(my_entries, RUNTIME)
+
+        assert cache_name("handler.py") in slimmed
+        assert cache_name("stripe/__init__.py") == (
+            f"stripe/__pycache__/__init__.{sys.implementation.cache_tag}.pyc"
+        )
+        assert cache_name("stripe/__init__.py") in slimmed
+        # Modules that don't compile are left to fail on import
+        assert cache_name("broken.py") not in slimmed
+        assert "broken.py" in slimmed
+
+    def test_no_bytecode_for_other_versions(self, my_entries, capsys):
+        slimmed = SlimPolicy().apply(my_entries, "python2.7")
+        assert not any(name.endswith(".pyc") for name in slimmed)
+        assert "the python2.7 runtime runs a different version" in " ".join(
+            capsys.readouterr().out.split()
+        )
+
+    def test_bytecode_is_used(self, my_entries, tmp_path):
+        slimmed = SlimPolicy().apply({"handler.py": my_entries["handler.py"]}, RUNTIME)
+        with zipfile.ZipFile(io.BytesIO(), "w") as zipped:
+            for name, content in slimmed.items():
+                zipped.writestr(name, content)
+            zipped.extractall(tmp_path)
+        # The bytecode isn't checked against the source, so it wins over a new one
+        (tmp_path / "handler.py").write_text("VALUE = 'source'\n")
+
+        result = subprocess.run(
+            [sys.executable, "-B", "-c", "import handler; print(handler.VALUE)"],
+            cwd=tmp_path,
+            capture_output=True,
+            text=True,
+        )
+        assert result.stdout.strip() == "compiled"
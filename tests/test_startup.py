@@ -0,0 +1,64 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+# SDKs that must not be imported until a command needs them
+HEAVY_MODULES = ["boto3", "botocore", "openai", "stripe", "rich.progress"]
+
+# Generous, so the test only catches regressions like importing an SDK eagerly
+STARTUP_BUDGET = 1.0
+
+
+def run_python(code):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout, result.stderr
+
+
+def import_time(stderr, module):
+    """
+    Parses the cumulative import time of MODULE, in seconds, from -X importtime output.
+    """
+    for line in stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+    raise AssertionError(f"{module} was not imported")
+
+
+def loaded_modules(command):
+    code = (
+        "import sys\n"
+        "from typer.testing import CliRunner\n"
+        "from codehook.main import app\n"
+        f"CliRunner().invoke(app, {command!r})\n"
+        f"print(__import__('json').dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    stdout, _ = run_python(code)
+    return json.loads(stdout.splitlines()[-1])
+
+
+class TestStartup:
+    def test_import_time(self):
+        _, stderr = run_python("import codehook.main")
+        assert import_time(stderr, "codehook.main") < STARTUP_BUDGET
+
+    def test_no_heavy_imports(self):
+        stdout, _ = run_python(
+            "import sys, json\n"
+            "import codehook.main\n"
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+        )
+        assert json.loads(stdout) == []
+
+    @pytest.mark.parametrize(
+        "command", [["--help"], ["reconfigure"], ["deploy", "--help"], ["cache"]]
+    )
+    def test_offline_commands(self, command):
+        assert loaded_modules(command) == []
@@ -0,0 +1,184 @@
+import sqlite3
+import threading
+from contextlib import closing
+
+import pytest
+
+from codehook.state import StateStore
+
+
+@pytest.fixture
+def my_state(tmp_path):
+    return StateStore(tmp_path / "state.db")
+
+
+@pytest.fixture
+def my_deployment(my_state):
+    my_state.record(
+        "invoices",
+        source="stripe",
+        function_arn="arn:aws:lambda:us-east-1:123456789012:function:invoices",
+        api_id="abc123",
+        api_url="https://abc123.execute-api.us-east-1.amazonaws.com/prod/codehook",
+        webhook_id="we_123",
+        code_hash="hash",
+    )
+    return my_state.get("invoices")
+
+
+class TestStateStore:
+    def test_record_and_get(self, my_state, my_deployment):
+        assert my_deployment["source"] == "stripe"
+        assert my_deployment["api_id"] == "abc123"
+        assert my_deployment["created_at"] <= my_deployment["updated_at"]
+        assert my_state.get("missing") is None
+
+    def test_record_keeps_other_fields(self, my_state, my_deployment):
+        my_state.record("invoices", code_hash="new hash")
+        deployment = my_state.get("invoices")
+
+        assert deployment["code_hash"] == "new hash"
+        assert deployment["webhook_id"] == "we_123"
+        assert deployment["created_at"] == my_deployment["created_at"]
+
+    def test_record_unknown_field(self, my_state):
+        with pytest.raises(ValueError):
+            my_state.record("invoices", region="us-east-1")
+
+    def test_find(self, my_state, my_deployment):
+        assert my_state.find("webhook_id", "we_123")["name"] == "invoices"
+        assert my_state.find("api_id", "missing") is None
+
+    def test_all_is_ordered_by_name(self, my_state):
+        for name in ["refunds", "charges", "invoices"]:
+            my_state.record(name, function_arn=name)
+        assert [item["name"] for item in my_state.all()] == [
+            "charges",
+            "invoices",
+            "refunds",
+        ]
+
+    def test_persists_between_instances(self, my_state, my_deployment):
+        assert StateStore(my_state.path).get("invoices") == my_deployment
+
+    def test_record_from_threads(self, my_state):
+        threads = [
+            threading.Thread(target=my_state.record, args=(f"handler_{i}",))
+            for i in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(my_state.all()) == 20
+
+
+class TestForget:
+    def test_forget_api_clears_url(self, my_state, my_deployment):
+        my_state.forget("api_id", "abc123")
+        deployment = my_state.get("invoices")
+
+        assert deployment["api_id"] is None
+        assert deployment["api_url"] is None
+        assert deployment["webhook_id"] == "we_123"
+
+    def test_forget_function_by_name(self, my_state, my_deployment):
+        my_state.forget("function_arn", "invoices")
+        assert my_state.get("invoices")["function_arn"] is None
+
+    def test_forget_every_resource_removes_deployment(self, my_state, my_deployment):
+        my_state.forget("function_arn", my_deployment["function_arn"])
+        my_state.forget("api_id", "abc123")
+        my_state.forget("webhook_id", "we_123")
+        assert my_state.get("invoices") is None
+
+    def test_forget_from_threads(self, my_state, my_deployment):
+        resources = [
+            ("function_arn", my_deployment["function_arn"]),
+            ("api_id", "abc123"),
+            ("webhook_id", "we_123"),
+        ]
+        threads = [
+            threading.Thread(target=my_state.forget, args=resource)
+            for resource in resources
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert my_state.get("invoices") is None
+
+    def test_forget_unknown_resource(self, my_state, my_deployment):
+        my_state.forget("webhook_id", "we_missing")
+        assert my_state.get("invoices") == my_deployment
+
+
+class TestReconcile:
+    def test_nothing_changed(self, my_state, my_deployment):
+        assert my_state.reconcile(["invoices"], ["abc123"], ["we_123"]) == 0
+        assert my_state.get("invoices") == my_deployment
+
+    def test_gone_resources_are_cleared(self, my_state, my_deployment):
+        assert my_state.reconcile(["invoices"], [], ["we_123"]) == 1
+        assert my_state.get("invoices")["api_id"] is None
+
+    def test_gone_deployment_is_removed(self, my_state, my_deployment):
+        assert my_state.reconcile([], [], []) == 3
+        assert my_state.all() == []
+
+    def test_unknown_functions_are_added(self, my_state, my_deployment):
+        assert my_state.reconcile(["invoices", "refunds"], ["abc123"], ["we_123"]) == 1
+        assert my_state.get("refunds")["function_arn"] == "refunds"
+
+
+@pytest.fixture
+def my_asynchronous_deployment(my_state, my_deployment):
+    my_state.record(
+        "invoices",
+        queue_url="https://sqs.us-east-1.amazonaws.com/123456789012/codehook-invoices",
+        worker_arn="arn:aws:lambda:us-east-1:123456789012:function:invoices-worker",
+    )
+    return my_state.get("invoices")
+
+
+class TestQueue:
+    def test_migrates_old_state(self, tmp_path):
+        path = tmp_path / "state.db"
+        with closing(sqlite3.connect(path)) as connection, connection:
+            connection.execute(
+                "CREATE TABLE deployments (name TEXT PRIMARY KEY, source TEXT, "
+                "function_arn TEXT, api_id TEXT, api_url TEXT, webhook_id TEXT, "
+                "code_hash TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+        my_state = StateStore(path)
+        my_state.record("invoices", queue_url="url", worker_arn="arn")
+
+        assert my_state.get("invoices")["queue_url"] == "url"
+
+    def test_forget_worker_by_name(self, my_state, my_asynchronous_deployment):
+        my_state.forget("function_arn", "invoices-worker")
+        deployment = my_state.get("invoices")
+
+        assert deployment["worker_arn"] is None
+        assert deployment["function_arn"] == my_asynchronous_deployment["function_arn"]
+
+    def test_queue_keeps_deployment(self, my_state, my_asynchronous_deployment):
+        for column in ["function_arn", "api_id", "webhook_id", "worker_arn"]:
+            my_state.forget(column, my_asynchronous_deployment[column])
+        assert my_state.get("invoices")["queue_url"] is not None
+
+        my_state.forget("queue_url", my_asynchronous_deployment["queue_url"])
+        assert my_state.get("invoices") is None
+
+    def test_reconcile_worker(self, my_state, my_asynchronous_deployment):
+        queue_urls = [my_asynchronous_deployment["queue_url"]]
+        assert (
+            my_state.reconcile(
+                ["invoices", "invoices-worker"], ["abc123"], ["we_123"], queue_urls
+            )
+            == 0
+        )
+        assert my_state.reconcile(["invoices"], ["abc123"], ["we_123"], []) == 2
+        deployment = my_state.get("invoices")
+        assert deployment["worker_arn"] is None
+        assert deployment["queue_url"] is None
@@ -0,0 +1,62 @@
+import json
+import time
+
+import pytest
+import stripe
+
+from codehook.skeletons.stripe_lean.stripe_signature import (
+    SignatureVerificationError,
+    compute_signature,
+    verify_header,
+)
+
+SECRET = "whsec_test_secret"
+PAYLOAD = json.dumps({"id": "evt_123", "type": "charge.succeeded"})
+
+
+def sign(payload=PAYLOAD, secret=SECRET, timestamp=None):
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = compute_signature(timestamp, payload.encode(), secret)
+    return f"t={timestamp},v1={signature}"
+
+
+class TestVerifyHeader:
+    def test_valid_signature(self):
+        verify_header(PAYLOAD, sign(), SECRET)
+        verify_header(PAYLOAD.encode(), sign(), SECRET)
+
+    def test_matches_stripe_sdk(self):
+        timestamp = int(time.time())
+        signature = stripe.WebhookSignature._compute_signature(
+            f"{timestamp}.{PAYLOAD}", SECRET
+        )
+        header = f"t={timestamp},v1={signature}"
+
+        verify_header(PAYLOAD, header, SECRET)
+        assert stripe.WebhookSignature.verify_header(PAYLOAD, sign(), SECRET, 300)
+
+    def test_any_signature_matches(self):
+        header = sign() + ",v1=" + "0" * 64 + ",v0=" + "1" * 64
+        verify_header(PAYLOAD, header, SECRET)
+
+    def test_wrong_secret(self):
+        with pytest.raises(SignatureVerificationError, match="No signatures found"):
+            verify_header(PAYLOAD, sign(secret="whsec_other"), SECRET)
+
+    def test_tampered_payload(self):
+        with pytest.raises(SignatureVerificationError):
+            verify_header(PAYLOAD.replace("123", "456"), sign(), SECRET)
+
+    def test_old_timestamp(self):
+        header = sign(timestamp=int(time.time()) - 600)
+        with pytest.raises(SignatureVerificationError, match="tolerance"):
+            verify_header(PAYLOAD, header, SECRET)
+        verify_header(PAYLOAD, header, SECRET, tolerance=900)
+        verify_header(PAYLOAD, header, SECRET, tolerance=None)
+
+    @pytest.mark.parametrize(
+        "header", [None, "", "v1=abc", "t=abc,v1=abc", "t=1492774577,v0=abc"]
+    )
+    def test_malformed_header(self, header):
+        with pytest.raises(SignatureVerificationError):
+            verify_header(PAYLOAD, header, SECRET)
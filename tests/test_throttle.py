@@ -0,0 +1,190 @@
+import threading
+import time
+
+import boto3
+import pytest
+import stripe
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+from codehook.sources.stripe import Stripe
+from codehook.throttle import Throttle, TokenBucket, is_throttling_error
+
+
+class TestThrottle:
+    def test_rate(self):
+        throttle = Throttle(rates={("stripe", "*"): (20, 1)})
+        started = time.monotonic()
+        for _ in range(5):
+            with throttle.call("stripe", "WebhookEndpoint.create"):
+                pass
+        # The first call is immediate, the next four are spaced by 50ms
+        assert time.monotonic() - started >= 0.2
+
+    def test_operation_rate(self):
+        throttle = Throttle(rates={("api-gateway", "DeleteRestApi"): (1000, 1)})
+        assert throttle._rate_key("api-gateway", "DeleteRestApi") == (
+            "api-gateway",
+            "DeleteRestApi",
+        )
+        assert throttle._rate_key("api-gateway", "GetRestApis") == ("api-gateway", "*")
+        assert throttle._rate_key("unknown", "Operation") is None
+
+    def test_concurrency(self):
+        throttle = Throttle(
+            concurrency={"lambda": 2}, rates={("lambda", "*"): (1000, 1)}
+        )
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def call():
+            with throttle.call("lambda", "CreateFunction"):
+                with lock:
+                    running.append(1)
+                    peak.append(len(running))
+                time.sleep(0.02)
+                with lock:
+                    running.pop()
+
+        threads = [threading.Thread(target=call) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(peak) == 2
+
+    def test_release_on_error(self):
+        throttle = Throttle(
+            concurrency={"stripe": 1}, rates={("stripe", "*"): (1000, 1)}
+        )
+        try:
+            with throttle.call("stripe", "WebhookEndpoint.delete"):
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        assert throttle._semaphore("stripe").acquire(blocking=False)
+
+    def test_registered_client(self, monkeypatch):
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+        monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+        monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+        throttle = Throttle(
+            concurrency={"api-gateway": 1}, rates={("api-gateway", "*"): (20, 1)}
+        )
+        with mock_aws():
+            client = throttle.register_client(boto3.client("apigateway"))
+            started = time.monotonic()
+            for _ in range(3):
+                client.get_rest_apis()
+
+        assert time.monotonic() - started >= 0.1
+        assert throttle._semaphore("api-gateway").acquire(blocking=False)
+
+
+class TestTokenBucket:
+    def test_burst(self):
+        bucket = TokenBucket(rate=1, burst=3)
+        assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+        assert bucket.reserve() > 0.9
+
+    def test_reservations_are_queued(self):
+        bucket = TokenBucket(rate=10, burst=1)
+        delays = [bucket.reserve() for _ in range(3)]
+        assert delays[0] == 0
+        assert 0.09 < delays[1] < delays[2] <= 0.2
+
+    def test_drain(self):
+        bucket = TokenBucket(rate=10, burst=5)
+        bucket.drain()
+        assert bucket.reserve() > 0.09
+
+
+class TestRetry:
+    def throttled(self):
+        return ClientError(
+            {"Error": {"Code": "TooManyRequestsException", "Message": "Slow down"}},
+            "DeleteRestApi",
+        )
+
+    def test_is_throttling_error(self):
+        assert is_throttling_error(self.throttled())
+        assert not is_throttling_error(
+            ClientError({"Error": {"Code": "NotFoundException"}}, "DeleteRestApi")
+        )
+        assert not is_throttling_error(RuntimeError())
+
+    def test_retry_until_success(self):
+        throttle = Throttle(base_delay=0.001)
+        calls = []
+
+        def delete():
+            calls.append(1)
+            if len(calls) < 3:
+                raise self.throttled()
+            return "deleted"
+
+        assert throttle.retry(delete, "api-gateway", "DeleteRestApi") == "deleted"
+        assert len(calls) == 3
+
+    def test_retry_gives_up(self):
+        throttle = Throttle(retries=2, base_delay=0.001)
+        calls = []
+
+        def delete():
+            calls.append(1)
+            raise self.throttled()
+
+        with pytest.raises(ClientError):
+            throttle.retry(delete, "stripe", "WebhookEndpoint.delete")
+        assert len(calls) == 3
+
+    def test_no_retry_on_other_errors(self):
+        throttle = Throttle(base_delay=0.001)
+        calls = []
+
+        def delete():
+            calls.append(1)
+            raise ValueError()
+
+        with pytest.raises(ValueError):
+            throttle.retry(delete, "stripe", "WebhookEndpoint.delete")
+        assert len(calls) == 1
+
+    def test_backoff_is_capped(self):
+        throttle = Throttle(base_delay=1, max_delay=5)
+        assert all(0 <= throttle.backoff(attempt) <= 5 for attempt in range(20))
+
+
+class TestStripeListing:
+    def test_pages_are_throttled(self, monkeypatch):
+        endpoints = [
+            {"id": f"we_{index}", "metadata": {"codehook": "true"} if index % 2 else {}}
+            for index in range(250)
+        ]
+        requests = []
+
+        def list_endpoints(limit, starting_after=None):
+            start = 0 if starting_after is None else int(starting_after[3:]) + 1
+            requests.append(starting_after)
+            data = endpoints[start : start + limit]
+            return stripe.util.convert_to_stripe_object(
+                {"data": data, "has_more": start + limit < len(endpoints)}
+            )
+
+        monkeypatch.setattr(stripe.WebhookEndpoint, "list", list_endpoints)
+        throttle = Throttle()
+        calls = []
+        acquire = throttle.acquire
+        monkeypatch.setattr(
+            throttle,
+            "acquire",
+            lambda service, operation: calls.append(operation)
+            or acquire(service, operation),
+        )
+
+        webhook_ids = Stripe("sk_test", throttle).list_webhooks()
+
+        assert webhook_ids == [f"we_{index}" for index in range(1, 250, 2)]
+        assert requests == [None, "we_99", "we_199"]
+        assert calls == ["WebhookEndpoint.list"] * 3
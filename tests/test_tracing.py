@@ -0,0 +1,140 @@
+import json
+import time
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+from codehook import tracing
+from codehook.pipeline import Pipeline
+from codehook.throttle import Throttle
+from codehook.tracing import Tracer
+
+
+@pytest.fixture
+def my_tracer():
+    tracer = Tracer()
+    with tracer.activate():
+        yield tracer
+
+
+def spans_by_name(tracer):
+    return {span.name: span for span in tracer.spans}
+
+
+class TestSpans:
+    def test_nothing_recorded_without_tracer(self):
+        assert not tracing.enabled()
+        with tracing.span("package", "build"):
+            tracing.add("retries", 1)
+
+    def test_nesting(self, my_tracer):
+        with tracing.span("deploy invoices", "deploy"):
+            with tracing.span("package", "build"):
+                pass
+        with tracing.span("after"):
+            pass
+        spans = spans_by_name(my_tracer)
+
+        assert spans["package"].parent is spans["deploy invoices"]
+        assert spans["deploy invoices"].parent is None
+        assert spans["after"].parent is None
+
+    def test_error_is_recorded(self, my_tracer):
+        with pytest.raises(RuntimeError):
+            with tracing.span("function", "step"):
+                raise RuntimeError()
+        assert my_tracer.spans[0].args == {"error": "RuntimeError"}
+        assert my_tracer.spans[0].finished is not None
+
+    def test_pipeline_steps_nest_across_threads(self, my_tracer):
+        pipeline = Pipeline()
+        pipeline.add_step("a", lambda: time.sleep(0.01))
+        pipeline.add_step("b", lambda: time.sleep(0.01))
+        with tracing.span("deploy invoices", "deploy"):
+            pipeline.run()
+        spans = spans_by_name(my_tracer)
+
+        assert spans["a"].parent is spans["b"].parent is spans["deploy invoices"]
+        assert spans["a"].category == "step"
+
+
+class TestTracer:
+    def test_chrome_trace(self, my_tracer, tmp_path):
+        with tracing.span("deploy invoices", "deploy", handler="invoices"):
+            time.sleep(0.01)
+        trace = json.loads(
+            my_tracer.write(tmp_path / "traces" / "deploy.json").read_text()
+        )
+
+        complete, thread = trace["traceEvents"]
+        assert complete["ph"] == "X"
+        assert complete["cat"] == "deploy"
+        assert complete["dur"] >= 10_000
+        assert complete["args"] == {"handler": "invoices"}
+        assert thread["ph"] == "M"
+        assert thread["tid"] == complete["tid"]
+
+    def test_summary_self_time(self, my_tracer):
+        for _ in range(2):
+            with tracing.span("function", "step"):
+                time.sleep(0.02)
+                with tracing.span("lambda.CreateFunction", "aws"):
+                    time.sleep(0.03)
+        function, create_function = my_tracer.summary()
+
+        assert function["name"] == "function"
+        assert function["calls"] == 2
+        assert function["total"] > function["self"] >= 0.04
+        assert function["self"] < create_function["total"]
+        assert create_function["self"] == pytest.approx(create_function["total"])
+
+
+class TestBoto:
+    def test_calls_are_traced(self, my_tracer, monkeypatch):
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+        monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+        monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+        throttle = Throttle(rates={("lambda", "*"): (20, 1)})
+        with mock_aws():
+            client = throttle.register_client(boto3.client("lambda"))
+            with tracing.span("function", "step"):
+                for _ in range(3):
+                    client.list_functions()
+                with pytest.raises(ClientError):
+                    client.get_function(FunctionName="missing")
+        calls = [span for span in my_tracer.spans if span.category == "aws"]
+
+        assert [call.name for call in calls] == ["lambda.ListFunctions"] * 3 + [
+            "lambda.GetFunction"
+        ]
+        assert all(call.parent.name == "function" for call in calls)
+        assert calls[0].args["retries"] == 0
+        assert calls[0].args["status"] == 200
+        assert calls[-1].args["error"] == "ResourceNotFoundException"
+        # The calls after the first waited for the rate of 20 per second
+        assert sum(call.args.get("throttle_wait", 0) for call in calls) > 0.05
+
+
+class TestThrottle:
+    def test_retries_and_wait_are_counted(self, my_tracer):
+        throttle = Throttle(base_delay=0.001, rates={("stripe", "*"): (20, 1)})
+        calls = []
+
+        def create():
+            with throttle.call("stripe", "WebhookEndpoint.create"):
+                calls.append(1)
+                if len(calls) < 3:
+                    raise ClientError(
+                        {"Error": {"Code": "TooManyRequestsException"}}, "Create"
+                    )
+
+        with tracing.span("webhook", "step"):
+            throttle.retry(create, "stripe", "WebhookEndpoint.create")
+        rows = {row["name"]: row for row in my_tracer.summary()}
+
+        assert rows["webhook"]["retries"] == 2
+        assert rows["stripe.WebhookEndpoint.create"]["calls"] == 3
+        # The rate is drained on throttling, so the retries wait for it
+        assert rows["stripe.WebhookEndpoint.create"]["throttle_wait"] > 0
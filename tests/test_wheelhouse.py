@@ -0,0 +1,143 @@
+import io
+import zipfile
+
+import pytest
+
+from codehook.aws import Lambda
+from codehook.wheelhouse import Wheelhouse, WheelhouseError, install_wheel
+
+
+def build_wheel(directory, name, tag="py3-none-any", requires=(), files=None):
+    """
+    Writes a minimal wheel of version 1.0 to DIRECTORY, with a module named after it
+    unless FILES are given.
+    """
+    dist_info = f"{name}-1.0.dist-info"
+    metadata = f"Metadata-Version: 2.1\nName: {name}\nVersion: 1.0\n"
+    metadata += "".join(f"Requires-Dist: {require}\n" for require in requires)
+    files = files or {f"{name}/__init__.py": f"NAME = {name!r}\n"}
+    wheel = directory / f"{name}-1.0-{tag}.whl"
+    with zipfile.ZipFile(wheel, "w") as zipped:
+        for path, content in files.items():
+            zipped.writestr(path, content)
+        zipped.writestr(f"{dist_info}/METADATA", metadata)
+        zipped.writestr(
+            f"{dist_info}/WHEEL",
+            f"Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: {tag}\n",
+        )
+        zipped.writestr(f"{dist_info}/RECORD", "")
+    return wheel
+
+
+@pytest.fixture
+def my_wheelhouse(tmp_path):
+    wheelhouse = Wheelhouse("python3.11", path=tmp_path / "wheelhouse", offline=True)
+    wheelhouse.path.mkdir(parents=True)
+    build_wheel(wheelhouse.path, "webhooks", requires=["speedups"])
+    build_wheel(wheelhouse.path, "speedups", tag="cp311-cp311-manylinux2014_x86_64")
+    return wheelhouse
+
+
+@pytest.fixture
+def my_requirements(tmp_path):
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("webhooks\n")
+    return requirements
+
+
+class TestWheelhouse:
+    def test_platform_options(self):
+        options = Wheelhouse("python3.12", "arm64").platform_options()
+
+        assert options[options.index("--python-version") + 1] == "3.12"
+        assert options[options.index("--abi") + 1] == "cp312"
+        assert "manylinux2014_aarch64" in options
+        assert "--only-binary=:all:" in options
+
+    def test_unknown_architecture(self):
+        with pytest.raises(ValueError):
+            Wheelhouse("python3.11", "mips")
+
+    def test_resolve_offline(self, my_wheelhouse, my_requirements):
+        wheels = my_wheelhouse.resolve(my_requirements)
+        assert sorted(wheel.name for wheel in wheels) == [
+            "speedups-1.0-cp311-cp311-manylinux2014_x86_64.whl",
+            "webhooks-1.0-py3-none-any.whl",
+        ]
+
+    def test_wheels_of_other_platforms_are_ignored(self, tmp_path, my_requirements):
+        wheelhouse = Wheelhouse(
+            "python3.11", "arm64", path=tmp_path / "wheelhouse", offline=True
+        )
+        wheelhouse.path.mkdir(parents=True)
+        build_wheel(wheelhouse.path, "webhooks", requires=["speedups"])
+        # Built for this machine rather than for Lambda on arm64
+        build_wheel(wheelhouse.path, "speedups", tag="cp311-cp311-manylinux2014_x86_64")
+
+        with pytest.raises(WheelhouseError, match="speedups"):
+            wheelhouse.wheels(my_requirements)
+
+    def test_install(self, my_wheelhouse, my_requirements, tmp_path):
+        target = tmp_path / "target"
+        my_wheelhouse.install(my_requirements, target)
+
+        assert (
+            target / "webhooks" / "__init__.py"
+        ).read_text() == "NAME = 'webhooks'\n"
+        assert (target / "speedups" / "__init__.py").exists()
+        assert (target / "webhooks-1.0.dist-info" / "METADATA").exists()
+
+    def test_no_requirements(self, my_wheelhouse, tmp_path):
+        requirements = tmp_path / "empty.txt"
+        requirements.write_text("# Nothing to install\n")
+        assert my_wheelhouse.install(requirements, tmp_path / "target") == []
+
+
+class TestInstallWheel:
+    def test_data_directories(self, tmp_path):
+        wheel = build_wheel(
+            tmp_path,
+            "native",
+            files={
+                "native-1.0.data/platlib/native.so": "binary",
+                "native-1.0.data/purelib/native_helpers.py": "",
+                "native-1.0.data/scripts/native-cli": "#!python",
+                "native-1.0.data/headers/native.h": "",
+            },
+        )
+        install_wheel(wheel, tmp_path / "target")
+
+        assert sorted(path.name for path in (tmp_path / "target").iterdir()) == [
+            "native-1.0.dist-info",
+            "native.so",
+            "native_helpers.py",
+        ]
+
+    def test_unsafe_path(self, tmp_path):
+        wheel = build_wheel(tmp_path, "evil", files={"../evil.py": ""})
+        with pytest.raises(WheelhouseError):
+            install_wheel(wheel, tmp_path / "target")
+        assert not (tmp_path / "evil.py").exists()
+
+
+class TestDeploymentPackage:
+    def test_dependencies_are_bundled(self, my_wheelhouse, tmp_path, monkeypatch):
+        monkeypatch.setenv("CODEHOOK_WHEELHOUSE", str(my_wheelhouse.path.parent))
+        monkeypatch.setenv("CODEHOOK_OFFLINE", "1")
+        source = tmp_path / "source"
+        source.mkdir()
+        (source / "handler.py").write_text("import webhooks")
+        (source / "requirements.txt").write_text("webhooks\n")
+
+        package = Lambda.create_deployment_package(source)
+        with zipfile.ZipFile(io.BytesIO(package)) as zipped:
+            names = zipped.namelist()
+
+        assert "handler.py" in names
+        assert "webhooks/__init__.py" in names
+        assert "speedups/__init__.py" in names
+        # The source directory is left as it was
+        assert sorted(path.name for path in source.iterdir()) == [
+            "handler.py",
+            "requirements.txt",
+        ]